@@ -0,0 +1,67 @@
+from typing import Optional
+import hmac
+import logging
+import os
+
+from fastapi import APIRouter, Depends, Header, HTTPException
+from fastapi.responses import PlainTextResponse
+
+from .diagnostics import blocking_detector
+from .profiler import PROFILER_MAX_HZ, PROFILER_MAX_SECONDS, profiler
+
+logger = logging.getLogger(__name__)
+
+# Shared secret for the /admin endpoints; they are disabled when it is not set
+ADMIN_TOKEN = os.getenv("ADMIN_TOKEN")
+
+
+def require_admin(x_admin_token: Optional[str] = Header(None)):
+    """Allow the request only with the configured `X-Admin-Token` header."""
+    if not ADMIN_TOKEN:
+        raise HTTPException(status_code=404, detail="Not Found")
+    if not x_admin_token or not hmac.compare_digest(x_admin_token, ADMIN_TOKEN):
+        raise HTTPException(status_code=403, detail="Invalid admin token")
+
+
+router = APIRouter(prefix="/admin", dependencies=[Depends(require_admin)])
+
+
+@router.get("/diagnostics/blocking")
+async def get_blocking_report(limit: int = 10):
+    """Top sites that blocked this worker's event loop, by total blocked time."""
+    return {"status": "success", **blocking_detector.report(max(1, min(limit, 100)))}
+
+
+@router.post("/diagnostics/blocking/reset")
+async def reset_blocking_report():
+    """Forget the blocking sites recorded so far, e.g. before reproducing a stall."""
+    blocking_detector.reset()
+    return {"status": "success"}
+
+
+@router.get("/diagnostics/profile")
+async def get_profile(seconds: float = 10, hz: float = 100, idle: bool = False, format: str = "collapsed"):
+    """Sample every thread of this worker for `seconds` and return collapsed stacks.
+
+    The text output feeds straight into flamegraph.pl or speedscope; `format=json` also
+    returns the number of samples per pipeline stage. Waiting threads are left out
+    unless `idle=true`.
+    """
+    if not 0 < seconds <= PROFILER_MAX_SECONDS:
+        raise HTTPException(status_code=400, detail=f"seconds must be between 0 and {PROFILER_MAX_SECONDS:g}")
+    if not 0 < hz <= PROFILER_MAX_HZ:
+        raise HTTPException(status_code=400, detail=f"hz must be between 0 and {PROFILER_MAX_HZ:g}")
+    if format not in ("collapsed", "json"):
+        raise HTTPException(status_code=400, detail="format must be 'collapsed' or 'json'")
+    try:
+        result = await profiler.profile(seconds, hz, include_idle=idle)
+    except RuntimeError as e:
+        raise HTTPException(status_code=409, detail=str(e))
+    logger.info(f"Profiled for {result['seconds']} s: {result['samples']} samples, stages {result['stages']}")
+    if format == "json":
+        return {"status": "success", **result}
+    return PlainTextResponse(result["collapsed"])
+
+
+def get_admin_router():
+    return router
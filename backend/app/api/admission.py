@@ -0,0 +1,254 @@
+from typing import Awaitable, Callable, Dict, List, Optional
+from contextlib import asynccontextmanager
+import asyncio
+import heapq
+import itertools
+import logging
+import os
+import time
+
+from .tracing import span
+
+logger = logging.getLogger(__name__)
+
+# Latency objective for new turns: shed them when the expected queue wait exceeds it
+ADMISSION_SLO_SECONDS = float(os.getenv("ADMISSION_SLO_SECONDS", "5"))
+
+# Concurrent jobs allowed per pipeline stage across all clients
+STAGE_CONCURRENCY = {
+    "stt": int(os.getenv("ADMISSION_STT_CONCURRENCY", "8")),
+    "llm": int(os.getenv("ADMISSION_LLM_CONCURRENCY", "8")),
+    "translate": int(os.getenv("ADMISSION_TRANSLATE_CONCURRENCY", "8")),
+    "tts": int(os.getenv("ADMISSION_TTS_CONCURRENCY", "8")),
+}
+
+# Server workers sharing the provider accounts; uvicorn reads the same variable for --workers
+ADMISSION_WORKERS = max(1, int(os.getenv("ADMISSION_WORKERS", os.getenv("WEB_CONCURRENCY", "1"))))
+
+
+# Worst case Groq requests per agent call (intent detection, field extraction and the
+# summary), charged against the Groq rate limit at admission
+LLM_CALLS_PER_TURN = 3
+
+
+def _worker_share(rate: float, burst: int, min_burst: int = 1) -> tuple:
+    """Each worker's share of a deployment-wide rate limit; buckets are per process.
+
+    The burst never drops below `min_burst`, the most a single job is charged, or that
+    job could never be admitted.
+    """
+    return rate / ADMISSION_WORKERS, max(min_burst, burst // ADMISSION_WORKERS)
+
+
+# Provider rate limits as (requests per second, burst) for the whole deployment, split
+# evenly across workers; Sarvam serves STT, translation and TTS
+PROVIDER_RATE_LIMITS = {
+    "sarvam": _worker_share(float(os.getenv("SARVAM_RATE_LIMIT", "10")), int(os.getenv("SARVAM_RATE_BURST", "20"))),
+    "groq": _worker_share(float(os.getenv("GROQ_RATE_LIMIT", "0.5")), int(os.getenv("GROQ_RATE_BURST", "10")),
+                          LLM_CALLS_PER_TURN),
+}
+
+STAGE_PROVIDERS = {
+    "stt": "sarvam",
+    "llm": "groq",
+    "translate": "sarvam",
+    "tts": "sarvam",
+}
+
+# Priorities: lower runs first. Turns that already got through one stage finish before new turns start.
+PRIORITY_IN_PROGRESS = 0
+PRIORITY_NEW = 1
+
+
+class AdmissionRejected(Exception):
+    """Raised when a new turn is shed because the pipeline is over its latency objective."""
+
+    def __init__(self, stage: str, expected_wait: float):
+        super().__init__(f"{stage} queue expected wait {expected_wait:.1f}s exceeds SLO")
+        self.stage = stage
+        self.expected_wait = expected_wait
+
+
+class TokenBucket:
+    """Token bucket matching a provider's request rate limit."""
+
+    def __init__(self, rate: float, burst: int):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = float(burst)
+        self.updated = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def expected_wait(self, cost: float = 1) -> float:
+        self._refill()
+        return max(0.0, (cost - self.tokens) / self.rate)
+
+    async def acquire(self, cost: float = 1):
+        if cost > self.burst:
+            # Tokens never exceed the burst, so this would wait forever
+            raise ValueError(f"cost {cost} exceeds the bucket's burst of {self.burst}")
+        # The lock keeps waiters in FIFO order so one caller cannot starve another
+        async with self._lock:
+            self._refill()
+            while self.tokens < cost:
+                await asyncio.sleep((cost - self.tokens) / self.rate)
+                self._refill()
+            self.tokens -= cost
+
+
+class StageLimiter:
+    """Concurrency limit for one stage with a priority queue of waiters."""
+
+    def __init__(self, name: str, concurrency: int):
+        self.name = name
+        self.concurrency = concurrency
+        self.active = 0
+        self._waiters: List = []
+        self._counter = itertools.count()
+        # Exponentially weighted average service time, used to estimate queue wait
+        self.service_time = 1.0
+        self.admitted = 0
+        self.rejected = 0
+
+    @property
+    def queued(self) -> int:
+        return len(self._waiters)
+
+    def expected_wait(self) -> float:
+        if self.active < self.concurrency:
+            return 0.0
+        return (self.queued + 1) * self.service_time / self.concurrency
+
+    async def acquire(self, priority: int, on_queued: Optional[Callable[[int], Awaitable[None]]] = None):
+        if self.active < self.concurrency and not self._waiters:
+            self.active += 1
+            return
+        future = asyncio.get_running_loop().create_future()
+        entry = [priority, next(self._counter), future]
+        heapq.heappush(self._waiters, entry)
+        try:
+            if on_queued:
+                await on_queued(len(self._waiters))
+            await future
+        except asyncio.CancelledError:
+            if future.done() and not future.cancelled():
+                # The slot was handed over just as we were cancelled; pass it on
+                self.release()
+            else:
+                self._waiters.remove(entry)
+                heapq.heapify(self._waiters)
+            raise
+
+    def release(self):
+        while self._waiters:
+            _, _, future = heapq.heappop(self._waiters)
+            if not future.done():
+                # Hand the slot straight to the next waiter; `active` stays the same
+                future.set_result(None)
+                return
+        self.active -= 1
+
+    def record(self, duration: float):
+        self.service_time = 0.8 * self.service_time + 0.2 * duration
+
+
+class AdmissionController:
+    """Global admission control for the voice pipeline.
+
+    Every STT, LLM, translation and TTS job takes a slot from its stage's concurrency
+    limit and tokens from its provider's bucket. Waiting jobs of turns already in
+    progress are served before new turns, and new turns are rejected immediately when
+    the expected wait would exceed the latency objective, so tail latency stays bounded
+    under overload instead of every request slowing down together.
+    """
+
+    def __init__(self, stage_concurrency: Dict[str, int] = STAGE_CONCURRENCY,
+                 rate_limits: Dict[str, tuple] = PROVIDER_RATE_LIMITS,
+                 slo_seconds: float = ADMISSION_SLO_SECONDS):
+        self.stages = {name: StageLimiter(name, limit) for name, limit in stage_concurrency.items()}
+        self.buckets = {name: TokenBucket(rate, burst) for name, (rate, burst) in rate_limits.items()}
+        self.slo_seconds = slo_seconds
+
+    def expected_wait(self, stage: str, cost: float = 1, provider: Optional[str] = None) -> float:
+        provider = provider or STAGE_PROVIDERS.get(stage)
+        bucket_wait = self.buckets[provider].expected_wait(cost) if provider in self.buckets else 0.0
+        return self.stages[stage].expected_wait() + bucket_wait
+
+    @asynccontextmanager
+    async def slot(self, stage: str, in_progress: bool = False, cost: float = 1,
+                   on_queued: Optional[Callable[[str, int], Awaitable[None]]] = None,
+                   provider: Optional[str] = None):
+        """Hold a slot for one job of `stage`.
+
+        New turns (`in_progress=False`) raise AdmissionRejected instead of queueing past
+        the SLO. `on_queued` is called with the stage and queue position when the job
+        has to wait, so the client can be told. `provider` overrides the stage's default
+        provider, e.g. 'local' for on-box models, which have no rate limit.
+        """
+        limiter = self.stages[stage]
+        provider = provider or STAGE_PROVIDERS.get(stage)
+        if not in_progress:
+            expected_wait = self.expected_wait(stage, cost, provider)
+            if expected_wait > self.slo_seconds:
+                limiter.rejected += 1
+                logger.warning(f"Shedding new turn at {stage}: expected wait {expected_wait:.1f}s")
+                raise AdmissionRejected(stage, expected_wait)
+
+        with span(f"admission.{stage}"):
+            await limiter.acquire(
+                PRIORITY_IN_PROGRESS if in_progress else PRIORITY_NEW,
+                (lambda position: on_queued(stage, position)) if on_queued else None,
+            )
+            try:
+                if provider in self.buckets:
+                    await self.buckets[provider].acquire(cost)
+            except BaseException:
+                limiter.release()
+                raise
+        try:
+            limiter.admitted += 1
+            started = time.monotonic()
+            yield
+            limiter.record(time.monotonic() - started)
+        finally:
+            limiter.release()
+
+    @asynccontextmanager
+    async def turn_slot(self, turn, stage: str, cost: float = 1, provider: Optional[str] = None):
+        """Hold a slot for one stage of a WebSocket turn, reporting waits as `queued` status.
+
+        The first stage a turn is admitted to may shed it; every later stage runs at
+        in-progress priority so admitted turns are finished before new ones start.
+        """
+        async def on_queued(stage: str, position: int):
+            await turn.send({
+                "status": "queued",
+                "stage": stage,
+                "position": position,
+                "message": "Waiting for capacity...",
+            }, coalesce_key="status")
+
+        async with self.slot(stage, in_progress=turn.in_progress, cost=cost, on_queued=on_queued,
+                             provider=provider):
+            turn.in_progress = True
+            yield
+
+    def stats(self) -> Dict[str, Dict[str, float]]:
+        return {
+            name: {
+                "active": limiter.active,
+                "queued": limiter.queued,
+                "admitted": limiter.admitted,
+                "rejected": limiter.rejected,
+                "service_time": limiter.service_time,
+            }
+            for name, limiter in self.stages.items()
+        }
+
+
+admission = AdmissionController()
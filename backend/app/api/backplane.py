@@ -0,0 +1,304 @@
+from typing import Awaitable, Callable, Dict, Optional
+from abc import ABC, abstractmethod
+import asyncio
+import json
+import logging
+import os
+import urllib.parse
+
+logger = logging.getLogger(__name__)
+
+# Backplane transport, e.g. memory://, unix:///tmp/kisanly-backplane or redis://localhost:6379/0
+BACKPLANE_URL = os.getenv("BACKPLANE_URL", "memory://")
+
+# Backoff between attempts to subscribe again after the Redis connection drops
+BACKPLANE_RECONNECT_MIN_SECONDS = float(os.getenv("BACKPLANE_RECONNECT_MIN_SECONDS", "0.5"))
+BACKPLANE_RECONNECT_MAX_SECONDS = float(os.getenv("BACKPLANE_RECONNECT_MAX_SECONDS", "30"))
+
+EventHandler = Callable[[dict], Awaitable[None]]
+
+
+class Backplane(ABC):
+    """Transport that connects the ConnectionManagers of every worker and node.
+
+    A backplane does two things: it keeps a registry of which node owns each client
+    connection, and it delivers events either to one node or to all nodes. Events are
+    plain JSON-serializable dicts.
+    """
+
+    @abstractmethod
+    async def start(self, node_id: str, handler: EventHandler):
+        """Start receiving events addressed to `node_id` or to all nodes."""
+
+    @abstractmethod
+    async def stop(self):
+        """Stop receiving events and release resources."""
+
+    @abstractmethod
+    async def publish(self, event: dict, node_id: Optional[str] = None):
+        """Deliver an event to one node, or to every node when `node_id` is None."""
+
+    @abstractmethod
+    async def register(self, client_id: str, node_id: str):
+        """Record that `node_id` owns the connection for `client_id`."""
+
+    @abstractmethod
+    async def unregister(self, client_id: str, node_id: str):
+        """Forget the connection for `client_id` if it is still owned by `node_id`."""
+
+    @abstractmethod
+    async def lookup(self, client_id: str) -> Optional[str]:
+        """Return the node that owns `client_id`, or None if it is not connected."""
+
+
+def _remove(path: str):
+    try:
+        os.remove(path)
+    except FileNotFoundError:
+        pass
+
+
+class InMemoryBackplane(Backplane):
+    """Backplane for a single process, also used in tests to simulate several nodes.
+
+    Instances created with the same `hub` share a registry and deliver to each other.
+    """
+
+    _default_hub: Dict = {"nodes": {}, "clients": {}}
+
+    def __init__(self, hub: Optional[Dict] = None):
+        self.hub = hub if hub is not None else InMemoryBackplane._default_hub
+        self.node_id: Optional[str] = None
+
+    async def start(self, node_id: str, handler: EventHandler):
+        self.node_id = node_id
+        self.hub["nodes"][node_id] = handler
+
+    async def stop(self):
+        self.hub["nodes"].pop(self.node_id, None)
+
+    async def publish(self, event: dict, node_id: Optional[str] = None):
+        targets = [node_id] if node_id else list(self.hub["nodes"])
+        for target in targets:
+            handler = self.hub["nodes"].get(target)
+            if handler:
+                # Round-trip through JSON so events behave as they would on a real transport
+                await handler(json.loads(json.dumps(event)))
+
+    async def register(self, client_id: str, node_id: str):
+        self.hub["clients"][client_id] = node_id
+
+    async def unregister(self, client_id: str, node_id: str):
+        if self.hub["clients"].get(client_id) == node_id:
+            del self.hub["clients"][client_id]
+
+    async def lookup(self, client_id: str) -> Optional[str]:
+        return self.hub["clients"].get(client_id)
+
+
+class UnixSocketBackplane(Backplane):
+    """Backplane for several workers on one host, using Unix sockets in a shared directory.
+
+    Each node listens on `<dir>/nodes/<node_id>.sock` and events are written to peers as
+    JSON lines. The registry is one small file per client under `<dir>/clients`, replaced
+    atomically so concurrent workers never see partial writes. File operations run on
+    worker threads. A socket nobody listens on belongs to a crashed node: it is removed
+    when a send to it is refused, and registry entries naming a node without a socket
+    are dropped when they are looked up.
+    """
+
+    def __init__(self, directory: str):
+        self.directory = directory
+        self.nodes_dir = os.path.join(directory, "nodes")
+        self.clients_dir = os.path.join(directory, "clients")
+        os.makedirs(self.nodes_dir, exist_ok=True)
+        os.makedirs(self.clients_dir, exist_ok=True)
+        self.node_id: Optional[str] = None
+        self._server: Optional[asyncio.AbstractServer] = None
+        self._peers: Dict[str, asyncio.StreamWriter] = {}
+        self._inbound: Dict[asyncio.StreamWriter, asyncio.Task] = {}
+        self._handler: Optional[EventHandler] = None
+
+    def _socket_path(self, node_id: str) -> str:
+        return os.path.join(self.nodes_dir, f"{node_id}.sock")
+
+    def _client_path(self, client_id: str) -> str:
+        return os.path.join(self.clients_dir, urllib.parse.quote(client_id, safe=""))
+
+    async def start(self, node_id: str, handler: EventHandler):
+        self.node_id = node_id
+        self._handler = handler
+        self._server = await asyncio.start_unix_server(self._serve_peer, path=self._socket_path(node_id))
+
+    async def stop(self):
+        for writer in list(self._peers.values()) + list(self._inbound):
+            writer.close()
+        self._peers.clear()
+        # Closing the connections ends their reader tasks; wait for them to finish
+        await asyncio.gather(*self._inbound.values(), return_exceptions=True)
+        if self._server:
+            self._server.close()
+            await self._server.wait_closed()
+            self._server = None
+        if self.node_id:
+            await asyncio.to_thread(_remove, self._socket_path(self.node_id))
+
+    async def _serve_peer(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        self._inbound[writer] = asyncio.current_task()
+        try:
+            while line := await reader.readline():
+                try:
+                    await self._handler(json.loads(line))
+                except Exception as e:
+                    logger.error(f"Error handling backplane event: {e}", exc_info=True)
+        except ConnectionError:
+            pass
+        finally:
+            self._inbound.pop(writer, None)
+            writer.close()
+
+    async def _send(self, node_id: str, data: bytes):
+        writer = self._peers.get(node_id)
+        try:
+            if writer is None or writer.is_closing():
+                _, writer = await asyncio.open_unix_connection(self._socket_path(node_id))
+                self._peers[node_id] = writer
+            writer.write(data)
+            await writer.drain()
+        except ConnectionRefusedError as e:
+            # The socket file outlived its node, which must have crashed
+            logger.warning(f"Backplane peer {node_id} is gone; removing its socket: {e}")
+            self._peers.pop(node_id, None)
+            await asyncio.to_thread(_remove, self._socket_path(node_id))
+        except (ConnectionError, FileNotFoundError) as e:
+            logger.warning(f"Backplane peer {node_id} unreachable: {e}")
+            self._peers.pop(node_id, None)
+
+    def _node_ids(self) -> list:
+        return [name[:-len(".sock")] for name in os.listdir(self.nodes_dir) if name.endswith(".sock")]
+
+    async def publish(self, event: dict, node_id: Optional[str] = None):
+        data = (json.dumps(event) + "\n").encode("utf-8")
+        targets = [node_id] if node_id else await asyncio.to_thread(self._node_ids)
+        await asyncio.gather(*(self._send(target, data) for target in targets))
+
+    def _write_client(self, client_id: str, node_id: str):
+        path = self._client_path(client_id)
+        tmp_path = f"{path}.{node_id}.tmp"
+        with open(tmp_path, "w") as f:
+            f.write(node_id)
+        os.replace(tmp_path, path)
+
+    def _read_client(self, client_id: str) -> Optional[str]:
+        path = self._client_path(client_id)
+        try:
+            with open(path) as f:
+                node_id = f.read().strip() or None
+        except FileNotFoundError:
+            return None
+        if node_id and not os.path.exists(self._socket_path(node_id)):
+            logger.info(f"Dropping backplane registration of {client_id} on node {node_id}, which is gone")
+            _remove(path)
+            return None
+        return node_id
+
+    async def register(self, client_id: str, node_id: str):
+        await asyncio.to_thread(self._write_client, client_id, node_id)
+
+    async def unregister(self, client_id: str, node_id: str):
+        if await self.lookup(client_id) == node_id:
+            await asyncio.to_thread(_remove, self._client_path(client_id))
+
+    async def lookup(self, client_id: str) -> Optional[str]:
+        return await asyncio.to_thread(self._read_client, client_id)
+
+
+class RedisBackplane(Backplane):
+    """Backplane for several hosts, using Redis pub/sub and a hash as the client registry."""
+
+    CLIENTS_KEY = "kisanly:clients"
+    ALL_CHANNEL = "kisanly:all"
+
+    def __init__(self, url: str):
+        import redis.asyncio as redis
+
+        self.redis = redis.from_url(url)
+        self.node_id: Optional[str] = None
+        self._pubsub = None
+        self._task: Optional[asyncio.Task] = None
+
+    async def start(self, node_id: str, handler: EventHandler):
+        self.node_id = node_id
+        await self._subscribe()
+        self._task = asyncio.create_task(self._listen(handler))
+
+    async def _subscribe(self):
+        self._pubsub = self.redis.pubsub(ignore_subscribe_messages=True)
+        await self._pubsub.subscribe(self.ALL_CHANNEL, f"kisanly:node:{self.node_id}")
+
+    async def _close_pubsub(self):
+        pubsub, self._pubsub = self._pubsub, None
+        if pubsub is not None:
+            try:
+                await pubsub.aclose()
+            except Exception as e:
+                logger.debug(f"Error closing the Redis subscription: {e}")
+
+    async def _listen(self, handler: EventHandler):
+        # A dropped connection ends the subscription; subscribe again with backoff, as
+        # events published in the meantime are lost either way
+        delay = BACKPLANE_RECONNECT_MIN_SECONDS
+        while True:
+            try:
+                if self._pubsub is None:
+                    await self._subscribe()
+                    logger.info(f"Backplane node {self.node_id} subscribed to Redis again")
+                async for message in self._pubsub.listen():
+                    delay = BACKPLANE_RECONNECT_MIN_SECONDS
+                    try:
+                        await handler(json.loads(message["data"]))
+                    except Exception as e:
+                        logger.error(f"Error handling backplane event: {e}", exc_info=True)
+                error = "subscription ended"
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                error = e
+            logger.error(f"Backplane lost its Redis subscription ({error}); reconnecting in {delay:g}s")
+            await self._close_pubsub()
+            await asyncio.sleep(delay)
+            delay = min(delay * 2, BACKPLANE_RECONNECT_MAX_SECONDS)
+
+    async def stop(self):
+        if self._task:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+        await self._close_pubsub()
+        await self.redis.aclose()
+
+    async def publish(self, event: dict, node_id: Optional[str] = None):
+        channel = f"kisanly:node:{node_id}" if node_id else self.ALL_CHANNEL
+        await self.redis.publish(channel, json.dumps(event))
+
+    async def register(self, client_id: str, node_id: str):
+        await self.redis.hset(self.CLIENTS_KEY, client_id, node_id)
+
+    async def unregister(self, client_id: str, node_id: str):
+        if await self.lookup(client_id) == node_id:
+            await self.redis.hdel(self.CLIENTS_KEY, client_id)
+
+    async def lookup(self, client_id: str) -> Optional[str]:
+        node_id = await self.redis.hget(self.CLIENTS_KEY, client_id)
+        return node_id.decode("utf-8") if node_id else None
+
+
+def create_backplane(url: str = BACKPLANE_URL) -> Backplane:
+    """Create the backplane transport for a URL."""
+    parsed = urllib.parse.urlparse(url)
+    if parsed.scheme == "memory":
+        return InMemoryBackplane()
+    if parsed.scheme == "unix":
+        return UnixSocketBackplane(parsed.path)
+    if parsed.scheme in ("redis", "rediss"):
+        return RedisBackplane(url)
+    raise ValueError(f"Unsupported backplane URL: {url}")
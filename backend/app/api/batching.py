@@ -0,0 +1,92 @@
+from typing import Any, Awaitable, Callable, Dict, Hashable, List, Set, Tuple
+import asyncio
+import contextvars
+import logging
+
+from .metrics import Histogram
+
+logger = logging.getLogger(__name__)
+
+BATCH_SIZE = Histogram(
+    "kisanly_batch_size", "Jobs processed together per batch.", ["batcher"],
+    buckets=(1, 2, 4, 8, 16, 32, 64))
+
+
+class MicroBatcher:
+    """Collects concurrent jobs for a short window and processes them as one batch.
+
+    Jobs with the same key (e.g. a language) are batched together. A batch is dispatched
+    when it reaches `max_batch_size` or `max_wait_ms` after its first job arrived,
+    whichever comes first, so a lone job waits at most a few milliseconds. `process_batch`
+    receives the key and the list of items and returns one result per item, in order;
+    plain functions run in a worker thread, coroutine functions on the event loop.
+    """
+
+    def __init__(self, name: str, process_batch: Callable[[Hashable, List[Any]], Any],
+                 max_batch_size: int = 8, max_wait_ms: float = 10, max_concurrency: int = 1):
+        self.name = name
+        self.process_batch = process_batch
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait_ms / 1000
+        self.max_concurrency = max_concurrency
+        self._pending: Dict[Hashable, List[Tuple[Any, asyncio.Future]]] = {}
+        self._timers: Dict[Hashable, asyncio.TimerHandle] = {}
+        self._running: Set[asyncio.Task] = set()
+        self._slots = asyncio.Semaphore(max_concurrency)
+
+        self.batches = 0
+        self.items = 0
+
+    async def submit(self, item: Any, key: Hashable = None) -> Any:
+        """Queue one job and wait for its result."""
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        batch = self._pending.setdefault(key, [])
+        batch.append((item, future))
+        if len(batch) >= self.max_batch_size:
+            self._flush(key)
+        elif len(batch) == 1:
+            self._timers[key] = loop.call_later(self.max_wait, self._flush, key)
+        return await future
+
+    def _flush(self, key: Hashable):
+        timer = self._timers.pop(key, None)
+        if timer:
+            timer.cancel()
+        # Jobs whose caller gave up (e.g. a superseded turn) are not processed
+        batch = [(item, future) for item, future in self._pending.pop(key, []) if not future.done()]
+        if batch:
+            # A batch serves several callers, so it runs in a fresh context rather than
+            # inheriting the trace of whichever caller happened to trigger the flush
+            task = contextvars.Context().run(asyncio.create_task, self._run(key, batch))
+            self._running.add(task)
+            task.add_done_callback(self._running.discard)
+
+    async def _run(self, key: Hashable, batch: List[Tuple[Any, asyncio.Future]]):
+        items = [item for item, _ in batch]
+        async with self._slots:
+            self.batches += 1
+            self.items += len(items)
+            BATCH_SIZE.observe(len(items), batcher=self.name)
+            try:
+                if asyncio.iscoroutinefunction(self.process_batch):
+                    results = await self.process_batch(key, items)
+                else:
+                    results = await asyncio.to_thread(self.process_batch, key, items)
+            except Exception as e:
+                logger.error(f"{self.name} batch of {len(items)} failed: {e}", exc_info=True)
+                for _, future in batch:
+                    if not future.done():
+                        future.set_exception(e)
+                return
+        for (_, future), result in zip(batch, results):
+            if not future.done():
+                future.set_result(result)
+
+    def stats(self) -> Dict[str, float]:
+        return {
+            "batches": self.batches,
+            "items": self.items,
+            "avg_batch_size": self.items / self.batches if self.batches else 0.0,
+            "pending": sum(len(batch) for batch in self._pending.values()),
+        }
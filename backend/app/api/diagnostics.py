@@ -0,0 +1,204 @@
+from typing import Dict, List, Optional
+import asyncio
+import logging
+import os
+import sys
+import threading
+import time
+import traceback
+
+from .metrics import Counter, GaugeFunc, Histogram
+
+logger = logging.getLogger(__name__)
+
+# How often the event loop is probed for lag
+LOOP_LAG_INTERVAL_MS = float(os.getenv("LOOP_LAG_INTERVAL_MS", "250"))
+
+# Blocking-call detection: sample the loop's stack whenever it is stuck for longer than the threshold
+LOOP_DIAGNOSTICS = os.getenv("LOOP_DIAGNOSTICS", "false").lower() in ("1", "true", "yes")
+BLOCKING_THRESHOLD_MS = float(os.getenv("BLOCKING_THRESHOLD_MS", "100"))
+BLOCKING_SAMPLE_INTERVAL_MS = float(os.getenv("BLOCKING_SAMPLE_INTERVAL_MS", "10"))
+BLOCKING_STACK_DEPTH = 40
+
+APP_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+LAG_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+
+EVENT_LOOP_LAG_SECONDS = Histogram(
+    "kisanly_event_loop_lag_seconds", "How late the event loop ran a periodic timer.", buckets=LAG_BUCKETS)
+EVENT_LOOP_STALLS = Counter(
+    "kisanly_event_loop_stalls_total", "Times the event loop was blocked for longer than the threshold.")
+
+
+class LoopLagMonitor:
+    """Measures event-loop lag continuously.
+
+    A timer is scheduled every `interval_ms`; how late it actually fires is the time
+    the loop was busy running other callbacks, i.e. how long every coroutine on this
+    worker was stalled.
+    """
+
+    def __init__(self, interval_ms: float = LOOP_LAG_INTERVAL_MS):
+        self.interval = interval_ms / 1000
+        self.last_lag = 0.0
+        self.max_lag = 0.0
+        self._task: Optional[asyncio.Task] = None
+
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+
+    async def _run(self):
+        while True:
+            started = time.perf_counter()
+            await asyncio.sleep(self.interval)
+            lag = max(0.0, time.perf_counter() - started - self.interval)
+            self.last_lag = lag
+            self.max_lag = max(self.max_lag, lag)
+            EVENT_LOOP_LAG_SECONDS.observe(lag)
+
+    def stats(self) -> Dict[str, float]:
+        return {"last": self.last_lag, "max": self.max_lag}
+
+
+def _describe(frame: traceback.FrameSummary) -> str:
+    filename = frame.filename
+    if filename.startswith(APP_DIR):
+        filename = "app" + filename[len(APP_DIR):]
+    return f"{filename}:{frame.lineno} in {frame.name}"
+
+
+class BlockingDetector:
+    """Finds the code that blocks the event loop, using stack samples taken during stalls.
+
+    A heartbeat callback runs on the loop every `sample_interval_ms`. A watchdog thread
+    checks it at the same rate and, while the loop has been stuck for longer than
+    `threshold_ms`, samples the loop thread's stack. Samples are grouped by blocking
+    site: the innermost frame in the app's own code, or the innermost frame when the
+    stall is entirely inside a library. Nothing is sampled while the loop is healthy.
+    """
+
+    def __init__(self, threshold_ms: float = BLOCKING_THRESHOLD_MS,
+                 sample_interval_ms: float = BLOCKING_SAMPLE_INTERVAL_MS):
+        self.threshold = threshold_ms / 1000
+        self.sample_interval = sample_interval_ms / 1000
+        self.stalls = 0
+        self.sites: Dict[str, dict] = {}
+        self._lock = threading.Lock()  # Guards `sites` between the watchdog and report readers
+        self._beat = 0.0
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._loop_thread: Optional[int] = None
+        self._watchdog: Optional[threading.Thread] = None
+        self._stopped = threading.Event()
+
+    @property
+    def running(self) -> bool:
+        return self._watchdog is not None and self._watchdog.is_alive()
+
+    def start(self):
+        """Start watching the running loop."""
+        if self.running:
+            return
+        self._loop = asyncio.get_running_loop()
+        self._loop_thread = threading.get_ident()
+        self._stopped.clear()
+        self._heartbeat()
+        self._watchdog = threading.Thread(target=self._watch, name="kisanly-loop-watchdog", daemon=True)
+        self._watchdog.start()
+        logger.info(f"Blocking-call detection enabled (threshold {self.threshold * 1000:.0f} ms)")
+
+    def stop(self):
+        self._stopped.set()
+        self._watchdog = None
+
+    def reset(self):
+        with self._lock:
+            self.sites = {}
+            self.stalls = 0
+
+    def _heartbeat(self):
+        self._beat = time.perf_counter()
+        if not self._stopped.is_set():
+            self._loop.call_later(self.sample_interval, self._heartbeat)
+
+    def _watch(self):
+        stall_sites: set = set()
+        stalled_for = 0.0
+        last_sample = 0.0
+        while not self._stopped.wait(self.sample_interval):
+            now = time.perf_counter()
+            stuck = now - self._beat - self.sample_interval
+            if stuck < self.threshold:
+                if stall_sites:
+                    self._finish_stall(stall_sites, stalled_for)
+                    stall_sites = set()
+                continue
+            frame = sys._current_frames().get(self._loop_thread)
+            if frame is None:
+                continue
+            stack = traceback.extract_stack(frame, limit=BLOCKING_STACK_DEPTH)
+            # The first sample of a stall accounts for the time before it was noticed
+            blocked = stuck if not stall_sites else now - last_sample
+            stall_sites.add(self._record(stack, blocked))
+            stalled_for = stuck
+            last_sample = now
+
+    def _record(self, stack: List[traceback.FrameSummary], blocked: float) -> str:
+        app_frames = [frame for frame in stack if frame.filename.startswith(APP_DIR)
+                      and frame.filename != __file__]
+        site = _describe(app_frames[-1] if app_frames else stack[-1])
+        with self._lock:
+            entry = self.sites.get(site)
+            if entry is None:
+                entry = self.sites[site] = {
+                    "site": site,
+                    "samples": 0,
+                    "blocked_ms": 0.0,
+                    "stalls": 0,
+                    "max_stall_ms": 0.0,
+                    "leaf": _describe(stack[-1]),
+                    "stack": [_describe(frame) for frame in stack],
+                }
+            entry["samples"] += 1
+            entry["blocked_ms"] += blocked * 1000
+        return site
+
+    def _finish_stall(self, sites: set, stalled_for: float):
+        EVENT_LOOP_STALLS.inc()
+        with self._lock:
+            self.stalls += 1
+            for site in sites:
+                entry = self.sites.get(site)
+                if entry is None:
+                    continue  # Reset while the stall was in progress
+                entry["stalls"] += 1
+                entry["max_stall_ms"] = max(entry["max_stall_ms"], stalled_for * 1000)
+        logger.warning(f"Event loop blocked for {stalled_for * 1000:.0f} ms at {', '.join(sorted(sites))}")
+
+    def report(self, limit: int = 10) -> dict:
+        """The `limit` sites that blocked the loop the longest, with an example stack each."""
+        with self._lock:
+            sites = sorted(self.sites.values(), key=lambda entry: -entry["blocked_ms"])[:limit]
+            sites = [{**entry, "blocked_ms": round(entry["blocked_ms"], 1),
+                      "max_stall_ms": round(entry["max_stall_ms"], 1)} for entry in sites]
+            stalls = self.stalls
+        return {
+            "enabled": self.running,
+            "threshold_ms": self.threshold * 1000,
+            "stalls": stalls,
+            "event_loop_lag": loop_monitor.stats(),
+            "sites": sites,
+        }
+
+
+loop_monitor = LoopLagMonitor()
+blocking_detector = BlockingDetector()
+
+GaugeFunc("kisanly_event_loop_lag_seconds_recent", "Latest and largest event-loop lag seen by this worker.",
+          lambda: {(name,): value for name, value in loop_monitor.stats().items()},
+          ["stat"])
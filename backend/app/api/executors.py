@@ -0,0 +1,108 @@
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Callable, Dict, TypeVar
+import asyncio
+import contextvars
+import logging
+import os
+import threading
+import time
+
+from .metrics import Counter, GaugeFunc, Histogram
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+# Threads and queued work items per executor; a queue limit of 0 means unbounded
+CPU_EXECUTOR_WORKERS = int(os.getenv("CPU_EXECUTOR_WORKERS", str(os.cpu_count() or 1)))
+CPU_EXECUTOR_MAX_QUEUE = int(os.getenv("CPU_EXECUTOR_MAX_QUEUE", "256"))
+DB_EXECUTOR_WORKERS = int(os.getenv("DB_EXECUTOR_WORKERS", "8"))
+DB_EXECUTOR_MAX_QUEUE = int(os.getenv("DB_EXECUTOR_MAX_QUEUE", "2048"))
+NETWORK_EXECUTOR_WORKERS = int(os.getenv("NETWORK_EXECUTOR_WORKERS", "32"))
+NETWORK_EXECUTOR_MAX_QUEUE = int(os.getenv("NETWORK_EXECUTOR_MAX_QUEUE", "1024"))
+
+EXECUTOR_WAIT_SECONDS = Histogram(
+    "kisanly_executor_wait_seconds", "Time work waited in an executor's queue before a thread picked it up.",
+    ["executor"])
+EXECUTOR_REJECTIONS = Counter(
+    "kisanly_executor_rejections_total", "Work refused because the executor's queue was full.", ["executor"])
+
+
+class ExecutorSaturated(Exception):
+    """The executor's queue is full; the work was not queued."""
+
+
+class BoundedExecutor:
+    """A named thread pool for one kind of blocking work, with a bounded queue.
+
+    Each kind of work (CPU, database, network) gets its own threads, so a backlog of
+    one can never hold up the others. Work beyond `max_queue` waiting items is refused
+    with `ExecutorSaturated` instead of queueing without bound. Like
+    `asyncio.to_thread`, work runs in a copy of the caller's context, so it still sees
+    the current turn's trace.
+    """
+
+    def __init__(self, name: str, workers: int, max_queue: int = 0):
+        self.name = name
+        self.workers = workers
+        self.max_queue = max_queue
+        self.queued = 0
+        self.busy = 0
+        self._lock = threading.Lock()
+        self._pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix=f"kisanly-{name}")
+        _executors[name] = self
+
+    def submit(self, fn: Callable[..., T], *args, **kwargs) -> "Future[T]":
+        with self._lock:
+            if self.max_queue and self.queued >= self.max_queue:
+                EXECUTOR_REJECTIONS.inc(executor=self.name)
+                raise ExecutorSaturated(f"{self.name} executor has {self.queued} items queued")
+            self.queued += 1
+        context = contextvars.copy_context()
+        submitted = time.perf_counter()
+
+        def work():
+            with self._lock:
+                self.queued -= 1
+                self.busy += 1
+            EXECUTOR_WAIT_SECONDS.observe(time.perf_counter() - submitted, executor=self.name)
+            try:
+                return context.run(fn, *args, **kwargs)
+            finally:
+                with self._lock:
+                    self.busy -= 1
+
+        future = self._pool.submit(work)
+        future.add_done_callback(self._cancelled)
+        return future
+
+    def _cancelled(self, future: Future):
+        # Work cancelled while still queued never ran, so it never left the queue
+        if future.cancelled():
+            with self._lock:
+                self.queued -= 1
+
+    async def run(self, fn: Callable[..., T], *args, **kwargs) -> T:
+        """Run a blocking call on this executor and await its result."""
+        return await asyncio.wrap_future(self.submit(fn, *args, **kwargs))
+
+    def stats(self) -> Dict[str, int]:
+        return {"workers": self.workers, "busy": self.busy, "queued": self.queued}
+
+
+_executors: Dict[str, BoundedExecutor] = {}
+
+# Audio transcoding, local models and large JSON encoding
+cpu_executor = BoundedExecutor("cpu", CPU_EXECUTOR_WORKERS, CPU_EXECUTOR_MAX_QUEUE)
+# Database queries and writes, and saving recordings
+db_executor = BoundedExecutor("db", DB_EXECUTOR_WORKERS, DB_EXECUTOR_MAX_QUEUE)
+# Blocking HTTP clients: Sarvam requests, the agent's LLM workflow and the health check
+network_executor = BoundedExecutor("network", NETWORK_EXECUTOR_WORKERS, NETWORK_EXECUTOR_MAX_QUEUE)
+# Retention and archival runs, which hold a thread for minutes; one at a time
+maintenance_executor = BoundedExecutor("maintenance", 1, 1)
+
+
+GaugeFunc("kisanly_executor", "Threads, busy threads and queued work items per executor.",
+          lambda: {(executor.name, stat): value
+                   for executor in list(_executors.values()) for stat, value in executor.stats().items()},
+          ["executor", "stat"])
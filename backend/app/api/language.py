@@ -0,0 +1,90 @@
+from typing import Optional
+from collections import OrderedDict
+import logging
+import os
+
+from .metrics import Counter
+
+logger = logging.getLogger(__name__)
+
+# Consecutive turns a language must be detected in before the session is assumed to speak it
+LANGUAGE_AFFINITY_MIN_TURNS = int(os.getenv("LANGUAGE_AFFINITY_MIN_TURNS", "2"))
+# Once it is, every this many audio turns the language is detected again to notice a switch
+LANGUAGE_RECHECK_TURNS = int(os.getenv("LANGUAGE_RECHECK_TURNS", "5"))
+LANGUAGE_AFFINITY_MAX_SESSIONS = int(os.getenv("LANGUAGE_AFFINITY_MAX_SESSIONS", "10000"))
+
+STT_LANGUAGE_SOURCES = Counter(
+    "kisanly_stt_language_total",
+    "Audio turns by where their language came from (detected by STT, or the session's language).", ["source"])
+
+
+class SessionLanguage:
+    """What is known about the language one session speaks."""
+
+    __slots__ = ("code", "turns", "unchecked")
+
+    def __init__(self, code: Optional[str] = None, turns: int = 0):
+        self.code = code
+        self.turns = turns  # Consecutive turns `code` was detected
+        self.unchecked = 0  # Audio turns since the language was last detected
+
+    @property
+    def known(self) -> Optional[str]:
+        """The session's language once it has been detected consistently, else None."""
+        return self.code if self.code and self.turns >= LANGUAGE_AFFINITY_MIN_TURNS else None
+
+    @property
+    def skip_detection(self) -> Optional[str]:
+        """The language to transcribe the next audio turn in without detecting it, if any."""
+        return self.known if self.unchecked < LANGUAGE_RECHECK_TURNS else None
+
+
+class LanguageAffinity:
+    """Per-session language, learned from the languages STT detects and stored with the session.
+
+    After `LANGUAGE_AFFINITY_MIN_TURNS` consecutive turns in the same language, it serves as
+    the hint for the rest of the pipeline. Audio turns are transcribed in it without
+    detection (except every `LANGUAGE_RECHECK_TURNS` turns, to notice a switch), and
+    replies to text turns are translated and spoken in it. Sessions are cached per worker;
+    the database is read once per session and written only when the language changes or
+    gains confidence.
+    """
+
+    def __init__(self, db_manager, max_sessions: int = LANGUAGE_AFFINITY_MAX_SESSIONS):
+        self.db_manager = db_manager
+        self.max_sessions = max_sessions
+        self._sessions: "OrderedDict[str, SessionLanguage]" = OrderedDict()
+
+    async def get(self, session_id: str) -> SessionLanguage:
+        language = self._sessions.get(session_id)
+        if language is None:
+            try:
+                code, turns = await self.db_manager.get_session_language_async(session_id)
+            except Exception as e:
+                logger.error(f"Failed to load the language of session {session_id}: {e}", exc_info=True)
+                code, turns = None, 0
+            # Another turn of the session may have loaded it in the meantime
+            language = self._sessions.setdefault(session_id, SessionLanguage(code, turns))
+            while len(self._sessions) > self.max_sessions:
+                self._sessions.popitem(last=False)
+        self._sessions.move_to_end(session_id)
+        return language
+
+    def observe(self, session_id: str, language: SessionLanguage, code: Optional[str], detected: bool):
+        """Record the language of an audio turn; `detected` is False when it was assumed, not detected."""
+        STT_LANGUAGE_SOURCES.inc(source="detected" if detected else "session")
+        if not detected:
+            language.unchecked += 1
+            return
+        if not code:
+            return
+        language.unchecked = 0
+        if code == language.code:
+            if language.turns >= LANGUAGE_AFFINITY_MIN_TURNS:
+                return  # Already known; nothing to store
+            language.turns += 1
+        else:
+            if language.code:
+                logger.info(f"Session {session_id} switched language from {language.code} to {code}")
+            language.code, language.turns = code, 1
+        self.db_manager.set_session_language_background(session_id, language.code, language.turns)
@@ -0,0 +1,223 @@
+from typing import Dict, List, Optional, Tuple
+from functools import lru_cache
+import base64
+import importlib.util
+import io
+import logging
+import os
+import threading
+import wave
+
+logger = logging.getLogger(__name__)
+
+# Languages served by the local models, e.g. "kn-IN,hi-IN" or "*"; empty keeps everything hosted
+LOCAL_STT_LANGUAGES = os.getenv("LOCAL_STT_LANGUAGES", "")
+LOCAL_TTS_LANGUAGES = os.getenv("LOCAL_TTS_LANGUAGES", "")
+
+# faster-whisper (CTranslate2) model name or path, quantized to int8 on CPU by default
+LOCAL_STT_MODEL = os.getenv("LOCAL_STT_MODEL", "small")
+LOCAL_STT_DEVICE = os.getenv("LOCAL_STT_DEVICE", "cpu")
+LOCAL_STT_COMPUTE_TYPE = os.getenv("LOCAL_STT_COMPUTE_TYPE", "int8")
+LOCAL_STT_BEAM_SIZE = int(os.getenv("LOCAL_STT_BEAM_SIZE", "1"))
+LOCAL_CPU_THREADS = int(os.getenv("LOCAL_CPU_THREADS", "0"))  # 0 lets the runtime decide
+
+# Concurrent batches per Whisper model (CTranslate2 workers)
+LOCAL_MODEL_WORKERS = int(os.getenv("LOCAL_MODEL_WORKERS", "1"))
+
+SAMPLING_RATE = 16000
+WHISPER_WINDOW_SAMPLES = 30 * SAMPLING_RATE  # Longer audio is transcribed on its own
+
+# MMS-TTS (VITS) checkpoints per language
+LOCAL_TTS_MODELS = {
+    "en-IN": "facebook/mms-tts-eng",
+    "hi-IN": "facebook/mms-tts-hin",
+    "kn-IN": "facebook/mms-tts-kan",
+    "ta-IN": "facebook/mms-tts-tam",
+    "te-IN": "facebook/mms-tts-tel",
+    "mr-IN": "facebook/mms-tts-mar",
+    "bn-IN": "facebook/mms-tts-ben",
+    "gu-IN": "facebook/mms-tts-guj",
+    "ml-IN": "facebook/mms-tts-mal",
+    "pa-IN": "facebook/mms-tts-pan",
+    "od-IN": "facebook/mms-tts-ory",
+}
+
+
+def _language_set(value: str) -> set:
+    return {code.strip() for code in value.split(",") if code.strip()}
+
+
+@lru_cache(maxsize=None)
+def _installed(*modules: str) -> bool:
+    """Whether the local models' dependencies can be imported, without importing them."""
+    return all(importlib.util.find_spec(module) is not None for module in modules)
+
+
+def whisper_to_language_code(language: Optional[str]) -> Optional[str]:
+    """Map a Whisper language such as 'hi' to the BCP-47 codes used by the Sarvam APIs."""
+    if not language:
+        return None
+    return f"{language}-IN"
+
+
+def language_code_to_whisper(language_code: Optional[str]) -> Optional[str]:
+    """Map a code such as 'hi-IN' back to the Whisper language 'hi'."""
+    if not language_code:
+        return None
+    return language_code.split("-")[0].lower()
+
+
+def wav_base64(samples, sampling_rate: int) -> str:
+    """Encode float samples in [-1, 1] as a base64 16-bit mono WAV, like the hosted TTS returns."""
+    import numpy as np
+
+    pcm = (np.clip(samples, -1.0, 1.0) * 32767).astype("<i2")
+    buffer = io.BytesIO()
+    with wave.open(buffer, "wb") as wav:
+        wav.setnchannels(1)
+        wav.setsampwidth(2)
+        wav.setframerate(sampling_rate)
+        wav.writeframes(pcm.tobytes())
+    return base64.b64encode(buffer.getvalue()).decode("ascii")
+
+
+class LocalSpeechToText:
+    """Resident int8 Whisper model shared by all connections of this worker.
+
+    The model is loaded on first use, so nothing heavy is imported unless local STT is
+    enabled and actually needed. Batches of utterances, collected by the shared STT
+    batcher, go through one encoder and decoder pass; like Sarvam's
+    speech-to-text-translate, the result is English text plus the detected source language.
+    """
+
+    def __init__(self):
+        self.languages = _language_set(LOCAL_STT_LANGUAGES)
+        self._model = None
+        self._load_lock = threading.Lock()
+
+    def handles(self, language_code: Optional[str]) -> bool:
+        return "*" in self.languages or (language_code in self.languages)
+
+    def supports(self, language_code: Optional[str]) -> bool:
+        """Whether the model can stand in for the hosted STT, e.g. when it fails over."""
+        return _installed("faster_whisper")
+
+    def _load(self):
+        with self._load_lock:
+            if self._model is None:
+                from faster_whisper import WhisperModel
+
+                logger.info(f"Loading local STT model {LOCAL_STT_MODEL} ({LOCAL_STT_COMPUTE_TYPE} on {LOCAL_STT_DEVICE})")
+                self._model = WhisperModel(
+                    LOCAL_STT_MODEL,
+                    device=LOCAL_STT_DEVICE,
+                    compute_type=LOCAL_STT_COMPUTE_TYPE,
+                    cpu_threads=LOCAL_CPU_THREADS,
+                    num_workers=LOCAL_MODEL_WORKERS,
+                )
+        return self._model
+
+    def transcribe_batch(self, items: List[bytes],
+                         languages: Optional[List[Optional[str]]] = None) -> List[Tuple[str, Optional[str]]]:
+        """Return (English transcript, detected language code) for each utterance, in order.
+
+        Utterances whose language is given in `languages` (e.g. the session's known
+        language) skip language detection; English ones are transcribed, not translated.
+        """
+        import numpy as np
+        from faster_whisper import decode_audio
+        from faster_whisper.audio import pad_or_trim
+        from faster_whisper.tokenizer import Tokenizer
+
+        model = self._load()
+        audios = [decode_audio(io.BytesIO(item), sampling_rate=SAMPLING_RATE) for item in items]
+        known = [language_code_to_whisper(code) for code in (languages or [None] * len(items))]
+        results: List[Optional[Tuple[str, Optional[str]]]] = [None] * len(items)
+
+        # Utterances that fit one 30 s window share a single batched encode and decode
+        short = [i for i, audio in enumerate(audios) if len(audio) <= WHISPER_WINDOW_SAMPLES]
+        if short:
+            features = np.stack([pad_or_trim(model.feature_extractor(audios[i])) for i in short])
+            encoded = model.encode(features)
+            # Detection runs over the whole batch, so it is skipped only when every language is known
+            if all(known[i] for i in short):
+                languages = [known[i] for i in short]
+            else:
+                detected = [probs[0][0][2:-2] for probs in model.model.detect_language(encoded)]
+                languages = [known[i] or language for i, language in zip(short, detected)]
+            tokenizers = [
+                Tokenizer(model.hf_tokenizer, model.model.is_multilingual,
+                          task="transcribe" if language == "en" else "translate", language=language)
+                for language in languages
+            ]
+            prompts = [list(tokenizer.sot_sequence) + [tokenizer.no_timestamps] for tokenizer in tokenizers]
+            generated = model.model.generate(encoded, prompts, beam_size=LOCAL_STT_BEAM_SIZE,
+                                             max_length=448, suppress_blank=True)
+            for i, tokenizer, language, result in zip(short, tokenizers, languages, generated):
+                text = tokenizer.decode(result.sequences_ids[0]).strip()
+                results[i] = (text, whisper_to_language_code(language))
+
+        for i, audio in enumerate(audios):
+            if results[i] is None:
+                segments, info = model.transcribe(audio, task="transcribe" if known[i] == "en" else "translate",
+                                                  language=known[i], beam_size=LOCAL_STT_BEAM_SIZE)
+                text = " ".join(segment.text.strip() for segment in segments)
+                results[i] = (text, whisper_to_language_code(info.language))
+        return results
+
+
+class LocalTextToSpeech:
+    """Resident MMS-TTS voices, one per language, loaded on first use.
+
+    Models are dynamically quantized to int8 for CPU inference, and batches of texts in
+    the same language, collected by the shared TTS batcher, are synthesized as one padded
+    batch.
+    """
+
+    def __init__(self):
+        self.languages = _language_set(LOCAL_TTS_LANGUAGES)
+        self._models: Dict[str, tuple] = {}
+        self._load_lock = threading.Lock()
+
+    def handles(self, language_code: Optional[str]) -> bool:
+        if language_code not in LOCAL_TTS_MODELS:
+            return False
+        return "*" in self.languages or language_code in self.languages
+
+    def supports(self, language_code: Optional[str]) -> bool:
+        """Whether a voice for the language can stand in for the hosted TTS, e.g. when it fails over."""
+        return language_code in LOCAL_TTS_MODELS and _installed("torch", "transformers")
+
+    def _load(self, language_code: str):
+        with self._load_lock:
+            if language_code not in self._models:
+                import torch
+                from transformers import AutoTokenizer, VitsModel
+
+                name = LOCAL_TTS_MODELS[language_code]
+                logger.info(f"Loading local TTS model {name}")
+                tokenizer = AutoTokenizer.from_pretrained(name)
+                if getattr(tokenizer, "is_uroman", False):
+                    raise RuntimeError(f"{name} needs uroman romanization, which is not installed")
+                model = VitsModel.from_pretrained(name).eval()
+                model = torch.quantization.quantize_dynamic(model, {torch.nn.Linear}, dtype=torch.qint8)
+                self._models[language_code] = (tokenizer, model)
+        return self._models[language_code]
+
+    def synthesize_batch(self, texts: List[str], language_code: str) -> List[str]:
+        """Return base64 WAV audio for each text in `language_code`, in order."""
+        import torch
+
+        tokenizer, model = self._load(language_code)
+        inputs = tokenizer(texts, return_tensors="pt", padding=True)
+        with torch.inference_mode():
+            output = model(**inputs)
+        rate = model.config.sampling_rate
+        return [
+            wav_base64(output.waveform[i, :int(output.sequence_lengths[i])].numpy(), rate)
+            for i in range(len(texts))
+        ]
+
+
+local_stt = LocalSpeechToText()
+local_tts = LocalTextToSpeech()
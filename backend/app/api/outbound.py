@@ -0,0 +1,138 @@
+from typing import Awaitable, Callable, Deque, Dict, Optional
+from collections import deque
+import asyncio
+import logging
+import os
+import time
+
+from fastapi import WebSocket
+
+logger = logging.getLogger(__name__)
+
+# Per-connection outbound queue settings (overridable through the environment)
+SEND_QUEUE_SIZE = int(os.getenv("SEND_QUEUE_SIZE", "64"))
+SEND_TIMEOUT = float(os.getenv("SEND_TIMEOUT", "10"))  # Seconds before a stalled send counts as a dead client
+SLOW_CLIENT_POLICY = os.getenv("SLOW_CLIENT_POLICY", "drop_oldest")  # 'drop_oldest' or 'disconnect'
+
+
+class OutboundQueue:
+    """Bounded outbound queue and writer task for one WebSocket connection.
+
+    Producers never wait on the network: `put` only enqueues, and a dedicated writer
+    task drains the queue in order. A message replaces the queued one before it when both
+    share a coalesce key, so a slow client only sees the latest status update. When the
+    queue is full the policy either drops the oldest message or disconnects the client.
+    """
+
+    def __init__(self, websocket: WebSocket, client_id: str,
+                 on_dead: Optional[Callable[[str], Awaitable[None]]] = None,
+                 max_size: int = SEND_QUEUE_SIZE, policy: str = SLOW_CLIENT_POLICY,
+                 send_timeout: float = SEND_TIMEOUT):
+        self.websocket = websocket
+        self.client_id = client_id
+        self.max_size = max_size
+        self.policy = policy
+        self.send_timeout = send_timeout
+        self._on_dead = on_dead
+        # Entries are [message, coalesce_key, enqueued_at, on_sent]
+        self._queue: Deque[list] = deque()
+        self._ready = asyncio.Event()
+        self._closed = False
+        self._task = asyncio.create_task(self._writer())
+
+        self.sent = 0
+        self.dropped = 0
+        self.coalesced = 0
+        self.send_latency_total = 0.0
+        self.send_latency_max = 0.0
+
+    @property
+    def depth(self) -> int:
+        return len(self._queue)
+
+    def put(self, message: str | bytes, coalesce_key: Optional[str] = None,
+            on_sent: Optional[Callable[[], None]] = None) -> bool:
+        """Queue a message for sending. Returns False if it was not accepted.
+
+        `on_sent` is called after the message was written to the socket.
+        """
+        if self._closed:
+            return False
+
+        # Only the tail is replaced, so coalescing never reorders messages
+        if coalesce_key is not None and self._queue and self._queue[-1][1] == coalesce_key:
+            self._queue[-1][0] = message
+            self._queue[-1][3] = on_sent
+            self.coalesced += 1
+            return True
+
+        if len(self._queue) >= self.max_size:
+            if self.policy == "disconnect":
+                logger.warning(f"Outbound queue full for client {self.client_id}, disconnecting slow consumer")
+                asyncio.create_task(self._mark_dead())
+                return False
+            self._queue.popleft()
+            self.dropped += 1
+            logger.debug(f"Outbound queue full for client {self.client_id}, dropped oldest message")
+
+        self._queue.append([message, coalesce_key, time.perf_counter(), on_sent])
+        self._ready.set()
+        return True
+
+    async def _writer(self):
+        while True:
+            await self._ready.wait()
+            if not self._queue:
+                self._ready.clear()
+                continue
+            message, _, enqueued_at, on_sent = self._queue.popleft()
+            try:
+                if isinstance(message, bytes):
+                    await asyncio.wait_for(self.websocket.send_bytes(message), self.send_timeout)
+                else:
+                    await asyncio.wait_for(self.websocket.send_text(message), self.send_timeout)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.warning(f"Send to client {self.client_id} failed: {e!r}")
+                await self._mark_dead()
+                return
+            latency = time.perf_counter() - enqueued_at
+            self.sent += 1
+            self.send_latency_total += latency
+            self.send_latency_max = max(self.send_latency_max, latency)
+            if on_sent:
+                on_sent()
+
+    async def _mark_dead(self):
+        if self._closed:
+            return
+        self._closed = True
+        self.dropped += len(self._queue)
+        self._queue.clear()
+        if self._on_dead:
+            await self._on_dead(self.client_id)
+
+    async def close(self, flush_timeout: float = 0):
+        """Stop the writer task, optionally giving queued messages time to go out first."""
+        if flush_timeout and self._queue and not self._closed:
+            deadline = time.perf_counter() + flush_timeout
+            while self._queue and time.perf_counter() < deadline and not self._task.done():
+                await asyncio.sleep(0.01)
+        self._closed = True
+        if self._task is not asyncio.current_task():
+            self._task.cancel()
+            try:
+                await self._task
+            except (asyncio.CancelledError, Exception):
+                pass
+
+    def stats(self) -> Dict[str, float]:
+        return {
+            "depth": self.depth,
+            "sent": self.sent,
+            "dropped": self.dropped,
+            "coalesced": self.coalesced,
+            "send_latency_avg": self.send_latency_total / self.sent if self.sent else 0.0,
+            "send_latency_max": self.send_latency_max,
+        }
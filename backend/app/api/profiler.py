@@ -0,0 +1,158 @@
+from typing import Dict, Tuple
+import asyncio
+import logging
+import os
+import sys
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+# Limits that keep an on-demand profile cheap enough to run on a live worker
+PROFILER_MAX_SECONDS = float(os.getenv("PROFILER_MAX_SECONDS", "60"))
+PROFILER_MAX_HZ = float(os.getenv("PROFILER_MAX_HZ", "250"))
+PROFILER_MAX_DEPTH = 128
+
+APP_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# App functions that mark a pipeline stage; the innermost one on a stack names its stage
+STAGE_FUNCTIONS = {
+    "prepare_audio_data": "audio_prep",
+    "save_audio_file": "audio_save",
+    "transcribe_batch": "stt",
+    "sarvam_speech_to_text": "stt",
+    "process_input_and_generate_url": "agent",
+    "sarvam_translate": "translate",
+    "synthesize_batch": "tts",
+    "sarvam_text_to_speech_batch": "tts",
+    "merge_wav_base64": "tts",
+    "encode_payload": "json_encode",
+    "health_check": "health_check",
+    "render_metrics": "metrics",
+}
+# Library code that is a stage of its own wherever it is called from
+STAGE_LIBRARIES = [
+    (os.path.join("json", "encoder.py"), "json_encode"),
+    (os.path.join("json", "decoder.py"), "json_decode"),
+    ("sqlalchemy" + os.sep, "db"),
+    ("pydub" + os.sep, "audio_prep"),
+]
+# Leaf functions of threads that are waiting rather than running
+IDLE_FUNCTIONS = {"select", "poll", "wait", "_worker", "readinto", "recv_into", "accept", "sleep", "_wait_for_tstate_lock"}
+
+
+class SamplingProfiler:
+    """Low-overhead statistical profiler for a live worker.
+
+    A sampler thread reads every thread's current Python stack with
+    `sys._current_frames()` at a fixed rate and counts identical stacks, giving output
+    in the collapsed format that flamegraph.pl and speedscope read. Nothing is hooked
+    into the interpreter, so code runs at full speed between samples and nothing at all
+    happens when no profile is running. Each stack is rooted at the pipeline stage it
+    belongs to, e.g. `stage:agent` or `stage:json_encode`, and then the thread name.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()  # Only one profile runs at a time
+        self._labels: Dict[object, str] = {}
+
+    @property
+    def busy(self) -> bool:
+        return self._lock.locked()
+
+    def _label(self, code) -> str:
+        label = self._labels.get(code)
+        if label is None:
+            filename = code.co_filename
+            if filename.startswith(APP_DIR):
+                filename = "app" + filename[len(APP_DIR):]
+            else:
+                filename = os.path.basename(filename)
+            label = self._labels[code] = f"{code.co_name} ({filename})"
+        return label
+
+    def _stage(self, codes) -> str:
+        for code in reversed(codes):  # Innermost first
+            filename = code.co_filename
+            if filename.startswith(APP_DIR) and code.co_name in STAGE_FUNCTIONS:
+                return STAGE_FUNCTIONS[code.co_name]
+            for fragment, stage in STAGE_LIBRARIES:
+                if fragment in filename:
+                    return stage
+        return "other"
+
+    def _sample(self, counts: Dict[Tuple[str, ...], int], stages: Dict[str, int],
+                thread_names: Dict[int, str], include_idle: bool):
+        me = threading.get_ident()
+        for thread_id, frame in sys._current_frames().items():
+            if thread_id == me:
+                continue
+            codes = []
+            while frame is not None and len(codes) < PROFILER_MAX_DEPTH:
+                codes.append(frame.f_code)
+                frame = frame.f_back
+            if not codes:
+                continue
+            codes.reverse()  # Outermost first
+            if not include_idle and codes[-1].co_name in IDLE_FUNCTIONS:
+                continue
+            stage = self._stage(codes)
+            key = (f"stage:{stage}", thread_names.get(thread_id, f"thread-{thread_id}"),
+                   *(self._label(code) for code in codes))
+            counts[key] = counts.get(key, 0) + 1
+            stages[stage] = stages.get(stage, 0) + 1
+
+    def run(self, seconds: float, hz: float, include_idle: bool = False) -> dict:
+        """Sample all threads for `seconds` at `hz` and return the collapsed stacks."""
+        if not self._lock.acquire(blocking=False):
+            raise RuntimeError("A profile is already running")
+        try:
+            seconds = min(seconds, PROFILER_MAX_SECONDS)
+            interval = 1 / min(hz, PROFILER_MAX_HZ)
+            counts: Dict[Tuple[str, ...], int] = {}
+            stages: Dict[str, int] = {}
+            samples = 0
+            started = time.perf_counter()
+            deadline = started + seconds
+            next_sample = started
+            while next_sample < deadline:
+                thread_names = {thread.ident: thread.name for thread in threading.enumerate()}
+                self._sample(counts, stages, thread_names, include_idle)
+                samples += 1
+                next_sample += interval
+                delay = next_sample - time.perf_counter()
+                if delay > 0:
+                    time.sleep(delay)
+            elapsed = time.perf_counter() - started
+            collapsed = "\n".join(f"{';'.join(stack)} {count}" for stack, count in
+                                  sorted(counts.items(), key=lambda item: -item[1]))
+            return {
+                "seconds": round(elapsed, 3),
+                "samples": samples,
+                "interval_ms": round(interval * 1000, 3),
+                "stages": dict(sorted(stages.items(), key=lambda item: -item[1])),
+                "collapsed": collapsed + "\n" if collapsed else "",
+            }
+        finally:
+            self._lock.release()
+            self._labels.clear()
+
+    async def profile(self, seconds: float, hz: float, include_idle: bool = False) -> dict:
+        """Run a profile on its own thread, so no worker of the shared pool is held for its duration."""
+        if self.busy:
+            raise RuntimeError("A profile is already running")
+        loop = asyncio.get_running_loop()
+        done: asyncio.Future = loop.create_future()
+
+        def target():
+            try:
+                result = self.run(seconds, hz, include_idle)
+                loop.call_soon_threadsafe(lambda: done.done() or done.set_result(result))
+            except Exception as e:
+                loop.call_soon_threadsafe(lambda: done.done() or done.set_exception(e))
+
+        threading.Thread(target=target, name="kisanly-profiler", daemon=True).start()
+        return await done
+
+
+profiler = SamplingProfiler()
@@ -0,0 +1,247 @@
+from string import Formatter
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+import json
+import logging
+import re
+
+logger = logging.getLogger(__name__)
+
+
+class PromptTemplate:
+    """A prompt with `{name}` slots, written like a format string but parsed only once.
+
+    The text is split into literal pieces around the slots up front, so rendering just
+    joins strings. `bind` fills some slots ahead of time, e.g. the field list of each
+    form, and returns a template with the remaining ones. Values are inserted verbatim:
+    braces in user input are never interpreted.
+    """
+
+    def __init__(self, text: str):
+        parts: List[Tuple[str, Optional[str]]] = []
+        for literal, name, spec, conversion in Formatter().parse(text):
+            if spec or conversion:
+                raise ValueError(f"Prompt slot {name!r} must not have a format spec or conversion")
+            parts.append((literal, name))
+        self._compile(parts)
+
+    def _compile(self, parts: List[Tuple[str, Optional[str]]]):
+        # Merge the parts into a leading literal, then (slot, literal that follows it) pairs
+        self._head = ""
+        tail: List[List[str]] = []
+        for literal, name in parts:
+            if tail:
+                tail[-1][1] += literal
+            else:
+                self._head += literal
+            if name is not None:
+                tail.append([name, ""])
+        self._tail = tuple((name, literal) for name, literal in tail)
+        self.slots = frozenset(name for name, _ in self._tail)
+
+    def bind(self, **values: Any) -> "PromptTemplate":
+        parts: List[Tuple[str, Optional[str]]] = [(self._head, None)]
+        for name, literal in self._tail:
+            if name in values:
+                parts.append((str(values[name]) + literal, None))
+            else:
+                parts.append(("", name))
+                parts.append((literal, None))
+        template = PromptTemplate.__new__(PromptTemplate)
+        template._compile(parts)
+        return template
+
+    def render(self, **values: str) -> str:
+        """The prompt with every slot filled; values must be strings."""
+        pieces = [self._head]
+        for name, literal in self._tail:
+            pieces.append(values[name])
+            pieces.append(literal)
+        return "".join(pieces)
+
+
+def quoted_fields(fields: Iterable[Tuple[str, str]]) -> str:
+    """The `"name", "category", ...` list of form keys used in extraction prompts."""
+    return ", ".join(f'"{key}"' for key, _ in fields)
+
+
+INTENT_PROMPT = """
+You are an intent classifier for an agricultural marketplace app.
+Analyze the user message and classify it as exactly ONE of these intents:
+
+1. "product" - When the user wants to add or create a new product listing
+   Examples:
+   - "I want to add a new product"
+   - "I need to list my wheat crop for sale"
+   - "Let me create a product entry for my rice harvest"
+
+2. "post" - When the user wants to create a social post using an existing product
+   Examples:
+   - "I want to post about my existing product"
+   - "I need to advertise the cotton I already listed"
+   - "Help me create a post for my listed mangoes"
+
+Return ONLY the word "product" or "post" without any additional text.
+"""
+
+# Entity extraction for a form. Only the form fills its slots, so once bound the system
+# prompt is identical on every turn of the form and the provider can cache it as a prefix.
+# The parts that change per turn follow it in later messages.
+EXTRACTION_PROMPT = PromptTemplate("""
+You are an entity extraction model for an agricultural marketplace app.
+The user wants to add a {intent}.
+
+For {intent}s, extract the following fields if they are present in the user's message:
+{fields}
+
+Format your response as a JSON object with these field names as keys and the extracted values.
+Only include fields that you are confident are mentioned in the message.
+If a field is not mentioned, do not include it in the JSON.
+""")
+
+# Follows the extraction prompt when the user is answering a form question
+AWAITED_FIELD_PROMPT = PromptTemplate(
+    'The user is answering the question for "{awaited}". Be especially careful to extract "{awaited}" if present.')
+
+SUMMARY_PROMPT = PromptTemplate("""
+You are an assistant for an agricultural marketplace app.
+Summarize the {intent} the user has just described in two or three short, plain sentences.
+Mention every detail below and do not add anything that is not listed.
+""")
+
+HEALTH_CHECK_PROMPT = PromptTemplate("""Evaluate if the product '{product_name}' is safe and beneficial for a person with the following health conditions: {diseases}.
+
+            Respond with:
+            1. A determination of 'pass' if the product is generally safe and potentially beneficial, or 'fail' if it could be detrimental.
+            2. A brief explanation of why the product is beneficial or potentially harmful given these health conditions.
+            
+            Format your response as a JSON object with two fields: 'flag' (either 'pass' or 'fail') and 'comments' (explanation).
+            
+            Be sensitive, even if moderation is required give the flag as fail and mention the reason in comments.
+
+            Example response format:
+            {{
+                "flag": "pass",
+                "comments": "This product is safe and may be beneficial because..."
+            }}
+            
+            Only provide the JSON object, no other text not even the <think> tags.
+            """)
+
+
+# Tokens the JSON scanner stops at: reasoning tags, string escapes, quotes and braces
+_JSON_TOKENS = re.compile(r'<think>|\\.|["{}]', re.DOTALL)
+_THINK_END = "</think>"
+_decoder = json.JSONDecoder()
+
+
+def extract_json_object(text: Optional[str]) -> Optional[dict]:
+    """The first JSON object in an LLM response, ignoring `<think>...</think>` blocks.
+
+    Linear time: when the first candidate is not valid JSON, one pass tracks balanced
+    braces outside of JSON strings, and every later candidate is decoded at most once.
+    Text around the object, such as an explanation or a Markdown code fence, is
+    ignored. Returns None if there is no decodable object.
+    """
+    if not text:
+        return None
+    # Fast path: the first brace outside <think> blocks usually starts the object, which
+    # the C decoder reads on its own
+    position = 0
+    while True:
+        brace = text.find("{", position)
+        if brace == -1:
+            return None
+        think = text.find("<think>", position, brace)
+        end = text.find(_THINK_END, think) if think != -1 else -1
+        if end == -1:  # An unclosed block is left as text, like a truncated reply
+            break
+        position = end + len(_THINK_END)
+    try:
+        value, _ = _decoder.raw_decode(text, brace)
+        if isinstance(value, dict):
+            return value
+    except (ValueError, RecursionError):
+        pass
+    return _scan_json_object(text, brace)
+
+
+def _scan_json_object(text: str, position: int) -> Optional[dict]:
+    search = _JSON_TOKENS.search
+    depth, start, in_string = 0, -1, False
+    while True:
+        match = search(text, position)
+        if match is None:
+            return None
+        token = match.group()
+        position = match.end()
+        if in_string:
+            if token == '"':
+                in_string = False
+        elif token == "<think>":
+            if depth == 0:
+                end = text.find(_THINK_END, position)
+                if end != -1:  # An unclosed block is left as text, like a truncated reply
+                    position = end + len(_THINK_END)
+        elif token == '"':
+            in_string = depth > 0
+        elif token == "{":
+            if depth == 0:
+                start = match.start()
+            depth += 1
+        elif token == "}" and depth:
+            depth -= 1
+            if depth == 0:
+                try:
+                    value, _ = _decoder.raw_decode(text[start:position])
+                except (ValueError, RecursionError):
+                    continue  # Not JSON after all; keep looking after it
+                if isinstance(value, dict):
+                    return value
+
+
+class EntitySchema:
+    """The entities an extraction may return for one form.
+
+    Keys that are not form fields, and values that are empty or not scalars, are
+    dropped, so a sloppy extraction never puts nested objects into the form data.
+    """
+
+    def __init__(self, fields: Iterable[Tuple[str, str]]):
+        self.keys = tuple(key for key, _ in fields)
+        self._keys = frozenset(self.keys)
+
+    def validate(self, value: Optional[dict]) -> Optional[Dict[str, Any]]:
+        if value is None:
+            return None
+        entities = {}
+        for key, field_value in value.items():
+            if key not in self._keys:
+                logger.debug(f"Dropping unknown extracted field {key!r}")
+                continue
+            if isinstance(field_value, bool) or not isinstance(field_value, (str, int, float)):
+                continue
+            if isinstance(field_value, str):
+                field_value = field_value.strip()
+            if field_value:
+                entities[key] = field_value
+        return entities
+
+    def parse(self, text: Optional[str]) -> Optional[Dict[str, Any]]:
+        """The valid entities in an extraction response, or None if it has no JSON object."""
+        return self.validate(extract_json_object(text))
+
+
+HEALTH_FLAGS = ("pass", "fail")
+
+
+def parse_health_assessment(text: Optional[str]) -> Optional[Dict[str, str]]:
+    """`{"flag": "pass"|"fail", "comments": str}` from a health-check response.
+
+    Returns None when the response has no JSON object or lacks either field. An
+    unexpected flag is read as "pass", as the health check always has.
+    """
+    value = extract_json_object(text)
+    if value is None or "flag" not in value or "comments" not in value:
+        return None
+    flag = str(value["flag"]).strip().lower()
+    return {"flag": flag if flag in HEALTH_FLAGS else "pass", "comments": str(value["comments"])}
@@ -0,0 +1,336 @@
+from concurrent.futures import FIRST_COMPLETED, wait
+from typing import Awaitable, Callable, Dict, Optional, Tuple, TypeVar
+from collections import deque
+import asyncio
+import logging
+import os
+import threading
+import time
+
+from .executors import BoundedExecutor, ExecutorSaturated
+from .metrics import Counter, GaugeFunc, Histogram, PROVIDER_REQUESTS, PROVIDER_RETRIES
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+# Deadline for a whole provider call, including hedges and retries, by "provider.operation" or provider
+PROVIDER_DEADLINES = {
+    "sarvam.stt": float(os.getenv("SARVAM_STT_DEADLINE_SECONDS", "20")),
+    "sarvam.tts": float(os.getenv("SARVAM_TTS_DEADLINE_SECONDS", "15")),
+    "sarvam.translate": float(os.getenv("SARVAM_TRANSLATE_DEADLINE_SECONDS", "8")),
+    "groq": float(os.getenv("GROQ_DEADLINE_SECONDS", "30")),
+}
+DEFAULT_DEADLINE_SECONDS = 30.0
+
+# Hedging: send a duplicate request when the first is slower than the recent p95
+HEDGE_ENABLED = os.getenv("HEDGE_ENABLED", "true").lower() in ("1", "true", "yes")
+HEDGE_QUANTILE = float(os.getenv("HEDGE_QUANTILE", "0.95"))
+HEDGE_MIN_DELAY_MS = float(os.getenv("HEDGE_MIN_DELAY_MS", "200"))
+HEDGE_MIN_SAMPLES = int(os.getenv("HEDGE_MIN_SAMPLES", "20"))  # Latencies needed before hedging starts
+HEDGE_BUDGET_RATIO = float(os.getenv("HEDGE_BUDGET_RATIO", "0.1"))  # At most this share of calls is hedged
+LATENCY_WINDOW = 200
+
+# Retries of calls that failed quickly, while the deadline allows
+PROVIDER_MAX_RETRIES = int(os.getenv("PROVIDER_MAX_RETRIES", "1"))
+
+# Circuit breaker: fail fast after consecutive failures, probe again after the reset time
+BREAKER_FAILURE_THRESHOLD = int(os.getenv("BREAKER_FAILURE_THRESHOLD", "5"))
+BREAKER_RESET_SECONDS = float(os.getenv("BREAKER_RESET_SECONDS", "30"))
+
+# Threads that run blocking provider calls made from worker threads (the LLM agent), hedges included
+PROVIDER_SYNC_WORKERS = int(os.getenv("PROVIDER_SYNC_WORKERS", "32"))
+
+PROVIDER_LATENCY_SECONDS = Histogram(
+    "kisanly_provider_latency_seconds", "Latency of successful provider calls, hedges included.",
+    ["provider", "operation"])
+PROVIDER_HEDGES = Counter(
+    "kisanly_provider_hedges_total", "Duplicate requests sent to providers, by whether the duplicate won.",
+    ["provider", "operation", "outcome"])
+PROVIDER_FAILOVERS = Counter(
+    "kisanly_provider_failovers_total", "Requests served by a fallback provider, or left without one.",
+    ["stage", "provider"])
+
+
+class CircuitOpen(Exception):
+    """The provider is failing; the call was rejected without being sent."""
+
+
+class ProviderTimeout(Exception):
+    """The provider did not answer before the call's deadline."""
+
+
+class ProviderError(Exception):
+    """The provider answered with a retryable error, e.g. HTTP 5xx or 429."""
+
+
+class CircuitBreaker:
+    """Opens after `failure_threshold` consecutive failures and rejects calls for `reset_seconds`.
+
+    After that a single probe call is let through (half-open): its success closes the
+    breaker, its failure opens it again.
+    """
+
+    CLOSED, HALF_OPEN, OPEN = 0, 1, 2
+
+    def __init__(self, name: str, failure_threshold: int = BREAKER_FAILURE_THRESHOLD,
+                 reset_seconds: float = BREAKER_RESET_SECONDS):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.reset_seconds = reset_seconds
+        self.state = self.CLOSED
+        self.failures = 0
+        self._opened_at = 0.0
+        self._probing = False
+        self._lock = threading.Lock()  # Calls finish on the event loop and in worker threads
+
+    def allow(self) -> bool:
+        with self._lock:
+            if self.state == self.CLOSED:
+                return True
+            if self.state == self.OPEN and time.monotonic() - self._opened_at >= self.reset_seconds:
+                self.state = self.HALF_OPEN
+                self._probing = False
+            if self.state == self.HALF_OPEN and not self._probing:
+                self._probing = True
+                return True
+            return False
+
+    def abandon(self):
+        """Forget a probe whose call was cancelled before it finished, so another can be sent."""
+        with self._lock:
+            self._probing = False
+
+    def record(self, ok: bool):
+        with self._lock:
+            if ok:
+                if self.state != self.CLOSED:
+                    logger.info(f"Circuit {self.name} closed")
+                self.state, self.failures, self._probing = self.CLOSED, 0, False
+                return
+            self.failures += 1
+            if self.state == self.HALF_OPEN or self.failures >= self.failure_threshold:
+                if self.state != self.OPEN:
+                    logger.warning(f"Circuit {self.name} opened after {self.failures} consecutive failures")
+                self.state, self._opened_at, self._probing = self.OPEN, time.monotonic(), False
+
+
+class ProviderGuard:
+    """Deadline, hedging, retries and a circuit breaker for one provider operation.
+
+    A call is rejected at once while the breaker is open. Otherwise the first attempt is
+    sent and, if it has not answered by the recent p95 latency, a duplicate is sent as
+    well (within a budget of `HEDGE_BUDGET_RATIO` of all calls); the first success wins
+    and the other attempt is abandoned. An attempt that fails is retried up to
+    `PROVIDER_MAX_RETRIES` times, and the whole call gives up at its deadline. Attempts
+    must therefore be idempotent, and raise on failure. An attempt refused by a full
+    executor (`ExecutorSaturated`) is neither retried nor counted against the provider;
+    the call raises it unless another attempt is still running.
+    """
+
+    def __init__(self, provider: str, operation: str, deadline: float):
+        self.provider = provider
+        self.operation = operation
+        self.deadline = deadline
+        self.breaker = CircuitBreaker(f"{provider}.{operation}")
+        self._latencies: deque = deque(maxlen=LATENCY_WINDOW)
+        self._calls = 0
+        self._hedges = 0
+        # Attempts finish on worker threads, so the counters and latencies are shared
+        self._lock = threading.Lock()
+
+    def hedge_delay(self) -> Optional[float]:
+        """Seconds after which a duplicate request is sent, or None while hedging is off or unaffordable."""
+        if not HEDGE_ENABLED:
+            return None
+        with self._lock:
+            if len(self._latencies) < HEDGE_MIN_SAMPLES or self._hedges >= HEDGE_BUDGET_RATIO * self._calls:
+                return None
+            latencies = list(self._latencies)
+        latencies.sort()
+        quantile = latencies[min(len(latencies) - 1, int(HEDGE_QUANTILE * len(latencies)))]
+        return max(quantile, HEDGE_MIN_DELAY_MS / 1000)
+
+    def _admit(self):
+        if not self.breaker.allow():
+            PROVIDER_REQUESTS.inc(provider=self.provider, operation=self.operation, outcome="circuit_open")
+            raise CircuitOpen(f"{self.provider} {self.operation} is failing; circuit open")
+        with self._lock:
+            self._calls += 1
+
+    def _succeeded(self, started: float, result, ok: Optional[Callable]) -> None:
+        elapsed = time.perf_counter() - started
+        with self._lock:
+            self._latencies.append(elapsed)
+        self.breaker.record(True)
+        PROVIDER_LATENCY_SECONDS.observe(elapsed, provider=self.provider, operation=self.operation)
+        outcome = "ok" if ok is None or ok(result) else "error"
+        PROVIDER_REQUESTS.inc(provider=self.provider, operation=self.operation, outcome=outcome)
+
+    def _failed(self, outcome: str):
+        self.breaker.record(False)
+        PROVIDER_REQUESTS.inc(provider=self.provider, operation=self.operation, outcome=outcome)
+
+    def _saturated(self):
+        # Our own executor was full, so nothing reached the provider: the breaker is not told
+        self.breaker.abandon()
+        PROVIDER_REQUESTS.inc(provider=self.provider, operation=self.operation, outcome="saturated")
+
+    def _hedged(self, hedge, winner):
+        if hedge is not None:
+            outcome = "won" if winner is hedge else "lost"
+            PROVIDER_HEDGES.inc(provider=self.provider, operation=self.operation, outcome=outcome)
+
+    def _hedge(self) -> None:
+        with self._lock:
+            self._hedges += 1
+
+    def _retry(self) -> None:
+        PROVIDER_RETRIES.inc(provider=self.provider, operation=self.operation)
+
+    async def call(self, attempt: Callable[[], Awaitable[T]], ok: Optional[Callable[[T], bool]] = None,
+                   hedge: bool = True, retries: int = PROVIDER_MAX_RETRIES) -> T:
+        """Run `attempt` (a coroutine factory) under this guard; `ok` tells good results from error results."""
+        self._admit()
+        started = time.perf_counter()
+        deadline = started + self.deadline
+        hedge_at = self.hedge_delay() if hedge else None
+        hedge_task = None
+        tasks = {asyncio.create_task(attempt())}
+        error: Optional[BaseException] = None
+        saturated: Optional[ExecutorSaturated] = None
+        try:
+            while tasks:
+                now = time.perf_counter()
+                timeout = deadline - now
+                if hedge_at is not None and hedge_task is None:
+                    timeout = min(timeout, started + hedge_at - now)
+                done, tasks = await asyncio.wait(tasks, timeout=max(timeout, 0), return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task.exception() is None:
+                        self._hedged(hedge_task, task)
+                        self._succeeded(started, task.result(), ok)
+                        return task.result()
+                    if isinstance(task.exception(), ExecutorSaturated):
+                        saturated = task.exception()
+                    else:
+                        error = task.exception()
+                now = time.perf_counter()
+                if now >= deadline:
+                    break
+                if tasks and hedge_at is not None and hedge_task is None and now >= started + hedge_at:
+                    self._hedge()
+                    hedge_task = asyncio.create_task(attempt())
+                    tasks.add(hedge_task)
+                elif not tasks and retries > 0 and saturated is None:
+                    retries -= 1
+                    self._retry()
+                    tasks.add(asyncio.create_task(attempt()))
+        except asyncio.CancelledError:
+            self.breaker.abandon()  # E.g. the turn was superseded; that says nothing about the provider
+            raise
+        finally:
+            for task in tasks:
+                task.cancel()
+        if not tasks and error is None and saturated is not None:
+            self._saturated()
+            raise saturated
+        if tasks or error is None:
+            self._failed("timeout")
+            raise ProviderTimeout(f"{self.provider} {self.operation} timed out after {self.deadline:g}s")
+        self._failed("error")
+        raise error
+
+    def call_sync(self, attempt: Callable[[], T], ok: Optional[Callable[[T], bool]] = None,
+                  hedge: bool = True, retries: int = PROVIDER_MAX_RETRIES) -> T:
+        """Like `call`, for blocking attempts made from a worker thread."""
+        self._admit()
+        started = time.perf_counter()
+        deadline = started + self.deadline
+        hedge_at = self.hedge_delay() if hedge else None
+        hedge_future = None
+        futures = {_submit(attempt)}
+        error: Optional[BaseException] = None
+        saturated: Optional[ExecutorSaturated] = None
+        try:
+            while futures:
+                now = time.perf_counter()
+                timeout = deadline - now
+                if hedge_at is not None and hedge_future is None:
+                    timeout = min(timeout, started + hedge_at - now)
+                done, futures = wait(futures, timeout=max(timeout, 0), return_when=FIRST_COMPLETED)
+                for future in done:
+                    if future.exception() is None:
+                        self._hedged(hedge_future, future)
+                        self._succeeded(started, future.result(), ok)
+                        return future.result()
+                    if isinstance(future.exception(), ExecutorSaturated):
+                        saturated = future.exception()
+                    else:
+                        error = future.exception()
+                now = time.perf_counter()
+                if now >= deadline:
+                    break
+                if futures and hedge_at is not None and hedge_future is None and now >= started + hedge_at:
+                    self._hedge()
+                    hedge_future = _submit(attempt)
+                    futures.add(hedge_future)
+                elif not futures and retries > 0 and saturated is None:
+                    retries -= 1
+                    self._retry()
+                    futures.add(_submit(attempt))
+        finally:
+            for future in futures:
+                future.cancel()  # Attempts already running finish on their own, bounded by their client timeout
+        if not futures and error is None and saturated is not None:
+            self._saturated()
+            raise saturated
+        if futures or error is None:
+            self._failed("timeout")
+            raise ProviderTimeout(f"{self.provider} {self.operation} timed out after {self.deadline:g}s")
+        self._failed("error")
+        raise error
+
+
+# Kept apart from the network executor: the agent's workflow runs there and waits on these
+# attempts, so sharing threads could deadlock. Unbounded, as the guard's deadline bounds the wait.
+_sync_executor = BoundedExecutor("llm", PROVIDER_SYNC_WORKERS)
+
+
+def _submit(attempt: Callable[[], T]):
+    # Each attempt runs in its own copy of the caller's context, so it still sees the current turn
+    return _sync_executor.submit(attempt)
+
+
+_guards: Dict[Tuple[str, str], ProviderGuard] = {}
+_guards_lock = threading.Lock()
+
+
+def provider_deadline(provider: str, operation: str) -> float:
+    return PROVIDER_DEADLINES.get(f"{provider}.{operation}", PROVIDER_DEADLINES.get(provider, DEFAULT_DEADLINE_SECONDS))
+
+
+def provider_guard(provider: str, operation: str) -> ProviderGuard:
+    """The shared guard for one provider operation, e.g. ("sarvam", "tts")."""
+    guard = _guards.get((provider, operation))
+    if guard is None:
+        with _guards_lock:
+            guard = _guards.setdefault((provider, operation),
+                                       ProviderGuard(provider, operation, provider_deadline(provider, operation)))
+    return guard
+
+
+def failover_order(value: str) -> list:
+    """Parse a failover order such as "sarvam,local,text"; everything after "text" is ignored."""
+    order = []
+    for name in (part.strip() for part in value.split(",")):
+        if name == "text":
+            break
+        if name and name not in order:
+            order.append(name)
+    return order
+
+
+GaugeFunc("kisanly_provider_circuit_state", "Circuit breaker state per provider operation (0 closed, 1 half-open, 2 open).",
+          lambda: {(guard.provider, guard.operation): guard.breaker.state for guard in list(_guards.values())},
+          ["provider", "operation"])
@@ -0,0 +1,95 @@
+from typing import Any, Awaitable, Callable, Hashable, Optional, Tuple
+from collections import OrderedDict
+import asyncio
+import contextvars
+import logging
+import os
+import time
+
+from .metrics import Counter
+
+logger = logging.getLogger(__name__)
+
+# Speculative rendering of the next form question (off by default: misses cost provider calls)
+SPECULATIVE_TTS = os.getenv("SPECULATIVE_TTS", "false").lower() in ("1", "true", "yes")
+SPECULATIVE_MAX_CONCURRENT = int(os.getenv("SPECULATIVE_MAX_CONCURRENT", "16"))
+SPECULATIVE_TTL_SECONDS = float(os.getenv("SPECULATIVE_TTL_SECONDS", "300"))
+SPECULATIVE_MAX_SESSIONS = int(os.getenv("SPECULATIVE_MAX_SESSIONS", "10000"))
+
+SPECULATIONS = Counter(
+    "kisanly_speculative_renders_total",
+    "Speculative renders by outcome (started, skipped, hit, miss, expired, failed).", ["outcome"])
+
+
+class SpeculativeSlots:
+    """One speculative result per session, computed ahead of the turn that needs it.
+
+    `start` renders something the session will probably ask for next in a background
+    task, replacing any earlier speculation for the session. `take` returns the result
+    when the next turn asks for the same key, waiting for it if it is still running,
+    and discards it otherwise. Speculation is best effort: when `max_concurrent` renders
+    are already running, new ones are skipped rather than queued, so they never hold
+    up real turns.
+    """
+
+    def __init__(self, max_concurrent: int = SPECULATIVE_MAX_CONCURRENT,
+                 ttl_seconds: float = SPECULATIVE_TTL_SECONDS, max_sessions: int = SPECULATIVE_MAX_SESSIONS):
+        self.max_concurrent = max_concurrent
+        self.ttl = ttl_seconds
+        self.max_sessions = max_sessions
+        self._slots: "OrderedDict[str, Tuple[Hashable, asyncio.Task, float]]" = OrderedDict()
+        self._running = 0
+
+    def __len__(self) -> int:
+        return len(self._slots)
+
+    def start(self, session_id: str, key: Hashable, render: Callable[[], Awaitable[Any]]):
+        """Begin rendering the result for `key` in the background."""
+        self.discard(session_id)
+        if self._running >= self.max_concurrent:
+            SPECULATIONS.inc(outcome="skipped")
+            return
+        self._running += 1
+        # Not part of the current turn: a fresh context keeps its spans out of the turn's trace
+        task = contextvars.Context().run(asyncio.create_task, render())
+        task.add_done_callback(self._finished)
+        self._slots[session_id] = (key, task, time.monotonic())
+        while len(self._slots) > self.max_sessions:
+            _, (_, oldest, _) = self._slots.popitem(last=False)
+            oldest.cancel()
+        SPECULATIONS.inc(outcome="started")
+
+    def _finished(self, task: asyncio.Task):
+        self._running -= 1
+        if not task.cancelled() and task.exception() is not None:
+            SPECULATIONS.inc(outcome="failed")
+            logger.warning(f"Speculative render failed: {task.exception()}")
+
+    async def take(self, session_id: str, key: Hashable) -> Optional[Any]:
+        """Return the speculative result for `key`, or None if there is no usable one."""
+        slot = self._slots.pop(session_id, None)
+        if slot is None:
+            return None
+        slot_key, task, started = slot
+        if slot_key != key:
+            task.cancel()
+            SPECULATIONS.inc(outcome="miss")
+            return None
+        if time.monotonic() - started > self.ttl:
+            task.cancel()
+            SPECULATIONS.inc(outcome="expired")
+            return None
+        try:
+            result = await task
+        except Exception:
+            return None  # Counted as failed when the task finished
+        SPECULATIONS.inc(outcome="hit")
+        return result
+
+    def discard(self, session_id: str):
+        slot = self._slots.pop(session_id, None)
+        if slot is not None:
+            slot[1].cancel()
+
+
+speculative_slots = SpeculativeSlots()
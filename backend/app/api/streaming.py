@@ -0,0 +1,184 @@
+from typing import Awaitable, Callable, List, Optional, Tuple
+import asyncio
+import base64
+import io
+import logging
+import os
+import re
+import wave
+
+logger = logging.getLogger(__name__)
+
+# Sentences shorter than this are merged with the next one before translation and TTS
+STREAM_MIN_SENTENCE_CHARS = int(os.getenv("STREAM_MIN_SENTENCE_CHARS", "24"))
+
+# End of a sentence: terminal punctuation (including the Devanagari danda) followed by
+# whitespace, or a line break. Requiring the whitespace keeps "12.5" and URLs intact.
+SENTENCE_END = re.compile(r"[.!?।॥]+[\"')\]]*\s+|\n+")
+
+
+class SentenceSplitter:
+    """Cuts streamed text into complete sentences as soon as they close."""
+
+    def __init__(self, min_chars: int = STREAM_MIN_SENTENCE_CHARS):
+        self.min_chars = min_chars
+        self._buffer = ""
+        self._scanned = 0  # Buffer length at the last scan
+
+    def feed(self, text: str) -> List[str]:
+        """Add streamed text and return the sentences it completed."""
+        self._buffer += text
+        sentences = []
+        # Back up a little, so a terminator whose whitespace just arrived is found
+        position = max(self._scanned - 8, 0)
+        while True:
+            match = SENTENCE_END.search(self._buffer, position)
+            if not match:
+                break
+            candidate = self._buffer[:match.end()]
+            if len(candidate.strip()) >= self.min_chars:
+                sentences.append(candidate.strip())
+                self._buffer = self._buffer[match.end():]
+                position = 0
+            else:
+                position = match.end()
+        self._scanned = len(self._buffer)
+        return sentences
+
+    def flush(self) -> Optional[str]:
+        """Return whatever text is left once the stream has ended."""
+        rest, self._buffer, self._scanned = self._buffer.strip(), "", 0
+        return rest or None
+
+
+def _wav_format(params) -> Tuple[int, int, int]:
+    return params.nchannels, params.sampwidth, params.framerate
+
+
+def _convert_frames(frames: bytes, source, target) -> bytes:
+    from pydub import AudioSegment
+
+    segment = AudioSegment(data=frames, sample_width=source.sampwidth, frame_rate=source.framerate,
+                           channels=source.nchannels)
+    return (segment.set_channels(target.nchannels).set_sample_width(target.sampwidth)
+            .set_frame_rate(target.framerate).raw_data)
+
+
+def merge_wav_base64(chunks: List[str]) -> Optional[str]:
+    """Concatenate base64 WAV clips into one clip in the format of the first.
+
+    Clips may come from different voices, e.g. Sarvam at 8 kHz and the local model at
+    16 kHz after a failover, so clips in another format are converted before they are
+    appended; raw frames of the wrong rate would play at the wrong speed.
+    """
+    if not chunks:
+        return None
+    if len(chunks) == 1:
+        return chunks[0]
+    output = io.BytesIO()
+    with wave.open(output, "wb") as merged:
+        target = None
+        for chunk in chunks:
+            with wave.open(io.BytesIO(base64.b64decode(chunk)), "rb") as clip:
+                params = clip.getparams()
+                frames = clip.readframes(clip.getnframes())
+            if target is None:
+                target = params
+                merged.setparams(params)
+            elif _wav_format(params) != _wav_format(target):
+                frames = _convert_frames(frames, params, target)
+            merged.writeframes(frames)
+    return base64.b64encode(output.getvalue()).decode("ascii")
+
+
+class ReplyStream:
+    """Forwards a reply to the client while the LLM is still writing it.
+
+    The text so far is sent as `partial_text` frames; frames share a coalesce key, so a
+    slow client skips straight to the latest text. Each sentence is handed to `render`
+    (translation and TTS) as soon as it closes, and the rendered sentences are sent as
+    `partial_audio` frames in order while later ones are still being generated.
+    """
+
+    def __init__(self, send: Callable[..., Awaitable[bool]]):
+        self.send = send
+        self.render: Optional[Callable[[str], Awaitable[Tuple[str, Optional[str]]]]] = None
+        self.text = ""
+        self.splitter = SentenceSplitter()
+        self.results: List[Tuple[str, Optional[str]]] = []
+        self._loop = asyncio.get_running_loop()
+        self._rendering: asyncio.Queue = asyncio.Queue()
+        self._sender: Optional[asyncio.Task] = None
+        self._text_task: Optional[asyncio.Task] = None
+        self._renders: List[asyncio.Task] = []
+
+    @property
+    def started(self) -> bool:
+        return bool(self.text)
+
+    def token_callback(self, render: Callable[[str], Awaitable[Tuple[str, Optional[str]]]]) -> Callable[[str], None]:
+        """Return the token callback for an LLM call running in a worker thread."""
+        self.render = render
+        return lambda token: self._loop.call_soon_threadsafe(self.push, token)
+
+    def push(self, token: str):
+        if not token:
+            return
+        self.text += token
+        # At most one partial_text send in flight; it always carries the latest text
+        if self._text_task is None or self._text_task.done():
+            self._text_task = asyncio.create_task(self._send_text())
+        for sentence in self.splitter.feed(token):
+            self._start_render(sentence)
+
+    async def _send_text(self):
+        sent = None
+        while sent != self.text:
+            sent = self.text
+            await self.send({"status": "partial_text", "text": sent}, coalesce_key="partial_text")
+
+    def _start_render(self, sentence: str):
+        if self._sender is None:
+            self._sender = asyncio.create_task(self._send_rendered())
+        task = asyncio.create_task(self.render(sentence))
+        self._renders.append(task)
+        self._rendering.put_nowait((sentence, task))
+
+    async def _send_rendered(self):
+        index = 0
+        while True:
+            item = await self._rendering.get()
+            if item is None:
+                return
+            sentence, task = item
+            try:
+                text, audio = await task
+            except Exception as e:
+                logger.error(f"Rendering streamed sentence failed: {e}", exc_info=True)
+                text, audio = sentence, None
+            self.results.append((text, audio))
+            await self.send({"status": "partial_audio", "index": index, "text": text, "audio_base64": audio})
+            index += 1
+
+    async def finish(self) -> Tuple[str, bool]:
+        """Render and send the last sentence.
+
+        Returns the full rendered text and whether every sentence was sent with audio.
+        The audio is not merged or sent again: the client already has it.
+        """
+        rest = self.splitter.flush()
+        if rest:
+            self._start_render(rest)
+        if self._text_task is not None:
+            await self._text_task
+        if self._sender is not None:
+            self._rendering.put_nowait(None)
+            await self._sender
+        text = " ".join(text for text, _ in self.results)
+        return text, bool(self.results) and all(audio is not None for _, audio in self.results)
+
+    def cancel(self):
+        """Stop sending and rendering, e.g. when the turn fails or is superseded."""
+        for task in [self._sender, self._text_task, *self._renders]:
+            if task is not None and not task.done():
+                task.cancel()
@@ -0,0 +1,136 @@
+from typing import Iterable, Optional
+from collections import OrderedDict
+from contextvars import ContextVar
+import logging
+import os
+
+from .metrics import Counter
+
+logger = logging.getLogger(__name__)
+
+# Tokens (prompt plus completion) a session may use; 0 means unlimited
+SESSION_TOKEN_BUDGET = int(os.getenv("SESSION_TOKEN_BUDGET", "0"))
+TOKEN_LEDGER_MAX_SESSIONS = int(os.getenv("TOKEN_LEDGER_MAX_SESSIONS", "10000"))
+CHARS_PER_TOKEN = 4  # For estimates when a provider reports no usage
+
+LLM_TOKENS = Counter(
+    "kisanly_llm_tokens_total",
+    "LLM tokens by endpoint, operation and kind (prompt, completion, and cached prompt tokens).",
+    ["endpoint", "operation", "kind"])
+TOKEN_BUDGET_REJECTIONS = Counter(
+    "kisanly_token_budget_rejections_total", "Turns refused because their session had used its token budget.")
+
+
+class TokenUsage:
+    """Prompt and completion tokens, e.g. of one call or one turn."""
+
+    __slots__ = ("prompt", "completion", "cached")
+
+    def __init__(self, prompt: int = 0, completion: int = 0, cached: int = 0):
+        self.prompt = prompt
+        self.completion = completion
+        self.cached = cached  # Prompt tokens the provider served from its prompt cache
+
+    @property
+    def total(self) -> int:
+        return self.prompt + self.completion
+
+    def add(self, other: "TokenUsage"):
+        self.prompt += other.prompt
+        self.completion += other.completion
+        self.cached += other.cached
+
+    def to_dict(self) -> dict:
+        return {"prompt": self.prompt, "completion": self.completion, "cached": self.cached}
+
+
+# Tokens used by the turn being processed; the same object is seen by the agent's worker threads
+current_usage: ContextVar[Optional[TokenUsage]] = ContextVar("current_usage", default=None)
+
+
+def estimate_tokens(text: str) -> int:
+    return (len(text) + CHARS_PER_TOKEN - 1) // CHARS_PER_TOKEN
+
+
+def usage_of(message) -> Optional[TokenUsage]:
+    """The token usage a provider reported for a LangChain message or chunk, if any."""
+    metadata = getattr(message, "usage_metadata", None)
+    if metadata:
+        details = metadata.get("input_token_details") or {}
+        return TokenUsage(metadata.get("input_tokens", 0), metadata.get("output_tokens", 0),
+                          details.get("cache_read", 0))
+    token_usage = (getattr(message, "response_metadata", None) or {}).get("token_usage")
+    if token_usage:
+        details = token_usage.get("prompt_tokens_details") or {}
+        return TokenUsage(token_usage.get("prompt_tokens", 0), token_usage.get("completion_tokens", 0),
+                          details.get("cached_tokens", 0))
+    return None
+
+
+def record_llm_usage(operation: str, usage: Optional[TokenUsage], prompt: Iterable = (), completion: str = "",
+                     endpoint: str = "websocket") -> TokenUsage:
+    """Count the tokens of one LLM call and add them to the current turn.
+
+    Without reported `usage`, tokens are estimated from the prompt messages and the
+    completion text.
+    """
+    if usage is None:
+        usage = TokenUsage(sum(estimate_tokens(str(message.content)) for message in prompt),
+                           estimate_tokens(completion))
+    LLM_TOKENS.inc(usage.prompt, endpoint=endpoint, operation=operation, kind="prompt")
+    LLM_TOKENS.inc(usage.completion, endpoint=endpoint, operation=operation, kind="completion")
+    if usage.cached:
+        LLM_TOKENS.inc(usage.cached, endpoint=endpoint, operation=operation, kind="cached")
+    turn = current_usage.get()
+    if turn is not None:
+        turn.add(usage)
+    return usage
+
+
+class TokenLedger:
+    """Tokens used by each session, stored with the session, and its budget.
+
+    Totals are cached per worker; the database is read once per session and
+    incremented after every turn that used tokens. A turn is only refused when its
+    session is already over `budget`, so the turn that crosses it still completes.
+    """
+
+    def __init__(self, db_manager, budget: int = SESSION_TOKEN_BUDGET,
+                 max_sessions: int = TOKEN_LEDGER_MAX_SESSIONS):
+        self.db_manager = db_manager
+        self.budget = budget
+        self.max_sessions = max_sessions
+        self._sessions: "OrderedDict[str, TokenUsage]" = OrderedDict()
+
+    async def get(self, session_id: str) -> TokenUsage:
+        usage = self._sessions.get(session_id)
+        if usage is None:
+            try:
+                prompt, completion = await self.db_manager.get_session_tokens_async(session_id)
+            except Exception as e:
+                logger.error(f"Failed to load the token usage of session {session_id}: {e}", exc_info=True)
+                prompt, completion = 0, 0
+            # Another turn of the session may have loaded it in the meantime
+            usage = self._sessions.setdefault(session_id, TokenUsage(prompt, completion))
+            while len(self._sessions) > self.max_sessions:
+                self._sessions.popitem(last=False)
+        self._sessions.move_to_end(session_id)
+        return usage
+
+    async def exhausted(self, session_id: str) -> bool:
+        """Whether the session has used its whole budget; counts the refusal if so."""
+        if self.budget <= 0:
+            return False
+        if (await self.get(session_id)).total < self.budget:
+            return False
+        TOKEN_BUDGET_REJECTIONS.inc()
+        return True
+
+    def charge(self, session_id: str, usage: TokenUsage):
+        """Add the tokens of a finished turn to its session."""
+        if not usage.total:
+            return
+        cached = self._sessions.get(session_id)
+        if cached is not None:
+            cached.add(usage)
+        self.db_manager.add_session_tokens_background(session_id, usage.prompt, usage.completion)
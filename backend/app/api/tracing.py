@@ -0,0 +1,159 @@
+from typing import Callable, Dict, List, Optional
+from contextlib import contextmanager
+from contextvars import ContextVar
+import asyncio
+import logging
+import time
+import uuid
+
+from .metrics import STAGE_SECONDS
+
+logger = logging.getLogger(__name__)
+
+
+class Span:
+    """One timed stage of a turn, measured on the monotonic clock."""
+
+    __slots__ = ("trace", "name", "start", "end", "error")
+
+    def __init__(self, trace: "TurnTrace", name: str, start: float):
+        self.trace = trace
+        self.name = name
+        self.start = start
+        self.end: Optional[float] = None
+        self.error = False
+
+    @property
+    def duration_ms(self) -> float:
+        return ((self.end if self.end is not None else time.perf_counter()) - self.start) * 1000
+
+    def finish(self, error: bool = False):
+        if self.end is None:
+            self.end = time.perf_counter()
+            self.error = error
+            if not error:
+                STAGE_SECONDS.observe(self.end - self.start, stage=self.name)
+
+    def to_dict(self) -> dict:
+        return {
+            "name": self.name,
+            "start_ms": round((self.start - self.trace.mono_start) * 1000, 3),
+            "duration_ms": round(self.duration_ms, 3),
+            "error": self.error,
+        }
+
+
+class TurnTrace:
+    """Spans recorded while processing one turn.
+
+    Spans use `time.perf_counter`, so they are immune to wall-clock jumps and resolve
+    well below a millisecond. `wall_time` maps a monotonic instant onto the Unix clock
+    for storage, anchored at the moment the trace started.
+    """
+
+    def __init__(self, turn_id: Optional[int] = None):
+        self.trace_id = uuid.uuid4().hex
+        self.turn_id = turn_id
+        self.wall_start = time.time()
+        self.mono_start = time.perf_counter()
+        self.spans: List[Span] = []
+        # Futures for spans that end after the turn itself, e.g. background writes
+        self._pending: List[asyncio.Future] = []
+
+    def begin(self, name: str) -> Span:
+        """Open a span that is finished explicitly, e.g. from a callback."""
+        span = Span(self, name, time.perf_counter())
+        self.spans.append(span)
+        return span
+
+    @contextmanager
+    def span(self, name: str):
+        """Time the enclosed block, sync or async, marking the span on exceptions."""
+        span = self.begin(name)
+        try:
+            yield span
+        except BaseException:
+            span.finish(error=True)
+            raise
+        finally:
+            span.finish()
+
+    def track(self, name: str, task: asyncio.Future) -> asyncio.Future:
+        """Time a background task from now until it completes."""
+        span = self.begin(name)
+        task.add_done_callback(lambda t: span.finish(error=t.cancelled() or t.exception() is not None))
+        self._pending.append(task)
+        return task
+
+    def defer(self, name: str) -> Callable[[], None]:
+        """Open a span and return the callback that finishes it, e.g. when a send completes."""
+        span = self.begin(name)
+        done = asyncio.get_running_loop().create_future()
+        self._pending.append(done)
+
+        def finish():
+            span.finish()
+            if not done.done():
+                done.set_result(None)
+
+        return finish
+
+    async def settle(self, timeout: float):
+        """Wait up to `timeout` seconds for tracked and deferred spans to finish."""
+        if self._pending:
+            await asyncio.wait(self._pending, timeout=timeout)
+
+    def wall_time(self, mono: Optional[float] = None) -> float:
+        """Unix timestamp for a monotonic instant (default: now) with sub-millisecond precision."""
+        if mono is None:
+            mono = time.perf_counter()
+        return self.wall_start + (mono - self.mono_start)
+
+    def elapsed(self) -> float:
+        """Seconds since the trace started."""
+        return time.perf_counter() - self.mono_start
+
+    def durations(self) -> Dict[str, float]:
+        """Total milliseconds per span name, summing spans that repeat (e.g. several LLM calls)."""
+        totals: Dict[str, float] = {}
+        for span in self.spans:
+            if span.end is not None:
+                totals[span.name] = totals.get(span.name, 0.0) + span.duration_ms
+        return totals
+
+    def stage_seconds(self, *prefixes: str) -> float:
+        """Seconds spent in finished spans whose name starts with any of `prefixes`."""
+        return round(sum(ms for name, ms in self.durations().items()
+                         if name.startswith(prefixes)) / 1000, 3)
+
+    def finished_spans(self) -> List[dict]:
+        return [span.to_dict() for span in self.spans if span.end is not None]
+
+    def rows(self) -> List[dict]:
+        """Finished spans as rows for the trace_spans table."""
+        return [
+            {
+                "trace_id": self.trace_id,
+                "turn_id": self.turn_id,
+                "name": span.name,
+                "started_at": self.wall_time(span.start),
+                "duration_ms": span.duration_ms,
+                "error": span.error,
+            }
+            for span in self.spans if span.end is not None
+        ]
+
+
+# The trace of the turn being processed; copied into threads by asyncio.to_thread and the executors
+current_trace: ContextVar[Optional[TurnTrace]] = ContextVar("current_trace", default=None)
+
+
+@contextmanager
+def span(name: str):
+    """Time a block against the current turn's trace; does nothing outside a turn."""
+    trace = current_trace.get()
+    if trace is None:
+        yield None
+        return
+    with trace.span(name) as s:
+        yield s
@@ -0,0 +1,139 @@
+from typing import Awaitable, Callable, Dict, Optional
+import asyncio
+import json
+import logging
+import os
+
+from .admission import AdmissionRejected
+from .executors import cpu_executor
+
+logger = logging.getLogger(__name__)
+
+# Per-connection turn scheduling (overridable through the environment)
+TURN_POLICY = os.getenv("TURN_POLICY", "supersede")  # 'supersede' cancels the running turn, 'queue' runs turns in order
+TURN_MAX_IN_FLIGHT = int(os.getenv("TURN_MAX_IN_FLIGHT", "2"))
+
+# Payloads with more text than this (i.e. audio) are JSON-encoded on the CPU executor
+LARGE_PAYLOAD_CHARS = 256 * 1024
+
+
+async def encode_payload(payload: dict) -> str:
+    """JSON-encode a message, keeping multi-megabyte audio payloads off the event loop."""
+    if sum(len(value) for value in payload.values() if isinstance(value, str)) > LARGE_PAYLOAD_CHARS:
+        return await cpu_executor.run(json.dumps, payload)
+    return json.dumps(payload)
+
+
+class Turn:
+    """One user message being processed, with its id and a guarded send."""
+
+    def __init__(self, scheduler: "TurnScheduler", turn_id: int):
+        self.scheduler = scheduler
+        self.turn_id = turn_id
+        self.cancelled = False
+        # Set once the turn is admitted to its first pipeline stage
+        self.in_progress = False
+
+    @property
+    def is_stale(self) -> bool:
+        """True once the turn was cancelled or superseded by a newer one."""
+        return self.cancelled or (
+            self.scheduler.policy == "supersede" and self.turn_id != self.scheduler.latest_turn_id
+        )
+
+    async def send(self, payload: dict, coalesce_key: Optional[str] = None,
+                   on_sent: Optional[Callable[[], None]] = None) -> bool:
+        """Send a payload tagged with this turn's id, unless the turn is stale."""
+        if self.is_stale:
+            logger.debug(f"Dropping stale message for turn {self.turn_id} of client {self.scheduler.client_id}")
+            return False
+        payload["turn_id"] = self.turn_id
+        await self.scheduler.send(await encode_payload(payload), self.scheduler.client_id,
+                                  coalesce_key=coalesce_key, on_sent=on_sent)
+        return True
+
+
+class TurnScheduler:
+    """Runs a connection's turns as tasks so the receive loop keeps reading.
+
+    With the 'supersede' policy a new message cancels the turn in flight, so a user's
+    correction is handled immediately and the abandoned turn stops spending on STT/LLM/TTS.
+    With 'queue' turns run one at a time in arrival order. Either way at most
+    `max_in_flight` turns exist per connection; further messages get a `busy` status.
+    """
+
+    def __init__(self, client_id: str, send: Callable[..., Awaitable[None]],
+                 policy: str = TURN_POLICY, max_in_flight: int = TURN_MAX_IN_FLIGHT):
+        self.client_id = client_id
+        self.send = send
+        self.policy = policy
+        self.max_in_flight = max_in_flight
+        self.latest_turn_id = 0
+        self._tasks: Dict[int, asyncio.Task] = {}
+        self._turns: Dict[int, Turn] = {}
+        # Serializes turn bodies; asyncio.Lock wakes waiters in FIFO order
+        self._order = asyncio.Lock()
+
+    @property
+    def in_flight(self) -> int:
+        # Cancelled turns stay in _tasks until they unwind, but no longer count as work
+        return sum(1 for turn in self._turns.values() if not turn.cancelled)
+
+    async def submit(self, handler: Callable[[Turn], Awaitable[None]]) -> Optional[Turn]:
+        """Schedule a turn. Returns None if the connection already has too much work in flight."""
+        if self.policy == "supersede":
+            self.cancel_current()
+        if self.in_flight >= self.max_in_flight:
+            await self.send(json.dumps({"status": "busy", "message": "Still working on your previous message."}), self.client_id)
+            return None
+
+        self.latest_turn_id += 1
+        turn = Turn(self, self.latest_turn_id)
+        self._turns[turn.turn_id] = turn
+        task = asyncio.create_task(self._run(turn, handler))
+        self._tasks[turn.turn_id] = task
+        task.add_done_callback(lambda _: self._finish(turn.turn_id))
+        return turn
+
+    async def _run(self, turn: Turn, handler: Callable[[Turn], Awaitable[None]]):
+        async with self._order:
+            if turn.is_stale:
+                return
+            try:
+                await handler(turn)
+            except asyncio.CancelledError:
+                logger.info(f"Turn {turn.turn_id} for client {self.client_id} cancelled")
+                raise
+            except AdmissionRejected as e:
+                # Shed before any work was done; tell the client quickly so it can retry
+                await turn.send({
+                    "status": "busy",
+                    "message": "The assistant is busy right now, please try again shortly.",
+                    "stage": e.stage,
+                    "retry_after": round(e.expected_wait, 1),
+                })
+            except Exception as e:
+                logger.error(f"Error in turn {turn.turn_id} for client {self.client_id}: {e}", exc_info=True)
+                await turn.send({"status": "error", "message": f"Error processing request: {e}"})
+
+    def _finish(self, turn_id: int):
+        self._tasks.pop(turn_id, None)
+        self._turns.pop(turn_id, None)
+
+    def cancel_current(self) -> Optional[int]:
+        """Cancel every turn in flight and return the id of the newest one cancelled."""
+        cancelled = None
+        for turn_id, task in list(self._tasks.items()):
+            if self._turns[turn_id].cancelled:
+                continue
+            self._turns[turn_id].cancelled = True
+            task.cancel()
+            cancelled = turn_id
+        return cancelled
+
+    async def close(self):
+        """Cancel all turns, e.g. when the connection goes away."""
+        self.cancel_current()
+        tasks = list(self._tasks.values())
+        if tasks:
+            await asyncio.gather(*tasks, return_exceptions=True)
@@ -1,28 +1,38 @@
 from fastapi import APIRouter, WebSocket, WebSocketDisconnect, Depends
-from typing import List, Dict, Optional, Any
+from typing import List, Dict, Optional, Any, Callable, Tuple
 import logging
-import torch
-import tempfile
 import os
 import io
 import magic
 from pydub import AudioSegment
 from dotenv import load_dotenv
-from transformers import pipeline, AutoProcessor, AutoTokenizer, AutoModelForCausalLM, BitsAndBytesConfig, AutoModel, AutoModelForSpeechSeq2Seq
 
-import soundfile as sf
-import librosa
-import numpy as np
 import asyncio
 import base64
 import json
 import requests
+from requests.adapters import HTTPAdapter
+import threading
 import time
-import random
 import uuid
-from transformers import WhisperProcessor, WhisperForConditionalGeneration
 
-from ..database import DBManager
+from ..database import DBManager, get_audio_dir
+from .backplane import Backplane, create_backplane
+from .outbound import OutboundQueue
+from .admission import LLM_CALLS_PER_TURN, AdmissionRejected, admission
+from .executors import ExecutorSaturated, cpu_executor, db_executor, network_executor
+from .tracing import TurnTrace, current_trace, span
+from .metrics import GaugeFunc, instrument_engine, record_provider_call
+from .prompts import AWAITED_FIELD_PROMPT, EXTRACTION_PROMPT, INTENT_PROMPT, SUMMARY_PROMPT, EntitySchema, quoted_fields
+from .tokens import TokenLedger, TokenUsage, current_usage, record_llm_usage, usage_of
+from .resilience import (PROVIDER_FAILOVERS, CircuitOpen, ProviderError, ProviderTimeout, failover_order,
+                         provider_deadline, provider_guard)
+from .batching import MicroBatcher
+from .local_inference import local_stt, local_tts
+from .language import LanguageAffinity
+from .speculation import SPECULATIVE_TTS, speculative_slots
+from .streaming import ReplyStream, merge_wav_base64
+from .turns import Turn, TurnScheduler
 
 logging.basicConfig(level=logging.DEBUG)
 logger = logging.getLogger(__name__)
@@ -35,34 +45,109 @@ load_dotenv() # Searches for .env file in current dir or parent dirs
 # Get Sarvam API key
 SARVAM_API_KEY = os.getenv("SARVAM_API_KEY")
 if not SARVAM_API_KEY:
-    logger.error("SARVAM_API_KEY not found in environment variables. API functionality will not work.")
+    logger.error("SARVAM_API_KEY not found in environment variables. Hosted speech-to-text, translation and "
+                 "text-to-speech will not work; only local models can serve those stages.")
 
-# Determine device for pipelines
-DEVICE = "cuda" if torch.cuda.is_available() else "cpu"
-TORCH_DTYPE = torch.bfloat16 if DEVICE == "cuda" and torch.cuda.is_available() and hasattr(torch, 'bfloat16') else torch.float16 # Use bfloat16 if available on CUDA
+# All inference goes through the hosted Sarvam and Groq APIs, so no ML framework is
+# imported here; keep it that way so workers boot fast and stay small
 DEFAULT_SAMPLING_RATE = 16000 # From Shuka example
 
-# Sarvam API endpoints
-SARVAM_STT_API_URL = "https://api.sarvam.ai/speech-to-text-translate"
-SARVAM_TTS_API_URL = "https://api.sarvam.ai/text-to-speech"
-SARVAM_TRANSLATE_API_URL = "https://api.sarvam.ai/translate"
+# Sarvam API endpoints; the base URL can point at a local stand-in, e.g. for load tests
+SARVAM_API_BASE_URL = os.getenv("SARVAM_API_BASE_URL", "https://api.sarvam.ai").rstrip("/")
+SARVAM_STT_API_URL = f"{SARVAM_API_BASE_URL}/speech-to-text-translate"
+SARVAM_TRANSCRIBE_API_URL = f"{SARVAM_API_BASE_URL}/speech-to-text"  # Transcription in a given language
+SARVAM_TTS_API_URL = f"{SARVAM_API_BASE_URL}/text-to-speech"
+SARVAM_TRANSLATE_API_URL = f"{SARVAM_API_BASE_URL}/translate"
+
+# Keep-alive connections shared by all Sarvam calls, so concurrent requests skip the TLS handshake
+SARVAM_HTTP_POOL_SIZE = int(os.getenv("SARVAM_HTTP_POOL_SIZE", "32"))
+sarvam_http = requests.Session()
+for scheme in ("https://", "http://"):
+    sarvam_http.mount(scheme, HTTPAdapter(pool_connections=4, pool_maxsize=SARVAM_HTTP_POOL_SIZE))
+SARVAM_CONNECT_TIMEOUT = float(os.getenv("SARVAM_CONNECT_TIMEOUT", "3.05"))
+
+# Providers tried in turn when one fails; for TTS, "text" ends the order with a text-only reply
+STT_FAILOVER_ORDER = failover_order(os.getenv("STT_FAILOVER_ORDER", "sarvam,local"))
+TTS_FAILOVER_ORDER = failover_order(os.getenv("TTS_FAILOVER_ORDER", "sarvam,local,text"))
+
+# Speech-to-text micro-batching: jobs arriving within the window are dispatched together
+STT_BATCH_WINDOW_MS = float(os.getenv("STT_BATCH_WINDOW_MS", "10"))
+STT_BATCH_SIZE = int(os.getenv("STT_BATCH_SIZE", "8"))
+STT_MAX_CONCURRENT_BATCHES = int(os.getenv("STT_MAX_CONCURRENT_BATCHES", "8"))
+
+# Text-to-speech batching: requests in the same language are coalesced into multi-input calls
+TTS_BATCH_WINDOW_MS = float(os.getenv("TTS_BATCH_WINDOW_MS", "15"))
+TTS_BATCH_SIZE = int(os.getenv("TTS_BATCH_SIZE", "8"))
+TTS_MAX_CONCURRENT_BATCHES = int(os.getenv("TTS_MAX_CONCURRENT_BATCHES", "8"))
+SARVAM_TTS_MAX_INPUTS = int(os.getenv("SARVAM_TTS_MAX_INPUTS", "3"))  # Inputs accepted per TTS request
+SARVAM_TTS_MODEL = "bulbul:v2"
+
+# Stream free-form LLM output (summaries) to the client as it is generated
+LLM_STREAMING = os.getenv("LLM_STREAMING", "true").lower() in ("1", "true", "yes")
+
+# Session history paging
+DEFAULT_HISTORY_PAGE_SIZE = 50
+MAX_HISTORY_PAGE_SIZE = 200
+HISTORY_DEFAULT_FIELDS = ["id", "role", "content", "timestamp", "audio_file"]
 
 # Create database manager
-db_manager = DBManager()
+db_manager = DBManager(executor=db_executor)
+instrument_engine(db_manager.engine)
+session_languages = LanguageAffinity(db_manager)
+token_ledger = TokenLedger(db_manager)
 
 # Ensure audio directory exists
-audio_dir = os.path.join(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))), "audio_files")
+audio_dir = get_audio_dir()
 os.makedirs(audio_dir, exist_ok=True)
 
 # Reintroduce ConnectionManager
 class ConnectionManager:
-    def __init__(self):
+    """Tracks this worker's WebSocket connections and routes messages across workers.
+
+    Connections live on exactly one worker. Messages for a client connected elsewhere,
+    broadcasts and session switches are relayed to the other workers and nodes through
+    the backplane, which also records which node owns each client.
+    """
+
+    def __init__(self, backplane: Optional[Backplane] = None):
         self.active_connections: Dict[str, WebSocket] = {}
+        self.outbound: Dict[str, OutboundQueue] = {}  # Per-connection send queue and writer task
         self.user_sessions: Dict[str, str] = {}  # Map client_id to session_id
+        self.node_id = uuid.uuid4().hex
+        self.backplane = backplane or create_backplane()
+        self._started = False
+
+    async def start(self):
+        """Start receiving backplane events for this node."""
+        if not self._started:
+            self._started = True
+            await self.backplane.start(self.node_id, self._handle_backplane_event)
+            logger.info(f"Connection manager node {self.node_id} joined the backplane")
+
+    async def stop(self):
+        """Leave the backplane."""
+        if self._started:
+            self._started = False
+            await self.backplane.stop()
 
     async def connect(self, websocket: WebSocket, client_id: str):
+        await self.start()
         await websocket.accept()
+        # A reconnect replaces the client's previous connection, which is closed here so
+        # its writer task does not leak; its own disconnect then leaves the new one alone
+        previous_websocket = self.active_connections.get(client_id)
+        previous_queue = self.outbound.get(client_id)
         self.active_connections[client_id] = websocket
+        self.outbound[client_id] = OutboundQueue(
+            websocket, client_id, on_dead=lambda _: self._drop_dead_client(client_id, websocket))
+        if previous_queue:
+            await previous_queue.close()
+        if previous_websocket is not None:
+            try:
+                await previous_websocket.close(code=1000)
+            except Exception:
+                pass
+        await self.backplane.register(client_id, self.node_id)
         logger.info(f"Client {client_id} connected. Total clients: {len(self.active_connections)}")
 
         # Create or get session for this client - use async version to avoid blocking
@@ -70,28 +155,114 @@ class ConnectionManager:
         self.user_sessions[client_id] = session_id
         logger.debug(f"Client {client_id} using session {session_id}")
 
-    def disconnect(self, client_id: str):
-         if client_id in self.active_connections:
-            del self.active_connections[client_id]
-            if client_id in self.user_sessions:
-                del self.user_sessions[client_id]
-            logger.info(f"Client {client_id} disconnected. Total clients: {len(self.active_connections)}")
-
-    async def send_personal_message(self, message: str | bytes, client_id: str):
+        # Warm the history cache so later turns are served without database reads
+        await db_manager.get_session_history_for_llm_async(session_id)
+
+    async def disconnect(self, client_id: str, websocket: Optional[WebSocket] = None):
+        """Forget a client's connection; with `websocket`, only if it is still the current one."""
+        current = self.active_connections.get(client_id)
+        if current is None or (websocket is not None and current is not websocket):
+            return
+        del self.active_connections[client_id]
+        if client_id in self.user_sessions:
+            del self.user_sessions[client_id]
+        queue = self.outbound.pop(client_id, None)
+        if queue:
+            await queue.close()
+        await self.backplane.unregister(client_id, self.node_id)
+        logger.info(f"Client {client_id} disconnected. Total clients: {len(self.active_connections)}")
+
+    async def _drop_dead_client(self, client_id: str, websocket: WebSocket):
+        """Close a connection whose sends failed or whose queue overflowed."""
+        if self.active_connections.get(client_id) is not websocket:
+            return
+        await self.disconnect(client_id, websocket)
+        try:
+            await websocket.close(code=1013)  # Try again later
+        except Exception:
+            pass
+
+    def _send_local(self, message: str | bytes, client_id: str, coalesce_key: Optional[str] = None,
+                    on_sent: Optional[Callable[[], None]] = None):
+        queue = self.outbound.get(client_id)
+        if queue is not None:
+            queue.put(message, coalesce_key, on_sent)
+
+    async def send_personal_message(self, message: str | bytes, client_id: str, coalesce_key: Optional[str] = None,
+                                    on_sent: Optional[Callable[[], None]] = None):
+        """Queue a message for a client; messages with the same `coalesce_key` supersede each other while queued.
+
+        `on_sent` is called once the message reached a local client's socket; it is not
+        called for clients connected to another node.
+        """
         if client_id in self.active_connections:
-            websocket = self.active_connections[client_id]
-            if isinstance(message, str):
-                await websocket.send_text(message)
-            elif isinstance(message, bytes):
-                await websocket.send_bytes(message)
-            # Reduce log verbosity for potentially large messages like audio
-            log_preview = message[:100] + "..." if isinstance(message, str) and len(message) > 100 else message
+            self._send_local(message, client_id, coalesce_key, on_sent)
+            return
+
+        # The client may be connected to another worker or node
+        owner = await self.backplane.lookup(client_id)
+        if owner and owner != self.node_id:
+            event = {"type": "send", "client_id": client_id, "coalesce_key": coalesce_key}
+            if isinstance(message, bytes):
+                event["bytes"] = base64.b64encode(message).decode("ascii")
+            else:
+                event["text"] = message
+            await self.backplane.publish(event, owner)
+
+    def _broadcast_local(self, message: str):
+        # Only enqueues, so the cost does not depend on the slowest client
+        for queue in list(self.outbound.values()):
+            queue.put(message)
 
     async def broadcast(self, message: str):
-        for client_id in self.active_connections:
-            await self.active_connections[client_id].send_text(message)
+        self._broadcast_local(message)
+        await self.backplane.publish({"type": "broadcast", "text": message, "origin": self.node_id})
         logger.info(f"Broadcasted: {message[:10]}...")
+
+    async def switch_session(self, client_id: str, session_id: str):
+        """Point a client's connection at a new session, wherever it is connected."""
+        if client_id in self.active_connections:
+            self.set_session_id(client_id, session_id)
+            return
+        owner = await self.backplane.lookup(client_id)
+        if owner and owner != self.node_id:
+            await self.backplane.publish({"type": "switch_session", "client_id": client_id, "session_id": session_id}, owner)
+
+    async def _handle_backplane_event(self, event: dict):
+        event_type = event.get("type")
+        if event_type == "send":
+            message = base64.b64decode(event["bytes"]) if "bytes" in event else event["text"]
+            self._send_local(message, event["client_id"], event.get("coalesce_key"))
+        elif event_type == "broadcast":
+            if event.get("origin") != self.node_id:
+                self._broadcast_local(event["text"])
+        elif event_type == "switch_session":
+            client_id = event["client_id"]
+            if client_id in self.active_connections:
+                # The switch was written by the worker that served the request, so this
+                # worker's cache has not seen it
+                for session_id in (self.user_sessions.get(client_id), event["session_id"]):
+                    if session_id:
+                        db_manager.history_cache.invalidate(session_id)
+                self.set_session_id(client_id, event["session_id"])
+        else:
+            logger.warning(f"Unknown backplane event type: {event_type}")
         
+    def send_queue_metrics(self) -> Dict[str, float]:
+        """Aggregate outbound queue depth, drops and send latency across local connections."""
+        stats = [queue.stats() for queue in list(self.outbound.values())]
+        sent = sum(s["sent"] for s in stats)
+        return {
+            "connections": len(stats),
+            "queue_depth_total": sum(s["depth"] for s in stats),
+            "queue_depth_max": max((s["depth"] for s in stats), default=0),
+            "sent": sent,
+            "dropped": sum(s["dropped"] for s in stats),
+            "coalesced": sum(s["coalesced"] for s in stats),
+            "send_latency_avg": sum(s["send_latency_avg"] * s["sent"] for s in stats) / sent if sent else 0.0,
+            "send_latency_max": max((s["send_latency_max"] for s in stats), default=0.0),
+        }
+
     def get_session_id(self, client_id: str) -> Optional[str]:
         """Get the session ID for a client."""
         return self.user_sessions.get(client_id)
@@ -102,36 +273,96 @@ class ConnectionManager:
 
 manager = ConnectionManager()
 
+# Gauges are read at scrape time from the objects that already keep these numbers
+GaugeFunc("kisanly_websocket_connections", "WebSocket connections held by this worker.",
+          lambda: len(manager.active_connections))
+GaugeFunc("kisanly_send_queue", "Outbound send queue totals across this worker's connections.",
+          lambda: {(name,): value for name, value in manager.send_queue_metrics().items() if name != "connections"},
+          ["stat"])
+GaugeFunc("kisanly_history_cache", "Session history cache entries, bytes, hits, misses and evictions.",
+          lambda: {(name,): value for name, value in db_manager.history_cache.stats().items()},
+          ["stat"])
+
+def history_cache_hit_ratio() -> float:
+    stats = db_manager.history_cache.stats()
+    reads = stats["hits"] + stats["misses"]
+    return stats["hits"] / reads if reads else 0.0
+
+GaugeFunc("kisanly_history_cache_hit_ratio", "Share of history reads served from the cache.", history_cache_hit_ratio)
+GaugeFunc("kisanly_admission", "Admission controller jobs per pipeline stage.",
+          lambda: {(stage, name): value for stage, stats in admission.stats().items() for name, value in stats.items()},
+          ["stage", "stat"])
+
 # Router using the manager
 router = APIRouter()
 
-async def sarvam_speech_to_text(audio_bytes, client_id: str, session_id: str, prompt="") -> str | None:
-    """Convert speech to text using Sarvam.ai API and save audio file"""
+def save_audio_file(audio_bytes, client_id: str, session_id: str) -> str:
+    """Store a user's recording in the audio directory and return its filename."""
+    # Generate a unique filename using user_id, session_id and timestamp
+    timestamp = int(time.time())
+    audio_filename = f"{client_id}_{session_id}_{timestamp}.wav"
+    audio_path = os.path.join(audio_dir, audio_filename)
+    
+    # Save the audio file
+    with open(audio_path, 'wb') as f:
+        f.write(audio_bytes)
+    
+    logger.debug(f"Saved audio file to {audio_path}")
+    return audio_filename
+
+async def sarvam_request(operation: str, method: str, url: str, **kwargs) -> requests.Response:
+    """Send a Sarvam API request through the provider guard for `operation`.
+
+    The guard adds the deadline, hedging, retries and circuit breaker. HTTP 429 and 5xx
+    answers are retried; other answers are returned for the caller to handle.
+    """
+    guard = provider_guard("sarvam", operation)
+
+    def attempt():
+        response = sarvam_http.request(method, url, timeout=(SARVAM_CONNECT_TIMEOUT, guard.deadline), **kwargs)
+        if response.status_code == 429 or response.status_code >= 500:
+            raise ProviderError(f"Sarvam {operation} API error: {response.status_code} - {response.text}")
+        return response
+
+    return await guard.call(lambda: network_executor.run(attempt), ok=lambda response: response.status_code == 200)
+
+async def sarvam_speech_to_text(audio_bytes, client_id: str, session_id: str, prompt="",
+                                language_code: Optional[str] = None,
+                                audio_filename: Optional[str] = None) -> Tuple[Optional[str], Optional[str], Optional[str]]:
+    """Convert speech to text using Sarvam.ai API and save audio file
+
+    Returns (transcription, audio_filename, language_code); the transcription and
+    language are None when the audio could not be transcribed.
+
+    Audio from a session known to speak English is transcribed directly, which skips
+    the language detection and translation of the speech-to-text-translate endpoint.
+    Pass `audio_filename` when the audio has already been saved.
+    """
     if not SARVAM_API_KEY:
         logger.error("SARVAM_API_KEY not available. Cannot process speech to text.")
-        return None
+        return None, audio_filename, None
     
     try:
-        # Generate a unique filename using user_id, session_id and timestamp
-        timestamp = int(time.time())
-        audio_filename = f"{client_id}_{session_id}_{timestamp}.wav"
-        audio_path = os.path.join(audio_dir, audio_filename)
-        
-        # Save the audio file
-        with open(audio_path, 'wb') as f:
-            f.write(audio_bytes)
-        
-        logger.debug(f"Saved audio file to {audio_path}")
+        if audio_filename is None:
+            audio_filename = await db_executor.run(save_audio_file, audio_bytes, client_id, session_id)
         
         # Prepare API request
-        payload = {
-            'model': 'saaras:v2',
-            'prompt': prompt,
-            'with_diarization': False
-        }
+        if language_code == "en-IN":
+            api_url = SARVAM_TRANSCRIBE_API_URL
+            payload = {
+                'model': 'saarika:v2',
+                'language_code': language_code
+            }
+        else:
+            api_url = SARVAM_STT_API_URL
+            payload = {
+                'model': 'saaras:v2',
+                'prompt': prompt,
+                'with_diarization': False
+            }
         
         files = [
-            ('file', (audio_filename, open(audio_path, 'rb'), 'audio/wav'))
+            ('file', (audio_filename, audio_bytes, 'audio/wav'))
         ]
         
         headers = {
@@ -139,10 +370,10 @@ async def sarvam_speech_to_text(audio_bytes, client_id: str, session_id: str, pr
         }
         
         # Make API request
-        response = await asyncio.to_thread(
-            requests.request,
+        response = await sarvam_request(
+            "stt",
             "POST", 
-            SARVAM_STT_API_URL, 
+            api_url, 
             headers=headers, 
             data=payload, 
             files=files
@@ -152,20 +383,24 @@ async def sarvam_speech_to_text(audio_bytes, client_id: str, session_id: str, pr
             result = response.json()
             logger.debug(f"Sarvam STT API response: {result}")
             transcription = result.get('transcript', '')
-            detected_language_code = result.get('language_code', '')
+            detected_language_code = result.get('language_code') or language_code or ''
             # Return both the transcription and the audio filename for storage
             return transcription, audio_filename, detected_language_code
         else:
             logger.error(f"Sarvam STT API error: {response.status_code} - {response.text}")
             return None, audio_filename, None
             
+    except (CircuitOpen, ProviderTimeout, ExecutorSaturated) as e:
+        logger.warning(f"Sarvam speech-to-text unavailable: {e}")
+        return None, audio_filename, None
     except Exception as e:
         logger.error(f"Error in Sarvam speech-to-text API: {e}", exc_info=True)
-        return None, None, None
+        return None, audio_filename, None
 
 # #########################################################
 
 import urllib.parse
+from collections import OrderedDict
 from typing import TypedDict, Annotated, List, Optional, Tuple
 from langchain_core.messages import HumanMessage, AIMessage, SystemMessage, BaseMessage
 from langchain_groq import ChatGroq
@@ -193,11 +428,58 @@ class AgentState(TypedDict, total=False):
 # ─────────────────────────────────────────
 # 2. One Groq client for everything (Unchanged)
 # ─────────────────────────────────────────
+# Retries and deadlines are applied by the provider guard, around each call
 llm = ChatGroq(
     model="llama-3.3-70b-versatile", # Using 3.1 as 3.3 might not be available/stable
     api_key=GROQ_API_KEY,
-    temperature=0
+    temperature=0,
+    max_retries=0,
+    timeout=provider_deadline("groq", "chat")
 )
+def invoke_llm(messages: List[BaseMessage], operation: str):
+    """Call the Groq model under its provider guard, timing the call as an `llm.<operation>` span.
+
+    The call's tokens are counted, and added to the current turn.
+    """
+    with span(f"llm.{operation}"):
+        # Never hedged: a duplicate completion would bill its tokens again, unseen by the
+        # token ledger and the admission rate limits
+        response = provider_guard("groq", operation).call_sync(lambda: llm.invoke(messages), hedge=False)
+    record_llm_usage(operation, usage_of(response), messages, str(response.content))
+    return response
+
+def stream_llm(messages: List[BaseMessage], operation: str,
+               on_token: Optional[Callable[[str], None]] = None) -> str:
+    """Like `invoke_llm`, but passes each token to `on_token` as it arrives; returns the full text."""
+    if on_token is None:
+        return invoke_llm(messages, operation).content
+    parts = []
+    usage = TokenUsage()
+    reported = []
+    abandoned = threading.Event()
+
+    def consume():
+        for chunk in llm.stream(messages):
+            if abandoned.is_set():
+                break  # The call timed out; stop passing on tokens
+            chunk_usage = usage_of(chunk)  # Usually only on the last chunk
+            if chunk_usage:
+                usage.add(chunk_usage)
+                reported.append(True)
+            if chunk.content:
+                parts.append(chunk.content)
+                on_token(chunk.content)
+
+    # Tokens already passed on cannot be taken back, so a stream is neither hedged nor retried
+    with span(f"llm.{operation}"):
+        try:
+            provider_guard("groq", operation).call_sync(consume, hedge=False, retries=0)
+        finally:
+            abandoned.set()
+    text = "".join(parts)
+    record_llm_usage(operation, usage if reported else None, messages, text)
+    return text
+
 PRODUCT_BASE_URL = "/app/add/product"
 POST_BASE_URL = "/app/add/post"
 
@@ -217,6 +499,31 @@ post_fields = [
     # ("AdditionalMessage","Any additional message? (or 'none')")
 ]
 
+FORM_FIELDS = {"product": product_fields, "post": post_fields}
+# Per form: the entities its extractions may return, and its static extraction and summary prompts
+ENTITY_SCHEMAS = {intent: EntitySchema(fields) for intent, fields in FORM_FIELDS.items()}
+EXTRACTION_PROMPTS = {
+    intent: EXTRACTION_PROMPT.render(intent=intent, fields=quoted_fields(fields))
+    for intent, fields in FORM_FIELDS.items()
+}
+SUMMARY_PROMPTS = {intent: SUMMARY_PROMPT.render(intent=intent) for intent in FORM_FIELDS}
+
+
+def question_prompt(question: str) -> str:
+    """The part of a form reply that asks the question, identical in every reply asking it."""
+    return f"{question}\n(please type your answer)"
+
+
+def next_form_question(intent: str, asked_key: str, collected=()) -> Optional[Tuple[str, str]]:
+    """The (key, question) asked once `asked_key` is answered: the first other field not in `collected`."""
+    fields = FORM_FIELDS[intent]
+    if asked_key not in dict(fields):
+        return None
+    for key, question in fields:
+        if key != asked_key and key not in collected:
+            return key, question
+    return None
+
 
 # ─────────────────────────────────────────
 # 5. Helper: URL Generator (Unchanged)
@@ -239,12 +546,22 @@ def generate_url(base_url: str, data: dict) -> str:
         return url_prefix if url_prefix.endswith('?') else url_prefix + '?'
 
 
+def summarize(intent: str, data: dict, on_token: Optional[Callable[[str], None]] = None) -> str:
+    """Write a short, friendly summary of the collected form data, optionally streamed."""
+    details = "\n".join(f"- {key}: {value}" for key, value in data.items())
+    return stream_llm([
+        SystemMessage(content=SUMMARY_PROMPTS[intent]),
+        HumanMessage(content=details)
+    ], "summary", on_token).strip()
+
+
 # ─────────────────────────────────────────
 # 6. The Consolidated Processing Function
 # ─────────────────────────────────────────
 def process_input_and_generate_url(
     user_input: str,
-    current_state: AgentState
+    current_state: AgentState,
+    on_token: Optional[Callable[[str], None]] = None
 ) -> Tuple[AgentState, str, str, Optional[str]]:
     """
     Processes user input, updates state, generates URL and AI response.
@@ -252,6 +569,8 @@ def process_input_and_generate_url(
     Args:
         user_input: The latest text input from the user.
         current_state: The current state of the conversation (AgentState).
+        on_token: Optional callback receiving free-form parts of the response
+                  (the summary) as they are generated.
 
     Returns:
         A tuple containing:
@@ -288,29 +607,11 @@ def process_input_and_generate_url(
     # --- Intent Classification (if needed) ---
     if not state.get("intent"):
         print("--> Classifying intent...")
-        intent_prompt = """
-You are an intent classifier for an agricultural marketplace app.
-Analyze the user message and classify it as exactly ONE of these intents:
-
-1. "product" - When the user wants to add or create a new product listing
-   Examples:
-   - "I want to add a new product"
-   - "I need to list my wheat crop for sale"
-   - "Let me create a product entry for my rice harvest"
-
-2. "post" - When the user wants to create a social post using an existing product
-   Examples:
-   - "I want to post about my existing product"
-   - "I need to advertise the cotton I already listed"
-   - "Help me create a post for my listed mangoes"
-
-Return ONLY the word "product" or "post" without any additional text.
-"""
         try:
-            response = llm.invoke([
-                SystemMessage(content=intent_prompt),
+            response = invoke_llm([
+                SystemMessage(content=INTENT_PROMPT),
                 HumanMessage(content=user_input) # Classify based on the *current* input
-            ])
+            ], "intent")
             intent = response.content.strip().lower().split()[0] if response.content else ""
 
             if intent not in ("product", "post"):
@@ -333,44 +634,19 @@ Return ONLY the word "product" or "post" without any additional text.
             state["summary"] = None
 
             # After intent classification, extract any entities from the initial message
-            entity_extraction_prompt = f"""
-You are an entity extraction model for an agricultural marketplace app.
-The user has expressed intent to add a {intent}.
-
-For {intent}s, extract the following fields if they are present in the message:
-{', '.join([f'"{field[0]}"' for field in (product_fields if intent == "product" else post_fields)])}
-
-Format your response as a JSON object with these field names as keys and the extracted values.
-Only include fields that you are confident are mentioned in the message.
-If a field is not mentioned, do not include it in the JSON.
-
-User message: {user_input}
-"""
             try:
-                # Extract entities from the initial message
-                extracted_response = llm.invoke([
-                    SystemMessage(content=entity_extraction_prompt),
+                extracted_response = invoke_llm([
+                    SystemMessage(content=EXTRACTION_PROMPTS[intent]),
                     HumanMessage(content=user_input)
-                ])
-                
-                # Parse the JSON response
-                import re
-                import json
-                
-                # Extract JSON from the response (handling potential text before/after the JSON)
-                json_match = re.search(r'(\{.*\})', extracted_response.content, re.DOTALL)
-                if json_match:
-                    try:
-                        extracted_entities = json.loads(json_match.group(1))
-                        print(f"--> Extracted entities: {extracted_entities}")
-                        
-                        # Update product_data with extracted entities
-                        for key, value in extracted_entities.items():
-                            if value:  # Only add non-empty values
-                                state["product_data"][key] = value
-                                print(f"--> Added extracted entity: {key}={value}")
-                    except json.JSONDecodeError:
-                        print(f"Warning: Could not parse entity extraction result as JSON: {extracted_response.content}")
+                ], "extract")
+                extracted_entities = ENTITY_SCHEMAS[intent].parse(extracted_response.content)
+                if extracted_entities is None:
+                    print(f"Warning: Could not parse entity extraction result as JSON: {extracted_response.content}")
+                else:
+                    print(f"--> Extracted entities: {extracted_entities}")
+                    for key, value in extracted_entities.items():
+                        state["product_data"][key] = value
+                        print(f"--> Added extracted entity: {key}={value}")
             except Exception as e:
                 print(f"Error during entity extraction: {e}")
                 # Continue with the process even if entity extraction fails
@@ -384,7 +660,7 @@ User message: {user_input}
     # --- Form Processing (Runs if intent is now set) ---
     if state.get("intent"):
         intent = state["intent"]
-        fields = product_fields if intent == "product" else post_fields
+        fields = FORM_FIELDS[intent]
         base_url = state["base_url"]
         data = state["product_data"] # Use the data from the current state
 
@@ -392,60 +668,28 @@ User message: {user_input}
         key_to_save = state.get("await_key")
         if key_to_save:
             # First, try to extract all possible fields from the input in case user provided multiple values
-            entity_extraction_prompt = f"""
-You are an entity extraction model for an agricultural marketplace app.
-The user is providing information for a {intent}.
-
-We specifically need a value for "{key_to_save}", but also check for any of these fields that might be in the message:
-{', '.join([f'"{field[0]}"' for field in (product_fields if intent == "product" else post_fields)])}
-
-Format your response as a JSON object with these field names as keys and the extracted values.
-Only include fields that you are confident are mentioned in the message.
-If a field is not mentioned, do not include it in the JSON.
-Be especially careful to extract "{key_to_save}" if present.
-
-User message: {user_input}
-"""
             try:
-                # Extract entities from the current message
-                extracted_response = llm.invoke([
-                    SystemMessage(content=entity_extraction_prompt),
+                extracted_response = invoke_llm([
+                    SystemMessage(content=EXTRACTION_PROMPTS[intent]),
+                    SystemMessage(content=AWAITED_FIELD_PROMPT.render(awaited=key_to_save)),
                     HumanMessage(content=user_input)
-                ])
-                
-                # Parse the JSON response
-                import re
-                import json
-                
-                # Extract JSON from the response
-                json_match = re.search(r'(\{.*\})', extracted_response.content, re.DOTALL)
-                if json_match:
-                    try:
-                        extracted_entities = json.loads(json_match.group(1))
-                        print(f"--> Extracted entities: {extracted_entities}")
-                        
-                        # Update product_data with extracted entities
-                        for key, value in extracted_entities.items():
-                            if value:  # Only add non-empty values
-                                data[key] = value
-                                print(f"--> Added extracted entity: {key}={value}")
-                                
-                        # If we found the specific key we were awaiting, clear the await flag
-                        if key_to_save in extracted_entities:
-                            state["await_key"] = None
-                        else:
-                            # If no entity for the awaited key was found, use the whole input as the answer
-                            data[key_to_save] = user_input.strip()
-                            state["await_key"] = None
-                            print(f"--> Using full input for '{key_to_save}': '{user_input}'")
-                            
-                    except json.JSONDecodeError:
-                        print(f"Warning: Could not parse entity extraction result as JSON: {extracted_response.content}")
-                        # Fallback: Use the entire input as the answer to the awaited question
-                        data[key_to_save] = user_input.strip()
-                        state["await_key"] = None
-                        print(f"--> Using full input for '{key_to_save}': '{user_input}'")
-                        
+                ], "extract")
+                extracted_entities = ENTITY_SCHEMAS[intent].parse(extracted_response.content)
+                if extracted_entities is None:
+                    print(f"Warning: Could not parse entity extraction result as JSON: {extracted_response.content}")
+                    extracted_entities = {}
+                else:
+                    print(f"--> Extracted entities: {extracted_entities}")
+                for key, value in extracted_entities.items():
+                    data[key] = value
+                    print(f"--> Added extracted entity: {key}={value}")
+
+                if key_to_save not in extracted_entities:
+                    # If no entity for the awaited key was found, use the whole input as the answer
+                    data[key_to_save] = user_input.strip()
+                    print(f"--> Using full input for '{key_to_save}': '{user_input}'")
+                state["await_key"] = None
+
             except Exception as e:
                 print(f"Error during entity extraction: {e}")
                 # Fallback: Use the entire input as the answer to the awaited question
@@ -474,7 +718,7 @@ User message: {user_input}
             collected_summary = f"Information collected so far: {collected_info}\n\n" if data else ""
             
             msg_content = (
-                f"{collected_summary}{question_to_ask}\n(please type your answer)\n\n"
+                f"{collected_summary}{question_prompt(question_to_ask)}\n\n"
                 f"Current progress URL: {generated_url}"
             )
             ai_response_content = msg_content
@@ -487,12 +731,18 @@ User message: {user_input}
             # --- All questions answered → Finalize ---
             if not state.get("done"): # Only finalize once
                 print("--> All questions answered. Finalizing.")
-                summary_text = summarize(intent, data)
+                # Stream the whole message, so the streamed text matches the final response
+                intro = "All questions answered! Here is a concise summary:\n\n"
+                if on_token:
+                    on_token(intro)
+                summary_text = summarize(intent, data, on_token)
                 state["summary"] = summary_text
                 # URL already calculated as generated_url with all data
 
-                msg_content = (f"All questions answered! Here is a concise summary:\n\n{summary_text}\n\n"
-                               f"Final submission link:\n{generated_url}")
+                closing = f"\n\nFinal submission link:\n{generated_url}"
+                if on_token:
+                    on_token(closing)
+                msg_content = intro + summary_text + closing
                 ai_response_content = msg_content
                 state["await_key"] = None # No longer waiting
                 state["done"] = True
@@ -516,11 +766,26 @@ User message: {user_input}
     return state, ai_response_content, generated_url, placeholder_name
 
 
-async def call_english_agent_api(text_input, session_history):
+# The form each session is filling in, kept between turns so its answers add up. Per
+# worker, like the connection whose turns use it.
+AGENT_STATE_MAX_SESSIONS = int(os.getenv("AGENT_STATE_MAX_SESSIONS", "10000"))
+agent_states: "OrderedDict[str, AgentState]" = OrderedDict()
+
+def save_agent_state(session_id: str, state: AgentState):
+    # Later turns only need the form's progress; the message list would just grow
+    agent_states[session_id] = AgentState({key: value for key, value in state.items() if key != "messages"})
+    agent_states.move_to_end(session_id)
+    while len(agent_states) > AGENT_STATE_MAX_SESSIONS:
+        agent_states.popitem(last=False)
+
+async def call_english_agent_api(text_input, session_history, on_token: Optional[Callable[[str], None]] = None,
+                                 session_id: Optional[str] = None):
     """
     Call English agent API with the complete conversation history.
     This would be implemented based on the specific agent API details.
-    Returns a tuple of (response_text, navigation_url) where navigation_url is optional
+    Returns a tuple of (response_text, navigation_url, asked) where navigation_url is optional
+    and asked is the (intent, field key) of the form question the reply asks, if any.
+    With a session_id, the form state is carried over to the session's next turn.
     """
     # TODO: Replace with actual English agent API call
     # For now, we'll just echo back the input as a simple response
@@ -528,35 +793,45 @@ async def call_english_agent_api(text_input, session_history):
         # This is a placeholder - replace with actual API call
         # Here we would pass the entire session_history to the API
         
-        conversation_state: AgentState = AgentState(messages=[], product_data={}, done=False)
-        updated_state, ai_message, current_url, next_placeholder = process_input_and_generate_url(
+        # The agent copies the state before changing it
+        conversation_state: AgentState = (agent_states.get(session_id)
+                                          or AgentState(messages=[], product_data={}, done=False))
+        # The agent makes blocking LLM calls, so it runs on the network executor
+        updated_state, ai_message, current_url, next_placeholder = await network_executor.run(
+                process_input_and_generate_url,
                 text_input,
-                conversation_state
+                conversation_state,
+                on_token
             )
 
-            # Update the state for the next iteration
-        conversation_state = updated_state
-        return ai_message, current_url
+        # Update the state for the next iteration
+        if session_id:
+            save_agent_state(session_id, updated_state)
+        asked = None
+        if next_placeholder and next_placeholder != "SUMMARY" and updated_state.get("intent"):
+            asked = (updated_state["intent"], next_placeholder)
+        return ai_message, current_url, asked
     except Exception as e:
         logger.error(f"Error calling English agent API: {e}", exc_info=True)
-        return None, None
+        return None, None, None
 
-async def sarvam_text_to_speech(text, target_lang_code="en-IN") -> str | None:
-    """Convert text to speech using Sarvam.ai API"""
+async def sarvam_text_to_speech_batch(texts: List[str], target_lang_code="en-IN") -> List[Optional[str]]:
+    """Convert several texts to speech in one Sarvam.ai API call, one audio (or None) per text"""
     if not SARVAM_API_KEY:
         logger.error("SARVAM_API_KEY not available. Cannot process text to speech.")
-        return None
+        return [None] * len(texts)
     
     try:
-        logger.debug(f"Starting Sarvam.ai text-to-speech API call for {len(text)} characters...")
+        logger.debug(f"Starting Sarvam.ai text-to-speech API call for {len(texts)} inputs, "
+                     f"{sum(len(text) for text in texts)} characters...")
         
         # Prepare API request
         payload = {
-            "inputs": [text],
+            "inputs": texts,
             "target_language_code": target_lang_code,
             "speech_sample_rate": 8000,
             "enable_preprocessing": True,
-            "model": "bulbul:v2"
+            "model": SARVAM_TTS_MODEL
         }
         
         headers = {
@@ -565,8 +840,8 @@ async def sarvam_text_to_speech(text, target_lang_code="en-IN") -> str | None:
         }
         
         # Make API request
-        response = await asyncio.to_thread(
-            requests.request,
+        response = await sarvam_request(
+            "tts",
             "POST", 
             SARVAM_TTS_API_URL, 
             json=payload, 
@@ -577,20 +852,27 @@ async def sarvam_text_to_speech(text, target_lang_code="en-IN") -> str | None:
             result = response.json()
             logger.debug(f"Sarvam TTS API call successful to language={target_lang_code}")
             
-            # Extract audio data
-            if "audios" in result:
-                audio_base64 = result["audios"][0]
-                return audio_base64
+            # Extract audio data, returned in the order of the inputs
+            audios = result.get("audios")
+            if isinstance(audios, list) and len(audios) == len(texts):
+                return audios
             else:
-                logger.error(f"Unexpected TTS response format: {result}")
-                return None
+                logger.error(f"Unexpected TTS response format for {len(texts)} inputs: {result}")
+                return [None] * len(texts)
         else:
             logger.error(f"Sarvam TTS API error: {response.status_code} - {response.text}")
-            return None
+            return [None] * len(texts)
             
+    except (CircuitOpen, ProviderTimeout, ExecutorSaturated) as e:
+        logger.warning(f"Sarvam text-to-speech unavailable: {e}")
+        return [None] * len(texts)
     except Exception as e:
         logger.error(f"Error in Sarvam text-to-speech API: {e}", exc_info=True)
-        return None
+        return [None] * len(texts)
+
+async def sarvam_text_to_speech(text, target_lang_code="en-IN") -> str | None:
+    """Convert text to speech using Sarvam.ai API"""
+    return (await sarvam_text_to_speech_batch([text], target_lang_code))[0]
 
 async def sarvam_translate(text, source_language_code="en-IN", target_language_code="kn-IN") -> str | None:
     """Translate text using Sarvam.ai API"""
@@ -620,8 +902,8 @@ async def sarvam_translate(text, source_language_code="en-IN", target_language_c
         }
         
         # Make API request
-        response = await asyncio.to_thread(
-            requests.request,
+        response = await sarvam_request(
+            "translate",
             "POST", 
             SARVAM_TRANSLATE_API_URL, 
             json=payload, 
@@ -643,253 +925,551 @@ async def sarvam_translate(text, source_language_code="en-IN", target_language_c
             logger.error(f"Sarvam Translation API error: {response.status_code} - {response.text}")
             return text  # Return original text on API error
             
+    except (CircuitOpen, ProviderTimeout, ExecutorSaturated) as e:
+        logger.warning(f"Sarvam translation unavailable: {e}")
+        return text
     except Exception as e:
         logger.error(f"Error in Sarvam translation API: {e}", exc_info=True)
         return text  # Return original text on exception
 
-@router.websocket("/ws/{client_id}")
-async def websocket_endpoint(websocket: WebSocket, client_id: str):
-    await manager.connect(websocket, client_id)
+def stt_provider(language_hint: Optional[str]) -> str:
+    """Provider that will transcribe audio for a client speaking `language_hint`."""
+    return "local" if local_stt.handles(language_hint) else "sarvam"
+
+def tts_provider(target_lang_code: str) -> str:
+    """Provider that will synthesize speech in `target_lang_code`."""
+    return "local" if local_tts.handles(target_lang_code) else "sarvam"
+
+def failover_chain(primary: str, order: List[str], local_supported: bool) -> List[str]:
+    """Providers to try in turn: the primary, then the configured failover order."""
+    chain = [primary]
+    for provider in order:
+        if provider in chain or provider not in ("sarvam", "local"):
+            continue
+        if provider == "local" and not local_supported:
+            continue
+        chain.append(provider)
+    return chain
+
+async def transcribe_with(provider: str, jobs: List[Tuple[bytes, str, str, Optional[str]]],
+                          filenames: List[str]) -> List[tuple]:
+    """Transcribe jobs with one provider; failed jobs come back with a None transcription."""
+    if provider == "local":
+        try:
+            results = await cpu_executor.run(local_stt.transcribe_batch, [audio for audio, _, _, _ in jobs],
+                                             [language for _, _, _, language in jobs])
+            for _ in jobs:
+                record_provider_call("local", "stt", True)
+            return [
+                (transcription, audio_filename, detected_language_code)
+                for (transcription, detected_language_code), audio_filename in zip(results, filenames)
+            ]
+        except Exception as e:
+            record_provider_call("local", "stt", False)
+            logger.error(f"Local speech-to-text failed for a batch of {len(jobs)}: {e}", exc_info=True)
+            return [(None, audio_filename, None) for audio_filename in filenames]
+    return await asyncio.gather(*(
+        sarvam_speech_to_text(audio, client_id, session_id, language_code=language, audio_filename=audio_filename)
+        for (audio, client_id, session_id, language), audio_filename in zip(jobs, filenames)
+    ))
+
+async def transcribe_batch(provider: str, jobs: List[Tuple[bytes, str, str, Optional[str]]]) -> List[tuple]:
+    """Transcribe a batch of (audio_bytes, client_id, session_id, language) jobs with one provider.
+
+    `language` is the session's known language, or None when it has to be detected.
+
+    The local model runs the whole batch in one pass. Sarvam's real-time endpoint takes
+    one file per request, so its batch is sent as concurrent requests over the pooled
+    keep-alive connections. Jobs the provider fails are retried with the next provider
+    in `STT_FAILOVER_ORDER`.
+    """
+    filenames = await db_executor.run(
+        lambda: [save_audio_file(audio, client_id, session_id) for audio, client_id, session_id, _ in jobs])
+    results: List[tuple] = [(None, audio_filename, None) for audio_filename in filenames]
+    chain = failover_chain(provider, STT_FAILOVER_ORDER, local_stt.supports(None))
+    for position, candidate in enumerate(chain):
+        missing = [i for i, result in enumerate(results) if result[0] is None]
+        if not missing:
+            break
+        if position:
+            logger.warning(f"Failing over {len(missing)} transcriptions to {candidate}")
+            PROVIDER_FAILOVERS.inc(len(missing), stage="stt", provider=candidate)
+        transcribed = await transcribe_with(candidate, [jobs[i] for i in missing], [filenames[i] for i in missing])
+        for i, result in zip(missing, transcribed):
+            results[i] = result
+    return results
+
+stt_batcher = MicroBatcher("stt", transcribe_batch, STT_BATCH_SIZE, STT_BATCH_WINDOW_MS, STT_MAX_CONCURRENT_BATCHES)
+
+async def speech_to_text(audio_bytes, client_id: str, session_id: str, language_hint: Optional[str] = None,
+                         known_language: Optional[str] = None):
+    """Transcribe with the local model when it serves the client's language, else with Sarvam.
+
+    Same contract as `sarvam_speech_to_text`. The job joins the current STT batch for its
+    provider and gets back its own result once the batch completes. With `known_language`
+    the speech is assumed to be in that language instead of having it detected.
+    """
+    return await stt_batcher.submit((audio_bytes, client_id, session_id, known_language),
+                                    key=stt_provider(known_language or language_hint))
 
+async def synthesize_with(provider: str, texts: List[str], target_lang_code: str) -> List[Optional[str]]:
+    """Synthesize texts with one provider, one audio (or None) per text."""
+    if provider == "local":
+        try:
+            audios = await cpu_executor.run(local_tts.synthesize_batch, texts, target_lang_code)
+            for _ in texts:
+                record_provider_call("local", "tts", True)
+            return audios
+        except Exception as e:
+            record_provider_call("local", "tts", False)
+            logger.error(f"Local text-to-speech failed for a batch of {len(texts)}: {e}", exc_info=True)
+            return [None] * len(texts)
+    chunks = [texts[i:i + SARVAM_TTS_MAX_INPUTS] for i in range(0, len(texts), SARVAM_TTS_MAX_INPUTS)]
+    results = await asyncio.gather(*(sarvam_text_to_speech_batch(chunk, target_lang_code) for chunk in chunks))
+    return [audio for chunk_audios in results for audio in chunk_audios]
+
+async def synthesize_batch(key: Tuple[str, str], texts: List[str]) -> List[Optional[str]]:
+    """Synthesize a batch of texts in one language with one provider, one audio per text.
+
+    The local voice runs the batch as one padded pass; Sarvam gets the texts as
+    multi-input requests of up to `SARVAM_TTS_MAX_INPUTS` each. Texts the provider fails
+    are retried with the next provider in `TTS_FAILOVER_ORDER`; those no provider could
+    speak are left as None, and the reply is sent as text only.
+    """
+    provider, target_lang_code = key
+    audios: List[Optional[str]] = [None] * len(texts)
+    chain = failover_chain(provider, TTS_FAILOVER_ORDER, local_tts.supports(target_lang_code))
+    for position, candidate in enumerate(chain):
+        missing = [i for i, audio in enumerate(audios) if audio is None]
+        if not missing:
+            break
+        if position:
+            logger.warning(f"Failing over {len(missing)} syntheses in {target_lang_code} to {candidate}")
+            PROVIDER_FAILOVERS.inc(len(missing), stage="tts", provider=candidate)
+        synthesized = await synthesize_with(candidate, [texts[i] for i in missing], target_lang_code)
+        for i, audio in zip(missing, synthesized):
+            audios[i] = audio
+    unspoken = sum(audio is None for audio in audios)
+    if unspoken:
+        PROVIDER_FAILOVERS.inc(unspoken, stage="tts", provider="text")
+    return audios
+
+tts_batcher = MicroBatcher("tts", synthesize_batch, TTS_BATCH_SIZE, TTS_BATCH_WINDOW_MS, TTS_MAX_CONCURRENT_BATCHES)
+
+async def text_to_speech(text, target_lang_code="en-IN") -> str | None:
+    """Synthesize with the local voice for the language when enabled, else with Sarvam.
+
+    Requests in the same language that arrive within the batching window, e.g. replies
+    to different clients, are synthesized together and each gets back its own audio.
+    """
+    return await tts_batcher.submit(text, key=(tts_provider(target_lang_code), target_lang_code))
+
+def parse_control_message(data: dict) -> Optional[dict]:
+    """Return the payload of a JSON control frame such as {"action": "cancel"}, else None."""
+    text = data.get("text")
+    if not text or not text.lstrip().startswith("{"):
+        return None
     try:
-        while True:
-            data = await websocket.receive()
-            response_text = None
-            user_message = None  # The message to store in the database
-            session_id = manager.get_session_id(client_id)
-            
-            # Timestamp when message was received
-            received_timestamp = int(time.time())
+        payload = json.loads(text)
+    except ValueError:
+        return None
+    return payload if isinstance(payload, dict) and "action" in payload else None
 
-            target_language_code = "en-IN"
-            
-            # Check if data contains language parameter
-            if isinstance(data, dict) and "language" in data:
-                target_language_code = data["language"]
-            elif "text" in data and isinstance(data["text"], dict) and "language" in data["text"]:
-                target_language_code = data["text"]["language"]
-            elif "bytes" in data and isinstance(data["bytes"], dict) and "language" in data["bytes"]:
-                target_language_code = data["bytes"]["language"]
-                
-            logger.debug(f"Using target language code: {target_language_code}")
-            
-            if not session_id:
-                logger.error(f"No session ID for client {client_id}")
-                await manager.send_personal_message(json.dumps({"status": "error", "message": "Session not found"}), client_id)
-                continue
+# Seconds a finished turn waits for its background DB writes and final send before its spans are stored
+TRACE_SETTLE_TIMEOUT = float(os.getenv("TRACE_SETTLE_TIMEOUT", "30"))
 
-            if not SARVAM_API_KEY:
-                logger.error("SARVAM_API_KEY not available. Cannot process request.")
-                await manager.send_personal_message(json.dumps({"status": "error", "message": "AI processing service unavailable."}), client_id)
-                continue
+async def persist_trace(session_id: str, trace: TurnTrace):
+    """Store a turn's spans once its background writes and final send have finished."""
+    await trace.settle(TRACE_SETTLE_TIMEOUT)
+    try:
+        await db_manager.add_trace_spans_async(session_id, trace.rows())
+    except Exception as e:
+        logger.error(f"Failed to store trace {trace.trace_id}: {e}", exc_info=True)
+
+async def render_sentence(turn: Turn, sentence: str, detected_language_code: Optional[str],
+                          tts_language_code: str) -> Tuple[str, Optional[str]]:
+    """Translate (when needed) and synthesize one sentence of a streamed reply."""
+    if detected_language_code and detected_language_code != "en-IN":
+        async with admission.turn_slot(turn, "translate"):
+            with span("translate"):
+                sentence = await sarvam_translate(sentence, "en-IN", detected_language_code) or sentence
+    async with admission.turn_slot(turn, "tts", provider=tts_provider(tts_language_code)):
+        with span("tts"):
+            audio_base64 = await text_to_speech(sentence, target_lang_code=tts_language_code)
+    return sentence, audio_base64
+
+async def render_question(prompt: str, detected_language_code: Optional[str],
+                          tts_language_code: str) -> Tuple[str, Optional[str]]:
+    """Translate (when needed) and synthesize a form question ahead of the turn that asks it."""
+    if detected_language_code and detected_language_code != "en-IN":
+        prompt = await sarvam_translate(prompt, "en-IN", detected_language_code) or prompt
+    return prompt, await text_to_speech(prompt, target_lang_code=tts_language_code)
+
+async def render_with_speculation(turn: Turn, session_id: str, response_text: str, asked: Tuple[str, str],
+                                  detected_language_code: Optional[str],
+                                  tts_language_code: str) -> Optional[Tuple[str, Optional[str]]]:
+    """Render a form reply around its question, if that question was already rendered speculatively.
+
+    Only the parts of the reply that vary (the answers so far and the progress URL) are
+    translated and synthesized now. None means the reply has to be rendered as a whole.
+    """
+    intent, key = asked
+    fields = dict(FORM_FIELDS[intent])
+    prompt = question_prompt(fields[key])
+    before, found, after = response_text.partition(prompt)
+    if not found:
+        return None
+    with span("speculation"):
+        rendered = await speculative_slots.take(session_id, (intent, key, detected_language_code, tts_language_code))
+    if not rendered or rendered[1] is None:
+        return None
+    before, after = before.strip(), after.strip()
+    segments = list(await asyncio.gather(*(render_sentence(turn, part, detected_language_code, tts_language_code)
+                                           for part in (before, after) if part)))
+    segments.insert(1 if before else 0, rendered)
+    if any(audio is None for _, audio in segments):
+        return None
+    try:
+        return "\n\n".join(text for text, _ in segments), merge_wav_base64([audio for _, audio in segments])
+    except Exception as e:
+        logger.error(f"Merging speculative audio failed: {e}", exc_info=True)
+        return None
 
-            # Get session history for context - use async version to avoid blocking
-            session_history = await db_manager.get_session_history_for_llm_async(session_id)
-            logger.debug(f"Retrieved history for session {session_id}: {len(session_history)} messages")
-
-            if "text" in data:
-                text_data = data["text"]
-                logger.debug(f"Received text from {client_id}: {text_data}")
-                await manager.send_personal_message(json.dumps({"status": "processing_text", "message": "Processing text request..."}), client_id)
-
-                # For text input, STT is skipped
-                stt_completed_timestamp = received_timestamp
-                
-                # Store user message in database with timestamps in the background
-                db_manager.add_user_message_background(
-                    session_id, 
-                    text_data, 
-                    received_at=received_timestamp,
-                    stt_completed_at=stt_completed_timestamp
-                )
-                user_message = text_data
-                
-                # Call English agent API with the text and session history
-                await manager.send_personal_message(json.dumps({"status": "processing_llm", "message": "Thinking..."}), client_id)
-                response_text, navigation_url = await call_english_agent_api(text_data, session_history)
-                # Timestamp when LLM completed
-                llm_completed_timestamp = int(time.time())
-
-            elif "bytes" in data:
-                bytes_data = data["bytes"]
-                logger.debug(f"Received audio bytes from {client_id}: {len(bytes_data)} bytes")
-                await manager.send_personal_message(json.dumps({"status": "processing_audio", "message": "Processing audio..."}), client_id)
+def speculate_next_question(session_id: str, asked: Optional[Tuple[str, str]],
+                            detected_language_code: Optional[str], tts_language_code: str):
+    """Start rendering the question the session's form asks once `asked` is answered, in its language."""
+    collected = agent_states.get(session_id, {}).get("product_data", {})
+    upcoming = next_form_question(*asked, collected) if asked else None
+    if not upcoming:
+        speculative_slots.discard(session_id)
+        return
+    key, question = upcoming
+    speculative_slots.start(session_id, (asked[0], key, detected_language_code, tts_language_code),
+                            lambda: render_question(question_prompt(question), detected_language_code,
+                                                    tts_language_code))
+
+async def process_turn(turn: Turn, client_id: str, data: dict):
+    """Process one message from a client, tracing every stage of the pipeline."""
+    trace = TurnTrace(turn.turn_id)
+    usage = TokenUsage()
+    # Each turn runs in its own task, so the trace and token usage are visible to this turn only
+    current_trace.set(trace)
+    current_usage.set(usage)
+    session_id = manager.get_session_id(client_id)
+    stream = ReplyStream(turn.send) if LLM_STREAMING else None
+    try:
+        await run_turn_pipeline(turn, client_id, session_id, data, trace, stream)
+    finally:
+        if stream:
+            stream.cancel()  # Stops leftover rendering if the turn failed or was superseded
+        if session_id:
+            asyncio.create_task(persist_trace(session_id, trace))
+            # Failed and superseded turns are charged too: their calls were made
+            token_ledger.charge(session_id, usage)
+
+async def run_turn_pipeline(turn: Turn, client_id: str, session_id: Optional[str], data: dict, trace: TurnTrace,
+                            stream: Optional[ReplyStream] = None):
+    """Run STT, agent, translation and TTS for one message, streaming the reply if `stream` is given."""
+    response_text = None
+    detected_language_code = None
+    user_message = None  # The message to store in the database
+
+    # Timestamp when message was received
+    received_timestamp = trace.wall_start
+
+    target_language_code = "en-IN"
+
+    # Check if data contains language parameter
+    if isinstance(data, dict) and "language" in data:
+        target_language_code = data["language"]
+    elif "text" in data and isinstance(data["text"], dict) and "language" in data["text"]:
+        target_language_code = data["text"]["language"]
+    elif "bytes" in data and isinstance(data["bytes"], dict) and "language" in data["bytes"]:
+        target_language_code = data["bytes"]["language"]
+
+    logger.debug(f"Using target language code: {target_language_code}")
+
+    if not session_id:
+        logger.error(f"No session ID for client {client_id}")
+        await turn.send({"status": "error", "message": "Session not found"})
+        return
+
+    # Get session history for context - use async version to avoid blocking
+    with trace.span("history_fetch"):
+        session_history = await db_manager.get_session_history_for_llm_async(session_id)
+    logger.debug(f"Retrieved history for session {session_id}: {len(session_history)} messages")
+
+    if await token_ledger.exhausted(session_id):
+        logger.warning(f"Session {session_id} has used its token budget of {token_ledger.budget}")
+        await turn.send({"status": "error",
+                         "message": "This session has used up its token budget. Please start a new session."})
+        return
+
+    # The language this session has been speaking, learned from earlier audio turns
+    session_language = await session_languages.get(session_id)
+
+    if "text" in data:
+        text_data = data["text"]
+        logger.debug(f"Received text from {client_id}: {text_data}")
+        await turn.send({"status": "processing_text", "message": "Processing text request..."}, coalesce_key="status")
+
+        # For text input, STT is skipped; the reply is in the language the session speaks, if known
+        stt_completed_timestamp = received_timestamp
+        detected_language_code = session_language.known
+
+        # Admission comes first so a shed turn leaves no unanswered message in the history
+        async with admission.turn_slot(turn, "llm", cost=LLM_CALLS_PER_TURN):
+            # Store user message in database with timestamps in the background
+            trace.track("db_write", db_manager.add_user_message_background(
+                session_id, 
+                text_data, 
+                received_at=received_timestamp,
+                stt_completed_at=stt_completed_timestamp
+            ))
+            user_message = text_data
+
+            # Call English agent API with the text and session history
+            await turn.send({"status": "processing_llm", "message": "Thinking..."}, coalesce_key="status")
+            on_token = stream.token_callback(
+                lambda sentence: render_sentence(turn, sentence, detected_language_code,
+                                                 detected_language_code or target_language_code)
+            ) if stream else None
+            with trace.span("agent"):
+                response_text, navigation_url, asked = await call_english_agent_api(
+                    text_data, session_history, on_token, session_id)
+        # Timestamp when LLM completed
+        llm_completed_timestamp = trace.wall_time()
+
+    elif "bytes" in data:
+        bytes_data = data["bytes"]
+        logger.debug(f"Received audio bytes from {client_id}: {len(bytes_data)} bytes")
+        await turn.send({"status": "processing_audio", "message": "Processing audio..."}, coalesce_key="status")
 
+        try:
+            # Convert audio format if needed
+            def prepare_audio_data():
                 try:
-                    # Convert audio format if needed
-                    def prepare_audio_data():
-                        try:
-                            audio_file = io.BytesIO(bytes_data)
-                            file_type = magic.from_buffer(bytes_data[:1024])  # Check first 1KB
-                            
-                            # Handle WebM/Matroska format specifically
-                            if 'WebM' in file_type or 'Matroska' in file_type:
-                                # Convert using pydub
-                                audio = AudioSegment.from_file(audio_file, format="webm")
-                                audio = audio.set_frame_rate(DEFAULT_SAMPLING_RATE).set_channels(1)
-                                
-                                # Convert to WAV format
-                                output_buffer = io.BytesIO()
-                                audio.export(output_buffer, format="wav")
-                                output_buffer.seek(0)
-                                return output_buffer.read()
-                            
-                            # If already in WAV format, return as is
-                            return bytes_data
-                            
-                        except Exception as e:
-                            logger.error(f"Error preparing audio: {e}", exc_info=True)
-                            raise ValueError(f"Audio preparation failed: {e}")
-
-                    # Prepare audio data for API
-                    prepared_audio = await asyncio.to_thread(prepare_audio_data)
-
-                    # Send status update: Processing speech to text
-                    await manager.send_personal_message(json.dumps({"status": "processing_stt", "message": "Converting speech to text..."}), client_id)
-
-                    # Call Sarvam STT API and get transcription and audio filename
-                    transcribed_text, audio_filename, detected_language_code = await sarvam_speech_to_text(prepared_audio, client_id, session_id)
-                    
-                    # Timestamp when STT completed
-                    stt_completed_timestamp = int(time.time())
-                    
-                    if not transcribed_text:
-                        logger.error(f"Speech-to-text conversion failed for client {client_id}")
-                        await manager.send_personal_message(json.dumps({
-                            "status": "error",
-                            "message": "Failed to convert speech to text."
-                        }), client_id)
-                        continue
-                        
-                    logger.debug(f"Transcribed text: {transcribed_text}")
-
-                    # Store user message with audio file reference in the background
-                    db_manager.add_user_message_background(
-                        session_id, 
-                        transcribed_text,
-                        audio_file=audio_filename,
-                        transcription=transcribed_text,
-                        received_at=received_timestamp,
-                        stt_completed_at=stt_completed_timestamp
-                    )
-                    user_message = transcribed_text
+                    audio_file = io.BytesIO(bytes_data)
+                    file_type = magic.from_buffer(bytes_data[:1024])  # Check first 1KB
+
+                    # Handle WebM/Matroska format specifically
+                    if 'WebM' in file_type or 'Matroska' in file_type:
+                        # Convert using pydub
+                        audio = AudioSegment.from_file(audio_file, format="webm")
+                        audio = audio.set_frame_rate(DEFAULT_SAMPLING_RATE).set_channels(1)
 
-                    # Send status update: Processing with LLM
-                    await manager.send_personal_message(json.dumps({"status": "processing_llm", "message": "Thinking..."}), client_id)
-                    
-                    # Call English agent API with the transcribed text and session history
-                    response_text, navigation_url = await call_english_agent_api(transcribed_text, session_history)
-                    # Timestamp when LLM completed
-                    llm_completed_timestamp = int(time.time())
+                        # Convert to WAV format
+                        output_buffer = io.BytesIO()
+                        audio.export(output_buffer, format="wav")
+                        output_buffer.seek(0)
+                        return output_buffer.read()
+
+                    # If already in WAV format, return as is
+                    return bytes_data
 
                 except Exception as e:
-                    logger.error(f"Error processing audio for {client_id}: {e}", exc_info=True)
-                    await manager.send_personal_message(json.dumps({"status": "error", "message": f"Error processing audio: {e}"}), client_id)
-                    continue # Skip to next message
-
-            # Process assistant response
-            if response_text:
-                # Unpack response and navigation URL if call_english_agent_api returns a tuple
-                # navigation_url = None
-                # if isinstance(response_text, tuple) and len(response_text) == 2:
-                #     response_text, navigation_url = response_text
-                
-                # Store original English response
-                original_response_text = response_text
-                
-                # Translate if needed (detected_language_code exists and is not English)
-                translation_start_timestamp = None
-                translation_completed_timestamp = None
-                
-                if detected_language_code and detected_language_code != "en-IN":
-                    translation_start_timestamp = int(time.time())
-                    await manager.send_personal_message(json.dumps({"status": "processing_translation", "message": "Translating response..."}), client_id)
-                    translated_text = await sarvam_translate(response_text, "en-IN", detected_language_code)
-                    translation_completed_timestamp = int(time.time())
-                    if translated_text:
-                        response_text = translated_text
-                        logger.debug(f"Translated response from English to {detected_language_code}")
-                
-                # Determine the target language for TTS
-                tts_language_code = detected_language_code if detected_language_code else target_language_code
-                
-                # TTS using Sarvam API
-                await manager.send_personal_message(json.dumps({"status": "processing_tts", "message": "Generating audio response..."}), client_id)
-                audio_output_base64 = await sarvam_text_to_speech(response_text, target_lang_code=tts_language_code)
-                
-                # Timestamp when TTS completed
-                tts_completed_timestamp = int(time.time())
-
-                # Add assistant response to database with timestamps in the background
-                db_manager.add_assistant_message_background(
-                    session_id, 
-                    original_response_text,  # Store original English response
-                    llm_completed_at=llm_completed_timestamp,
-                    tts_completed_at=tts_completed_timestamp
-                )
-
-                if audio_output_base64:
-                    # Calculate and log performance metrics
-                    stt_duration = stt_completed_timestamp - received_timestamp if stt_completed_timestamp and received_timestamp else 0
-                    llm_duration = llm_completed_timestamp - stt_completed_timestamp if llm_completed_timestamp and stt_completed_timestamp else 0
-                    translation_duration = translation_completed_timestamp - translation_start_timestamp if translation_completed_timestamp and translation_start_timestamp else 0
-                    tts_duration = tts_completed_timestamp - (translation_completed_timestamp or llm_completed_timestamp) if tts_completed_timestamp else 0
-                    total_duration = tts_completed_timestamp - received_timestamp if tts_completed_timestamp and received_timestamp else 0
-                    
-                    logger.info(f"Performance metrics for {client_id}: STT: {stt_duration}s, LLM: {llm_duration}s, Translation: {translation_duration}s, TTS: {tts_duration}s, Total: {total_duration}s")
-                    
-                    # Add navigation URL to the response payload if available
-                    response_payload = {
-                        "status": "response_ready",
-                        "text": response_text,
-                        "audio_base64": audio_output_base64,
-                        "performance": {
-                            "stt_duration": stt_duration,
-                            "llm_duration": llm_duration,
-                            "translation_duration": translation_duration,
-                            "tts_duration": tts_duration,
-                            "total_duration": total_duration
-                        }
-                    }
-                    
-                    # Add navigation_url to the payload if it exists
-                    if navigation_url:
-                        response_payload["navigation_url"] = navigation_url
-                        logger.info(f"Adding navigation URL to response: {navigation_url}")
-                    
-                    await manager.send_personal_message(json.dumps(response_payload), client_id)
-                else:
-                    # Include navigation URL in error response if available
-                    error_payload = {
-                        "status": "error",
-                        "message": "Audio generation failed. Displaying text response.",
-                        "text": response_text,
-                        "performance": {
-                            "stt_duration": stt_duration,
-                            "llm_duration": llm_duration,
-                            "translation_duration": translation_duration,
-                            "total_duration": llm_completed_timestamp - received_timestamp if llm_completed_timestamp and received_timestamp else 0
-                        }
-                    }
-                    
-                    # Add navigation_url to the error payload if it exists
-                    if navigation_url:
-                        error_payload["navigation_url"] = navigation_url
-                    
-                    await manager.send_personal_message(json.dumps(error_payload), client_id)
+                    logger.error(f"Error preparing audio: {e}", exc_info=True)
+                    raise ValueError(f"Audio preparation failed: {e}")
+
+            # Prepare audio data for API
+            with trace.span("audio_prep"):
+                prepared_audio = await cpu_executor.run(prepare_audio_data)
+
+            # Send status update: Processing speech to text
+            await turn.send({"status": "processing_stt", "message": "Converting speech to text..."}, coalesce_key="status")
+
+            # Transcribe (locally or with Sarvam) and get transcription and audio filename.
+            # Once the session's language is known it is not detected again on every turn
+            known_language = session_language.skip_detection
+            async with admission.turn_slot(turn, "stt", provider=stt_provider(known_language or target_language_code)):
+                with trace.span("stt"):
+                    transcribed_text, audio_filename, detected_language_code = await speech_to_text(
+                        prepared_audio, client_id, session_id, language_hint=target_language_code,
+                        known_language=known_language
+                    )
+            session_languages.observe(session_id, session_language, detected_language_code,
+                                      detected=known_language is None or detected_language_code != known_language)
+
+            # Timestamp when STT completed
+            stt_completed_timestamp = trace.wall_time()
+
+            if not transcribed_text:
+                logger.error(f"Speech-to-text conversion failed for client {client_id}")
+                await turn.send({
+                    "status": "error",
+                    "message": "Failed to convert speech to text."
+                })
+                return
+
+            logger.debug(f"Transcribed text: {transcribed_text}")
+
+            # Store user message with audio file reference in the background
+            trace.track("db_write", db_manager.add_user_message_background(
+                session_id, 
+                transcribed_text,
+                audio_file=audio_filename,
+                transcription=transcribed_text,
+                received_at=received_timestamp,
+                stt_completed_at=stt_completed_timestamp
+            ))
+            user_message = transcribed_text
+
+            # Send status update: Processing with LLM
+            await turn.send({"status": "processing_llm", "message": "Thinking..."}, coalesce_key="status")
+
+            # Call English agent API with the transcribed text and session history
+            async with admission.turn_slot(turn, "llm", cost=LLM_CALLS_PER_TURN):
+                on_token = stream.token_callback(
+                    lambda sentence: render_sentence(turn, sentence, detected_language_code,
+                                                     detected_language_code or target_language_code)
+                ) if stream else None
+                with trace.span("agent"):
+                    response_text, navigation_url, asked = await call_english_agent_api(
+                        transcribed_text, session_history, on_token, session_id)
+            # Timestamp when LLM completed
+            llm_completed_timestamp = trace.wall_time()
+
+        except AdmissionRejected:
+            raise
+        except Exception as e:
+            logger.error(f"Error processing audio for {client_id}: {e}", exc_info=True)
+            await turn.send({"status": "error", "message": f"Error processing audio: {e}"})
+            return # Skip to next message
+
+    # Process assistant response
+    if response_text:
+        # Store original English response
+        original_response_text = response_text
+
+        # Determine the target language for TTS
+        tts_language_code = detected_language_code if detected_language_code else target_language_code
+
+        streamed = bool(stream and stream.started)
+        speculated = None
+        audio_output_base64 = None
+        streamed_audio = False
+        if streamed:
+            # Sentences were translated, synthesized and sent while the reply was being generated
+            response_text, streamed_audio = await stream.finish()
+        elif SPECULATIVE_TTS and asked:
+            speculated = await render_with_speculation(turn, session_id, response_text, asked,
+                                                       detected_language_code, tts_language_code)
+            if speculated:
+                response_text, audio_output_base64 = speculated
+        if not streamed and not speculated:
+            # Translate if needed (detected_language_code exists and is not English)
+            if detected_language_code and detected_language_code != "en-IN":
+                await turn.send({"status": "processing_translation", "message": "Translating response..."}, coalesce_key="status")
+                async with admission.turn_slot(turn, "translate"):
+                    with trace.span("translate"):
+                        translated_text = await sarvam_translate(response_text, "en-IN", detected_language_code)
+                if translated_text:
+                    response_text = translated_text
+                    logger.debug(f"Translated response from English to {detected_language_code}")
+
+            # TTS with the local voice or the Sarvam API
+            await turn.send({"status": "processing_tts", "message": "Generating audio response..."}, coalesce_key="status")
+            async with admission.turn_slot(turn, "tts", provider=tts_provider(tts_language_code)):
+                with trace.span("tts"):
+                    audio_output_base64 = await text_to_speech(response_text, target_lang_code=tts_language_code)
+
+        # Timestamp when TTS completed
+        tts_completed_timestamp = trace.wall_time()
+
+        # Add assistant response to database with timestamps in the background
+        trace.track("db_write", db_manager.add_assistant_message_background(
+            session_id, 
+            original_response_text,  # Store original English response
+            llm_completed_at=llm_completed_timestamp,
+            tts_completed_at=tts_completed_timestamp
+        ))
+
+        # Stage durations in seconds with millisecond precision, plus the raw spans
+        performance = {
+            "stt_duration": trace.stage_seconds("audio_prep", "stt", "admission.stt"),
+            "llm_duration": trace.stage_seconds("agent", "admission.llm"),
+            "translation_duration": trace.stage_seconds("translate", "admission.translate"),
+            "tts_duration": trace.stage_seconds("tts", "admission.tts"),
+            "total_duration": round(trace.elapsed(), 3),
+            "llm_tokens": (current_usage.get() or TokenUsage()).to_dict(),
+            "trace_id": trace.trace_id,
+            "spans": trace.finished_spans(),
+        }
+        logger.info(f"Performance metrics for {client_id}: STT: {performance['stt_duration']}s, LLM: {performance['llm_duration']}s, Translation: {performance['translation_duration']}s, TTS: {performance['tts_duration']}s, Total: {performance['total_duration']}s")
+
+        if audio_output_base64 or streamed_audio:
+            # Add navigation URL to the response payload if available
+            response_payload = {
+                "status": "response_ready",
+                "text": response_text,
+                "performance": performance
+            }
+            if streamed_audio:
+                # The audio was already sent sentence by sentence as partial_audio frames
+                response_payload["streamed"] = True
             else:
-                # API failed to return text
-                error_message = "AI failed to generate a response."
-                logger.error(f"API Error for {client_id}: {error_message}")
-                await manager.send_personal_message(json.dumps({"status": "error", "message": error_message}), client_id)
+                response_payload["audio_base64"] = audio_output_base64
+
+            # Add navigation_url to the payload if it exists
+            if navigation_url:
+                response_payload["navigation_url"] = navigation_url
+                logger.info(f"Adding navigation URL to response: {navigation_url}")
+
+            await turn.send(response_payload, on_sent=trace.defer("send"))
+        else:
+            # Include navigation URL in error response if available
+            error_payload = {
+                "status": "error",
+                "message": "Audio generation failed. Displaying text response.",
+                "text": response_text,
+                "performance": performance
+            }
+
+            # Add navigation_url to the error payload if it exists
+            if navigation_url:
+                error_payload["navigation_url"] = navigation_url
+
+            await turn.send(error_payload, on_sent=trace.defer("send"))
+
+        if SPECULATIVE_TTS:
+            # While the user answers, render the question the next reply will most likely ask
+            speculate_next_question(session_id, asked, detected_language_code, tts_language_code)
+    else:
+        # API failed to return text
+        error_message = "AI failed to generate a response."
+        logger.error(f"API Error for {client_id}: {error_message}")
+        await turn.send({"status": "error", "message": error_message})
+
+
+@router.websocket("/ws/{client_id}")
+async def websocket_endpoint(websocket: WebSocket, client_id: str):
+    await manager.connect(websocket, client_id)
+    # Turns run as tasks so this loop keeps receiving corrections and cancellations
+    scheduler = TurnScheduler(client_id, manager.send_personal_message)
+
+    try:
+        while True:
+            data = await websocket.receive()
+            if data.get("type") == "websocket.disconnect":
+                raise WebSocketDisconnect(data.get("code", 1000))
+
+            control = parse_control_message(data)
+            if control and control.get("action") == "cancel":
+                cancelled_turn = scheduler.cancel_current()
+                await manager.send_personal_message(json.dumps({"status": "cancelled", "turn_id": cancelled_turn}), client_id)
+                continue
+
+            await scheduler.submit(lambda turn, data=data: process_turn(turn, client_id, data))
 
     except WebSocketDisconnect:
         logger.debug(f"WebSocket disconnected for client {client_id}. Cleaning up resources.")
-        manager.disconnect(client_id)
+        await scheduler.close()
+        await manager.disconnect(client_id, websocket)
     except Exception as e:
         logger.error(f"Error in WebSocket endpoint for client {client_id}: {e}", exc_info=True)
         # Clean up and disconnect on general errors too
-        manager.disconnect(client_id)
+        await scheduler.close()
+        await manager.disconnect(client_id, websocket)
 
 # Session management routes
 @router.post("/sessions/new")
@@ -918,10 +1498,8 @@ async def switch_session(user_id: str, session_id: str):
     try:
         success = await db_manager.switch_session_async(user_id, session_id)
         if success:
-            # Update the session ID in the connection manager for any active connections
-            for client_id, ws in manager.active_connections.items():
-                if client_id == user_id:
-                    manager.set_session_id(client_id, session_id)
+            # Update the session ID for the user's connection, on whichever worker holds it
+            await manager.switch_session(user_id, session_id)
             
             return {"status": "success", "message": f"Switched to session {session_id}"}
         else:
@@ -931,14 +1509,53 @@ async def switch_session(user_id: str, session_id: str):
         return {"status": "error", "message": str(e)}
 
 @router.get("/sessions/{session_id}/history")
-async def get_session_history(session_id: str):
-    """Get the message history for a session."""
+async def get_session_history(session_id: str, before: Optional[int] = None, after: Optional[int] = None,
+                              limit: int = DEFAULT_HISTORY_PAGE_SIZE, fields: Optional[str] = None,
+                              compact: bool = False):
+    """Get a page of the message history for a session.
+    
+    Pages are addressed by message id: pass the ``next_before`` value of a response as
+    ``before`` to load older messages, or the id of the newest known message as ``after``
+    to load newer ones. ``fields`` is a comma-separated projection, and ``compact``
+    returns rows as lists under a single ``fields`` header instead of one dict per message.
+    """
     try:
-        messages = await db_manager.get_session_messages_async(session_id)
-        return {"status": "success", "messages": messages}
+        limit = max(1, min(limit, MAX_HISTORY_PAGE_SIZE))
+        field_list = [f.strip() for f in fields.split(",") if f.strip()] if fields else HISTORY_DEFAULT_FIELDS
+        
+        # Fetch one extra row to find out whether another page exists
+        messages = await db_manager.get_session_messages_async(
+            session_id, before_id=before, after_id=after, limit=limit + 1, fields=field_list
+        )
+        has_more = len(messages) > limit
+        if has_more:
+            messages = messages[:-1] if after is not None else messages[1:]
+        
+        page = {
+            "status": "success",
+            "has_more": has_more,
+            "next_before": messages[0]["id"] if messages else None,
+            "next_after": messages[-1]["id"] if messages else after,
+        }
+        if compact:
+            page["fields"] = list(messages[0].keys()) if messages else []
+            page["rows"] = [list(message.values()) for message in messages]
+        else:
+            page["messages"] = messages
+        return page
     except Exception as e:
         logger.error(f"Error retrieving session history: {e}", exc_info=True)
         return {"status": "error", "message": str(e)}
 
+@router.get("/sessions/{session_id}/traces")
+async def get_session_traces(session_id: str, limit: int = 20):
+    """Get the stage timings of a session's most recent turns, newest first."""
+    try:
+        traces = await db_manager.get_session_traces_async(session_id, max(1, min(limit, MAX_HISTORY_PAGE_SIZE)))
+        return {"status": "success", "traces": traces}
+    except Exception as e:
+        logger.error(f"Error retrieving session traces: {e}", exc_info=True)
+        return {"status": "error", "message": str(e)}
+
 def get_websocket_router():
     return router 
\ No newline at end of file
@@ -1,11 +1,21 @@
-from .models import User, Session, Message, init_db, get_db_session
+from .models import User, Session, Message, ArchivedSession, TraceSpan, init_db, get_db_session, get_engine, insert_ignore
 from .db_manager import DBManager
+from .history_cache import SessionHistoryCache
+from .maintenance import MaintenanceManager, RetentionPolicy, get_audio_dir
 
 __all__ = [
     'User', 
     'Session', 
     'Message', 
+    'ArchivedSession',
+    'TraceSpan',
     'init_db', 
     'get_db_session',
-    'DBManager'
+    'get_engine',
+    'insert_ignore',
+    'DBManager',
+    'SessionHistoryCache',
+    'MaintenanceManager',
+    'RetentionPolicy',
+    'get_audio_dir'
 ] 
\ No newline at end of file
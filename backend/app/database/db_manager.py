@@ -3,33 +3,59 @@ import logging
 import uuid
 import datetime
 import asyncio
-from sqlalchemy.orm import Session as DBSession
-from sqlalchemy import desc
+from sqlalchemy.orm import Session as DBSession, scoped_session, sessionmaker
+from sqlalchemy import desc, func, select, update
 import sqlalchemy.exc
 
-from .models import User, Session, Message, get_db_session, init_db
+from .models import User, Session, Message, TraceSpan, init_db, insert_ignore
+from .history_cache import SessionHistoryCache
+from .maintenance import get_audio_dir, restore_archived_session
 
 logger = logging.getLogger(__name__)
 
+# Columns that may be projected when reading session history
+HISTORY_COLUMNS = {
+    "id": Message.id,
+    "role": Message.role,
+    "content": Message.content,
+    "timestamp": Message.timestamp,
+    "audio_file": Message.audio_file,
+    "transcription": Message.transcription,
+}
+
+# Fields returned for history when the caller does not ask for specific ones
+MESSAGE_FIELDS = ["id", "role", "content", "timestamp", "audio_file", "transcription"]
+
 class DBManager:
     """Manager class for database operations related to chat sessions."""
     
-    def __init__(self):
-        """Initialize the database manager."""
+    def __init__(self, executor=None, audio_dir: Optional[str] = None):
+        """Initialize the database manager.
+
+        Blocking calls of the *_async methods run on `executor` (anything with an async
+        `run(fn, *args)`), or on the default thread pool without one. Each thread has its
+        own ORM session, as a session must not be used by two threads at once; a session
+        opened for an *_async call is closed when the call returns. `audio_dir` holds the
+        recordings of sessions restored from the archive (default: `get_audio_dir()`).
+        """
+        self.executor = executor
+        self.audio_dir = audio_dir or get_audio_dir()
         self.engine = init_db()
-        self.db = get_db_session(self.engine)
+        # Loaded attributes stay readable after the session that loaded them is closed
+        self._sessions = scoped_session(sessionmaker(bind=self.engine, expire_on_commit=False))
+        self.history_cache = SessionHistoryCache()
+
+    @property
+    def db(self) -> DBSession:
+        """The calling thread's database session."""
+        return self._sessions()
     
     def close(self):
-        """Close the database session."""
+        """Close the calling thread's database session."""
         try:
-            self.db.close()
+            self._sessions.remove()
         except sqlalchemy.exc.InvalidRequestError as e:
             logger.error(f"Error closing session: {e}")
-            try:
-                self.db.rollback()
-                self.db.close()
-            except Exception as ex:
-                logger.error(f"Failed to rollback and close: {ex}")
     
     def _ensure_valid_session(self):
         """Ensure the database session is in a valid state."""
@@ -46,34 +72,49 @@ class DBManager:
             except Exception as rollback_error:
                 logger.error(f"Failed to rollback: {rollback_error}")
                 # Create a new session as a last resort
-                self.db.close()
-                self.db = get_db_session(self.engine)
+                self._sessions.remove()
                 logger.info("Created new database session")
                 
+    def _run(self, fn, *args):
+        def call():
+            try:
+                return fn(*args)
+            finally:
+                self._sessions.remove()
+
+        if self.executor is not None:
+            return self.executor.run(call)
+        return asyncio.to_thread(call)
+
     async def close_async(self):
         """Close the database session asynchronously."""
-        await asyncio.to_thread(self.close)
+        await self._run(self.close)
     
     def get_or_create_user(self, user_id: str) -> User:
-        """Get a user by ID or create if it doesn't exist."""
+        """Get a user by ID or create if it doesn't exist.
+        
+        Creation uses INSERT ... ON CONFLICT DO NOTHING so concurrent workers racing
+        to create the same user do not fail on the unique constraint.
+        """
         self._ensure_valid_session()
         
         user = self.db.query(User).filter(User.user_id == user_id).first()
         if not user:
-            user = User(user_id=user_id)
-            self.db.add(user)
             try:
+                result = self.db.execute(insert_ignore(self.engine, User.__table__).values(user_id=user_id))
                 self.db.commit()
-                logger.info(f"Created new user with ID: {user_id}")
+                if result.rowcount:
+                    logger.info(f"Created new user with ID: {user_id}")
             except Exception as e:
                 logger.error(f"Error creating user: {e}")
                 self.db.rollback()
                 raise
+            user = self.db.query(User).filter(User.user_id == user_id).one()
         return user
     
     async def get_or_create_user_async(self, user_id: str) -> User:
         """Get a user by ID or create if it doesn't exist (async version)."""
-        return await asyncio.to_thread(self.get_or_create_user, user_id)
+        return await self._run(self.get_or_create_user, user_id)
     
     def create_session(self, user_id: str) -> Tuple[str, int]:
         """Create a new session for a user."""
@@ -99,6 +140,9 @@ class DBManager:
             self.db.add(system_msg)
             self.db.commit()
             
+            # A new session's history is exactly the system message
+            self.history_cache.put(session_id, [{"role": "system", "content": system_msg.content}])
+            
             logger.info(f"Created new session {session_id} for user {user_id}")
             return session_id, session.id
         except Exception as e:
@@ -108,7 +152,7 @@ class DBManager:
     
     async def create_session_async(self, user_id: str) -> Tuple[str, int]:
         """Create a new session for a user (async version)."""
-        return await asyncio.to_thread(self.create_session, user_id)
+        return await self._run(self.create_session, user_id)
     
     def get_active_session(self, user_id: str) -> Optional[Tuple[str, int]]:
         """Get the active session for a user."""
@@ -126,7 +170,7 @@ class DBManager:
     
     async def get_active_session_async(self, user_id: str) -> Optional[Tuple[str, int]]:
         """Get the active session for a user (async version)."""
-        return await asyncio.to_thread(self.get_active_session, user_id)
+        return await self._run(self.get_active_session, user_id)
     
     def get_or_create_session(self, user_id: str) -> Tuple[str, int]:
         """Get the active session for a user or create a new one."""
@@ -139,7 +183,7 @@ class DBManager:
     
     async def get_or_create_session_async(self, user_id: str) -> Tuple[str, int]:
         """Get the active session for a user or create a new one (async version)."""
-        return await asyncio.to_thread(self.get_or_create_session, user_id)
+        return await self._run(self.get_or_create_session, user_id)
     
     def get_all_sessions(self, user_id: str) -> List[Dict]:
         """Get all sessions for a user."""
@@ -151,14 +195,16 @@ class DBManager:
                 "session_id": session.session_id,
                 "created_at": session.created_at,
                 "last_interaction": session.last_interaction,
-                "is_active": session.is_active
+                "is_active": session.is_active,
+                "prompt_tokens": session.prompt_tokens or 0,
+                "completion_tokens": session.completion_tokens or 0
             }
             for session in sessions
         ]
     
     async def get_all_sessions_async(self, user_id: str) -> List[Dict]:
         """Get all sessions for a user (async version)."""
-        return await asyncio.to_thread(self.get_all_sessions, user_id)
+        return await self._run(self.get_all_sessions, user_id)
     
     def get_session_by_id(self, session_id: str) -> Optional[Session]:
         """Get a session by its string ID."""
@@ -166,51 +212,102 @@ class DBManager:
     
     async def get_session_by_id_async(self, session_id: str) -> Optional[Session]:
         """Get a session by its string ID (async version)."""
-        return await asyncio.to_thread(self.get_session_by_id, session_id)
+        return await self._run(self.get_session_by_id, session_id)
     
-    def get_session_messages(self, session_id: str) -> List[Dict]:
-        """Get all messages for a session."""
-        session = self.get_session_by_id(session_id)
-        if not session:
+    def _get_session_pk(self, session_id: str) -> Optional[int]:
+        """Get the primary key of a session without loading the Session object."""
+        return self.db.query(Session.id).filter(Session.session_id == session_id).scalar()
+    
+    def _restore_if_archived(self, session_id: str, session_pk: int):
+        """Bring back an archived session's messages; live sessions cost one indexed lookup."""
+        if self.db.query(Message.id).filter(Message.session_id == session_pk).first() is not None:
+            return
+        if restore_archived_session(self.db, session_id, self.audio_dir):
+            self.history_cache.invalidate(session_id)
+    
+    def get_session_messages(self, session_id: str, before_id: Optional[int] = None,
+                             after_id: Optional[int] = None, limit: Optional[int] = None,
+                             fields: Optional[List[str]] = None) -> List[Dict]:
+        """Get messages for a session, optionally as a keyset-paginated page.
+        
+        Messages are ordered by id. ``before_id`` returns the ``limit`` messages
+        immediately preceding that id, ``after_id`` the ones immediately following it,
+        and with neither the most recent ``limit`` messages are returned. Only the
+        requested ``fields`` are selected, so no ORM objects are built. A session whose
+        messages were archived is restored first.
+        """
+        session_pk = self._get_session_pk(session_id)
+        if session_pk is None:
             return []
+        if before_id is None and after_id is None:
+            self._restore_if_archived(session_id, session_pk)
+        
+        fields = [field for field in (fields or MESSAGE_FIELDS) if field in HISTORY_COLUMNS]
+        if "id" not in fields:
+            fields.insert(0, "id")
+        columns = [HISTORY_COLUMNS[field] for field in fields]
+        
+        query = self.db.query(*columns).filter(Message.session_id == session_pk)
+        if after_id is not None:
+            query = query.filter(Message.id > after_id).order_by(Message.id)
+        else:
+            if before_id is not None:
+                query = query.filter(Message.id < before_id)
+            # Without a limit the whole history is wanted, so keep ascending order
+            query = query.order_by(desc(Message.id) if limit is not None else Message.id)
+        if limit is not None:
+            query = query.limit(limit)
         
-        messages = self.db.query(Message).filter(Message.session_id == session.id).order_by(Message.timestamp).all()
+        rows = query.all()
+        if limit is not None and after_id is None:
+            rows.reverse()
         
         return [
             {
-                "role": message.role,
-                "content": message.content,
-                "timestamp": message.timestamp,
-                "audio_file": message.audio_file,
-                "transcription": message.transcription
+                field: value.isoformat() if isinstance(value, datetime.datetime) else value
+                for field, value in zip(fields, row)
             }
-            for message in messages
+            for row in rows
         ]
     
-    async def get_session_messages_async(self, session_id: str) -> List[Dict]:
-        """Get all messages for a session (async version)."""
-        return await asyncio.to_thread(self.get_session_messages, session_id)
+    async def get_session_messages_async(self, session_id: str, before_id: Optional[int] = None,
+                                         after_id: Optional[int] = None, limit: Optional[int] = None,
+                                         fields: Optional[List[str]] = None) -> List[Dict]:
+        """Get messages for a session, optionally paginated (async version)."""
+        return await self._run(self.get_session_messages, session_id, before_id, after_id, limit, fields)
     
     def get_session_history_for_llm(self, session_id: str) -> List[Dict[str, str]]:
-        """Get the session history in a format suitable for the LLM."""
-        session = self.get_session_by_id(session_id)
-        if not session:
+        """Get the session history in a format suitable for the LLM.
+        
+        Reads are served from the history cache; the database is only queried on a miss.
+        """
+        cached = self.history_cache.get(session_id)
+        if cached is not None:
+            return cached
+        
+        session_pk = self._get_session_pk(session_id)
+        if session_pk is None:
             return []
         
-        messages = self.db.query(Message).filter(Message.session_id == session.id).order_by(Message.timestamp).all()
+        token = self.history_cache.begin_load(session_id)        
+        rows = self.db.query(Message.role, Message.content).filter(
+            Message.session_id == session_pk
+        ).order_by(Message.id).all()
         
-        return [
-            {"role": message.role, "content": message.content}
-            for message in messages
+        history = [
+            {"role": role, "content": content}
+            for role, content in rows
         ]
+        self.history_cache.put(session_id, history, token)
+        return history
     
     async def get_session_history_for_llm_async(self, session_id: str) -> List[Dict[str, str]]:
         """Get the session history in a format suitable for the LLM (async version)."""
-        return await asyncio.to_thread(self.get_session_history_for_llm, session_id)
+        return await self._run(self.get_session_history_for_llm, session_id)
     
     def add_user_message(self, session_id: str, content: str, audio_file: Optional[str] = None, 
-                       transcription: Optional[str] = None, received_at: Optional[int] = None,
-                       stt_completed_at: Optional[int] = None) -> Message:
+                       transcription: Optional[str] = None, received_at: Optional[float] = None,
+                       stt_completed_at: Optional[float] = None) -> Message:
         """Add a user message to a session with performance tracking timestamps."""
         session = self.get_session_by_id(session_id)
         if not session:
@@ -232,17 +329,21 @@ class DBManager:
         )
         self.db.add(message)
         self.db.commit()
+        self.history_cache.append(session_id, {"role": "user", "content": content})
         
         return message
     
     def add_user_message_background(self, session_id: str, content: str, audio_file: Optional[str] = None, 
-                              transcription: Optional[str] = None, received_at: Optional[int] = None,
-                              stt_completed_at: Optional[int] = None):
-        """Add a user message to a session in the background without waiting for completion."""
+                              transcription: Optional[str] = None, received_at: Optional[float] = None,
+                              stt_completed_at: Optional[float] = None):
+        """Add a user message to a session in the background without waiting for completion.
+        
+        Returns the task so callers can time the write or wait for it off the critical path.
+        """
         # Start the database operation in a thread but don't block
         # Fire and forget to prevent blocking the main flow
-        asyncio.create_task(
-            asyncio.to_thread(
+        return asyncio.create_task(
+            self._run(
                 self.add_user_message, 
                 session_id, 
                 content, 
@@ -252,11 +353,10 @@ class DBManager:
                 stt_completed_at
             )
         )
-        return None  # We don't wait for the result
     
     def add_assistant_message(self, session_id: str, content: str, 
-                           llm_completed_at: Optional[int] = None,
-                           tts_completed_at: Optional[int] = None) -> Message:
+                           llm_completed_at: Optional[float] = None,
+                           tts_completed_at: Optional[float] = None) -> Message:
         """Add an assistant message to a session with performance tracking timestamps."""
         session = self.get_session_by_id(session_id)
         if not session:
@@ -276,17 +376,21 @@ class DBManager:
         )
         self.db.add(message)
         self.db.commit()
+        self.history_cache.append(session_id, {"role": "assistant", "content": content})
         
         return message
     
     def add_assistant_message_background(self, session_id: str, content: str, 
-                                  llm_completed_at: Optional[int] = None,
-                                  tts_completed_at: Optional[int] = None):
-        """Add an assistant message to a session in the background without waiting for completion."""
+                                  llm_completed_at: Optional[float] = None,
+                                  tts_completed_at: Optional[float] = None):
+        """Add an assistant message to a session in the background without waiting for completion.
+        
+        Returns the task so callers can time the write or wait for it off the critical path.
+        """
         # Start the database operation in a thread but don't block
         # Fire and forget to prevent blocking the main flow
-        asyncio.create_task(
-            asyncio.to_thread(
+        return asyncio.create_task(
+            self._run(
                 self.add_assistant_message, 
                 session_id, 
                 content, 
@@ -294,10 +398,127 @@ class DBManager:
                 tts_completed_at
             )
         )
-        return None  # We don't wait for the result
+    
+    def get_session_language(self, session_id: str) -> Tuple[Optional[str], int]:
+        """Get the language learned for a session and for how many consecutive turns it was detected."""
+        with self.engine.connect() as conn:
+            row = conn.execute(
+                select(Session.language_code, Session.language_turns).where(Session.session_id == session_id)
+            ).first()
+        if not row:
+            return None, 0
+        return row.language_code, row.language_turns or 0
+    
+    async def get_session_language_async(self, session_id: str) -> Tuple[Optional[str], int]:
+        """Get the language learned for a session (async version)."""
+        return await self._run(self.get_session_language, session_id)
+    
+    def set_session_language(self, session_id: str, language_code: Optional[str], turns: int) -> bool:
+        """Store the language learned for a session."""
+        # A Core update in its own short transaction; no ORM objects are loaded
+        with self.engine.begin() as conn:
+            result = conn.execute(
+                update(Session).where(Session.session_id == session_id)
+                .values(language_code=language_code, language_turns=turns)
+            )
+        return result.rowcount > 0
+    
+    def set_session_language_background(self, session_id: str, language_code: Optional[str], turns: int):
+        """Store the language learned for a session without waiting for the write."""
+        return asyncio.create_task(self._run(self.set_session_language, session_id, language_code, turns))
+    
+    def get_session_tokens(self, session_id: str) -> Tuple[int, int]:
+        """Get the prompt and completion tokens a session has used."""
+        with self.engine.connect() as conn:
+            row = conn.execute(
+                select(Session.prompt_tokens, Session.completion_tokens).where(Session.session_id == session_id)
+            ).first()
+        if not row:
+            return 0, 0
+        return row.prompt_tokens or 0, row.completion_tokens or 0
+    
+    async def get_session_tokens_async(self, session_id: str) -> Tuple[int, int]:
+        """Get the prompt and completion tokens a session has used (async version)."""
+        return await self._run(self.get_session_tokens, session_id)
+    
+    def add_session_tokens(self, session_id: str, prompt_tokens: int, completion_tokens: int) -> bool:
+        """Add the tokens of a turn to its session's totals."""
+        # An increment in the database, so turns finishing on other workers are not lost
+        with self.engine.begin() as conn:
+            result = conn.execute(
+                update(Session).where(Session.session_id == session_id)
+                .values(prompt_tokens=func.coalesce(Session.prompt_tokens, 0) + prompt_tokens,
+                        completion_tokens=func.coalesce(Session.completion_tokens, 0) + completion_tokens)
+            )
+        return result.rowcount > 0
+    
+    def add_session_tokens_background(self, session_id: str, prompt_tokens: int, completion_tokens: int):
+        """Add the tokens of a turn to its session's totals without waiting for the write."""
+        return asyncio.create_task(self._run(self.add_session_tokens, session_id, prompt_tokens,
+                                                 completion_tokens))
+    
+    def add_trace_spans(self, session_id: str, spans: List[Dict]) -> int:
+        """Store the stage spans of one turn, as produced by `TurnTrace.rows()`."""
+        if not spans:
+            return 0
+        session_pk = select(Session.id).where(Session.session_id == session_id).scalar_subquery()
+        # A Core executemany in its own short transaction; no ORM objects are built
+        with self.engine.begin() as conn:
+            conn.execute(TraceSpan.__table__.insert().values(session_id=session_pk), spans)
+        return len(spans)
+    
+    async def add_trace_spans_async(self, session_id: str, spans: List[Dict]) -> int:
+        """Store the stage spans of one turn (async version)."""
+        return await self._run(self.add_trace_spans, session_id, spans)
+    
+    def get_session_traces(self, session_id: str, limit: int = 20) -> List[Dict]:
+        """Return the most recent turn traces of a session, newest first, with their spans."""
+        session_pk = self._get_session_pk(session_id)
+        if session_pk is None:
+            return []
+        
+        with self.engine.connect() as conn:
+            started = func.min(TraceSpan.started_at)
+            recent = conn.execute(
+                select(TraceSpan.trace_id, func.max(TraceSpan.turn_id))
+                .where(TraceSpan.session_id == session_pk)
+                .group_by(TraceSpan.trace_id)
+                .order_by(started.desc())
+                .limit(limit)
+            )
+            traces = {
+                trace_id: {"trace_id": trace_id, "turn_id": turn_id, "spans": []}
+                for trace_id, turn_id in recent
+            }
+            if not traces:
+                return []
+            
+            rows = conn.execute(
+                select(TraceSpan.trace_id, TraceSpan.name, TraceSpan.started_at, TraceSpan.duration_ms, TraceSpan.error)
+                .where(TraceSpan.trace_id.in_(list(traces)))
+                .order_by(TraceSpan.started_at)
+            )
+            for trace_id, name, started_at, duration_ms, error in rows:
+                traces[trace_id]["spans"].append({
+                    "name": name,
+                    "started_at": started_at,
+                    "duration_ms": duration_ms,
+                    "error": bool(error),
+                })
+        
+        for trace in traces.values():
+            start = min(span["started_at"] for span in trace["spans"])
+            end = max(span["started_at"] + span["duration_ms"] / 1000 for span in trace["spans"])
+            trace["started_at"] = start
+            trace["total_ms"] = (end - start) * 1000
+        return list(traces.values())
+    
+    async def get_session_traces_async(self, session_id: str, limit: int = 20) -> List[Dict]:
+        """Return the most recent turn traces of a session (async version)."""
+        return await self._run(self.get_session_traces, session_id, limit)
     
     def switch_session(self, user_id: str, new_session_id: str) -> bool:
-        """Switch the active session for a user."""
+        """Switch the active session for a user, restoring its messages if they were archived."""
         user = self.get_or_create_user(user_id)
         
         # Deactivate all current sessions
@@ -308,6 +529,7 @@ class DBManager:
         
         for session in active_sessions:
             session.is_active = False
+            self.history_cache.invalidate(session.session_id)
         
         # Activate the new session
         new_session = self.db.query(Session).filter(
@@ -315,10 +537,13 @@ class DBManager:
             Session.session_id == new_session_id
         ).first()
         
+        self.history_cache.invalidate(new_session_id)
         if new_session:
             new_session.is_active = True
             new_session.last_interaction = datetime.datetime.utcnow()
             self.db.commit()
+            # An archived session is being picked up again, so its history is needed
+            self._restore_if_archived(new_session_id, new_session.id)
             return True
         
         self.db.commit()
@@ -326,7 +551,7 @@ class DBManager:
         
     async def switch_session_async(self, user_id: str, new_session_id: str) -> bool:
         """Switch the active session for a user (async version)."""
-        return await asyncio.to_thread(self.switch_session, user_id, new_session_id)
+        return await self._run(self.switch_session, user_id, new_session_id)
     
     def _safe_commit(self):
         """Safely commit changes with rollback on error."""
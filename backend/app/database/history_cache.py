@@ -0,0 +1,152 @@
+from typing import List, Dict, Optional
+from collections import OrderedDict
+import logging
+import os
+import sys
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+# Cache bounds (overridable through the environment)
+HISTORY_CACHE_MAX_SESSIONS = int(os.getenv("HISTORY_CACHE_MAX_SESSIONS", "1000"))
+HISTORY_CACHE_MAX_BYTES = int(os.getenv("HISTORY_CACHE_MAX_BYTES", str(64 * 1024 * 1024)))
+# Seconds an entry is served after it was loaded from the database; 0 disables expiry
+HISTORY_CACHE_TTL_SECONDS = float(os.getenv("HISTORY_CACHE_TTL_SECONDS", "30"))
+
+
+def _message_size(message: Dict[str, str]) -> int:
+    """Approximate the memory held by one cached history message."""
+    return sys.getsizeof(message) + sum(sys.getsizeof(value) for value in message.values())
+
+
+class SessionHistoryCache:
+    """In-memory LRU cache of per-session LLM history.
+
+    Entries are filled from the database on a miss and then kept current by appending
+    every message the server writes, so steady-state reads never touch the database.
+    The cache is bounded both by number of sessions and by approximate bytes held.
+    Other workers may write to the same session, which this cache never sees, so an
+    entry is reloaded `ttl` seconds after it was loaded even if it was appended to.
+    All methods are thread-safe because writes happen from worker threads.
+    """
+
+    def __init__(self, max_sessions: int = HISTORY_CACHE_MAX_SESSIONS,
+                 max_bytes: int = HISTORY_CACHE_MAX_BYTES, ttl: float = HISTORY_CACHE_TTL_SECONDS):
+        self.max_sessions = max_sessions
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self._entries: "OrderedDict[str, List[Dict[str, str]]]" = OrderedDict()
+        self._sizes: Dict[str, int] = {}
+        self._loaded_at: Dict[str, float] = {}
+        self._total_bytes = 0
+        # Tokens of loads in flight per session; a write to the session revokes them
+        self._loads: Dict[str, set] = {}
+        self._lock = threading.Lock()
+
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, session_id: str) -> Optional[List[Dict[str, str]]]:
+        """Return a copy of the cached history, or None on a miss."""
+        with self._lock:
+            messages = self._entries.get(session_id)
+            if messages is not None and self.ttl > 0 \
+                    and time.monotonic() - self._loaded_at[session_id] > self.ttl:
+                self._remove(session_id)
+                messages = None
+            if messages is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(session_id)
+            self.hits += 1
+            return list(messages)
+
+    def begin_load(self, session_id: str) -> object:
+        """Register a database load for a session and return a token for `put`."""
+        token = object()
+        with self._lock:
+            self._loads.setdefault(session_id, set()).add(token)
+        return token
+
+    def put(self, session_id: str, messages: List[Dict[str, str]], token: Optional[object] = None):
+        """Store the full history for a session.
+
+        When a token from `begin_load` is given, the history is only stored if no
+        message was written to the session while it was being loaded.
+        """
+        with self._lock:
+            if token is not None:
+                tokens = self._loads.get(session_id)
+                if not tokens or token not in tokens:
+                    logger.debug(f"Discarding stale history load for session {session_id}")
+                    return
+                tokens.discard(token)
+                if not tokens:
+                    del self._loads[session_id]
+
+            self._remove(session_id)
+            messages = list(messages)
+            size = sum(_message_size(message) for message in messages)
+            self._entries[session_id] = messages
+            self._sizes[session_id] = size
+            self._loaded_at[session_id] = time.monotonic()
+            self._total_bytes += size
+            self._evict()
+
+    def append(self, session_id: str, message: Dict[str, str]):
+        """Append a newly written message to a cached session, if present."""
+        with self._lock:
+            self._loads.pop(session_id, None)
+            messages = self._entries.get(session_id)
+            if messages is None:
+                return
+            messages.append(message)
+            size = _message_size(message)
+            self._sizes[session_id] += size
+            self._total_bytes += size
+            self._evict()
+
+    def invalidate(self, session_id: str):
+        """Drop a session from the cache."""
+        with self._lock:
+            self._loads.pop(session_id, None)
+            self._remove(session_id)
+
+    def clear(self):
+        """Drop every cached session."""
+        with self._lock:
+            self._entries.clear()
+            self._sizes.clear()
+            self._loaded_at.clear()
+            self._loads.clear()
+            self._total_bytes = 0
+
+    def stats(self) -> Dict[str, int]:
+        """Return counters describing cache usage."""
+        with self._lock:
+            return {
+                "sessions": len(self._entries),
+                "bytes": self._total_bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+            }
+
+    def _remove(self, session_id: str):
+        if session_id in self._entries:
+            del self._entries[session_id]
+            del self._loaded_at[session_id]
+            self._total_bytes -= self._sizes.pop(session_id)
+
+    def _evict(self):
+        # Keep the most recently used entry even if it alone exceeds the byte budget
+        while len(self._entries) > 1 and (
+            len(self._entries) > self.max_sessions or self._total_bytes > self.max_bytes
+        ):
+            session_id, _ = self._entries.popitem(last=False)
+            del self._loaded_at[session_id]
+            self._total_bytes -= self._sizes.pop(session_id)
+            self.evictions += 1
+            logger.debug(f"Evicted session {session_id} from history cache")
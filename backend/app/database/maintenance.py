@@ -0,0 +1,427 @@
+from typing import Dict, List, Optional
+from contextlib import contextmanager
+import logging
+import os
+import time
+import json
+import zlib
+import datetime
+import asyncio
+from sqlalchemy import case, text, update
+
+from .models import Session, Message, ArchivedSession, TraceSpan, get_db_session, init_db
+from .history_cache import SessionHistoryCache
+
+try:
+    import fcntl
+except ImportError:  # Windows; maintenance then relies on running in a single process
+    fcntl = None
+
+logger = logging.getLogger(__name__)
+
+# Held while a process runs maintenance, so server workers never run it in parallel
+MAINTENANCE_LOCK_FILE = ".maintenance.lock"
+
+# Formats old audio can be re-encoded to, mapped to (file extension, pydub export options)
+AUDIO_ARCHIVE_FORMATS = {
+    "flac": ("flac", {"format": "flac"}),
+    "opus": ("opus", {"format": "opus", "codec": "libopus", "bitrate": "24k"}),
+}
+
+# Fields copied into an archived session's payload
+ARCHIVED_MESSAGE_FIELDS = [
+    "id", "timestamp", "role", "content", "audio_file", "transcription",
+    "received_at", "stt_completed_at", "llm_completed_at", "tts_completed_at",
+]
+
+
+class RetentionPolicy:
+    """Retention settings for messages and audio files.
+
+    Every value defaults to an environment variable so deployments can tune retention
+    without code changes. An age of 0 disables the corresponding job.
+    """
+
+    def __init__(self,
+                 audio_compress_after_days: Optional[int] = None,
+                 audio_delete_after_days: Optional[int] = None,
+                 session_archive_after_days: Optional[int] = None,
+                 audio_format: Optional[str] = None,
+                 batch_size: Optional[int] = None,
+                 batch_pause: Optional[float] = None,
+                 vacuum_pages: Optional[int] = None):
+        self.audio_compress_after_days = audio_compress_after_days if audio_compress_after_days is not None \
+            else int(os.getenv("AUDIO_COMPRESS_AFTER_DAYS", "7"))
+        self.audio_delete_after_days = audio_delete_after_days if audio_delete_after_days is not None \
+            else int(os.getenv("AUDIO_DELETE_AFTER_DAYS", "0"))
+        self.session_archive_after_days = session_archive_after_days if session_archive_after_days is not None \
+            else int(os.getenv("SESSION_ARCHIVE_AFTER_DAYS", "30"))
+        self.audio_format = audio_format or os.getenv("AUDIO_ARCHIVE_FORMAT", "opus")
+        self.batch_size = batch_size or int(os.getenv("MAINTENANCE_BATCH_SIZE", "100"))
+        # Pause between batches so request-path writers can take the write lock
+        self.batch_pause = batch_pause if batch_pause is not None \
+            else float(os.getenv("MAINTENANCE_BATCH_PAUSE", "0.05"))
+        self.vacuum_pages = vacuum_pages or int(os.getenv("MAINTENANCE_VACUUM_PAGES", "1000"))
+
+        if self.audio_format not in AUDIO_ARCHIVE_FORMATS:
+            raise ValueError(f"Unsupported audio archive format: {self.audio_format}")
+
+
+def get_audio_dir() -> str:
+    """The directory recordings are saved in: `AUDIO_DIR`, or `audio_files` in the backend directory."""
+    return os.getenv("AUDIO_DIR") or os.path.join(
+        os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))), "audio_files")
+
+
+def _remove_file(path: str) -> Optional[int]:
+    """Delete a file and return its size, or None if it was already gone."""
+    try:
+        size = os.path.getsize(path)
+        os.remove(path)
+        return size
+    except FileNotFoundError:
+        return None
+
+
+def _parse_audio_timestamp(filename: str) -> Optional[int]:
+    """Extract the Unix timestamp from a `{client_id}_{session_id}_{timestamp}.ext` filename."""
+    stem = os.path.splitext(filename)[0]
+    parts = stem.rsplit("_", 2)
+    if len(parts) != 3:
+        return None
+    try:
+        return int(parts[2])
+    except ValueError:
+        return None
+
+
+def _current_audio_file(audio_dir: str, filename: Optional[str]) -> Optional[str]:
+    """Where an archived message's recording is now: as saved, re-encoded, or None once deleted."""
+    if not filename or os.path.exists(os.path.join(audio_dir, filename)):
+        return filename
+    stem = os.path.splitext(filename)[0]
+    for extension, _ in AUDIO_ARCHIVE_FORMATS.values():
+        if os.path.exists(os.path.join(audio_dir, f"{stem}.{extension}")):
+            return f"{stem}.{extension}"
+    return None
+
+
+def restore_archived_session(db, session_id: str, audio_dir: str) -> int:
+    """Move an archived session's messages back into the messages table and commit.
+
+    Audio jobs only repoint live messages, so each restored message's recording is
+    looked up in `audio_dir` again. Returns the number of messages restored, 0 if the
+    session has no archive. When two callers restore the same session at once, only
+    the one that deletes the archive row inserts its messages.
+    """
+    archive = db.query(ArchivedSession).filter(ArchivedSession.session_id == session_id).first()
+    session_pk = db.query(Session.id).filter(Session.session_id == session_id).scalar()
+    if not archive or session_pk is None:
+        return 0
+    try:
+        messages = json.loads(zlib.decompress(archive.payload))
+        deleted = db.query(ArchivedSession).filter(
+            ArchivedSession.session_id == session_id).delete(synchronize_session=False)
+        if not deleted:
+            db.rollback()
+            return 0
+        for message in messages:
+            message.pop("id", None)
+            message["session_id"] = session_pk
+            message["audio_file"] = _current_audio_file(audio_dir, message.get("audio_file"))
+            if message.get("timestamp"):
+                message["timestamp"] = datetime.datetime.fromisoformat(message["timestamp"])
+        db.bulk_insert_mappings(Message, messages)
+        db.commit()
+    except Exception:
+        db.rollback()
+        raise
+    logger.info(f"Restored {len(messages)} archived messages of session {session_id}")
+    return len(messages)
+
+
+class MaintenanceManager:
+    """Runs retention, archival and compaction jobs in small, separately committed batches."""
+
+    def __init__(self, audio_dir: str, policy: Optional[RetentionPolicy] = None, engine=None,
+                 history_cache: Optional[SessionHistoryCache] = None, executor=None):
+        self.audio_dir = audio_dir
+        self.policy = policy or RetentionPolicy()
+        self.engine = engine if engine is not None else init_db()
+        # Archived sessions must be dropped from the live history cache
+        self.history_cache = history_cache
+        self.last_report: Optional[Dict] = None
+        # Runs run_once_async; the default thread pool without one
+        self.executor = executor
+
+    # ---- Audio files ----
+
+    def _audio_files_older_than(self, days: int, extensions: tuple) -> List[str]:
+        if days <= 0 or not os.path.isdir(self.audio_dir):
+            return []
+        cutoff = time.time() - days * 86400
+        files = []
+        for entry in os.scandir(self.audio_dir):
+            if not entry.is_file() or not entry.name.endswith(extensions):
+                continue
+            try:
+                created = _parse_audio_timestamp(entry.name) or entry.stat().st_mtime
+            except FileNotFoundError:
+                continue
+            if created < cutoff:
+                files.append(entry.name)
+        return sorted(files)
+
+    def _rename_audio_references(self, db, renames: Dict[str, Optional[str]]):
+        # One indexed UPDATE per batch keeps the write transaction short
+        if renames:
+            db.execute(
+                update(Message)
+                .where(Message.audio_file.in_(list(renames)))
+                .values(audio_file=case(renames, value=Message.audio_file))
+            )
+        db.commit()
+
+    def compress_audio(self) -> Dict[str, int]:
+        """Re-encode WAV files older than the policy threshold and repoint their messages."""
+        extension, export_options = AUDIO_ARCHIVE_FORMATS[self.policy.audio_format]
+        pending = self._audio_files_older_than(self.policy.audio_compress_after_days, (".wav",))
+        stats = {"files": 0, "bytes_reclaimed": 0, "errors": 0}
+        if not pending:
+            return stats
+
+        from pydub import AudioSegment
+
+        for start in range(0, len(pending), self.policy.batch_size):
+            batch = pending[start:start + self.policy.batch_size]
+            renames = {}
+            for filename in batch:
+                source = os.path.join(self.audio_dir, filename)
+                target_name = f"{os.path.splitext(filename)[0]}.{extension}"
+                target = os.path.join(self.audio_dir, target_name)
+                try:
+                    AudioSegment.from_wav(source).export(target, **export_options)
+                    stats["bytes_reclaimed"] += os.path.getsize(source) - os.path.getsize(target)
+                    renames[filename] = target_name
+                except FileNotFoundError:
+                    logger.debug(f"Audio file {filename} is already gone; skipping it")
+                except Exception as e:
+                    logger.error(f"Failed to compress audio file {filename}: {e}")
+                    stats["errors"] += 1
+                    if os.path.exists(target):
+                        os.remove(target)
+
+            # Only remove the originals once the database points at the compressed copies
+            db = get_db_session(self.engine)
+            try:
+                self._rename_audio_references(db, renames)
+            finally:
+                db.close()
+            for filename in renames:
+                _remove_file(os.path.join(self.audio_dir, filename))
+            stats["files"] += len(renames)
+            time.sleep(self.policy.batch_pause)
+
+        return stats
+
+    def delete_expired_audio(self) -> Dict[str, int]:
+        """Delete audio files past the retention period and clear their message references."""
+        extensions = (".wav",) + tuple(f".{ext}" for ext, _ in AUDIO_ARCHIVE_FORMATS.values())
+        expired = self._audio_files_older_than(self.policy.audio_delete_after_days, extensions)
+        stats = {"files": 0, "bytes_reclaimed": 0}
+
+        for start in range(0, len(expired), self.policy.batch_size):
+            batch = expired[start:start + self.policy.batch_size]
+            db = get_db_session(self.engine)
+            try:
+                self._rename_audio_references(db, {filename: None for filename in batch})
+            finally:
+                db.close()
+            for filename in batch:
+                removed = _remove_file(os.path.join(self.audio_dir, filename))
+                if removed is not None:
+                    stats["bytes_reclaimed"] += removed
+                    stats["files"] += 1
+            time.sleep(self.policy.batch_pause)
+
+        return stats
+
+    # ---- Session archival ----
+
+    def archive_cold_sessions(self) -> Dict[str, int]:
+        """Move messages of inactive sessions past the archive threshold into `archived_sessions`.
+
+        Each session is archived in its own short transaction. The session row itself is
+        kept so it still appears in the user's session list and can be restored.
+        """
+        stats = {"sessions": 0, "messages": 0}
+        if self.policy.session_archive_after_days <= 0:
+            return stats
+
+        cutoff = datetime.datetime.utcnow() - datetime.timedelta(days=self.policy.session_archive_after_days)
+        columns = [getattr(Message, field) for field in ARCHIVED_MESSAGE_FIELDS]
+        last_pk = 0
+
+        while True:
+            db = get_db_session(self.engine)
+            try:
+                candidates = db.query(Session.id, Session.session_id).filter(
+                    Session.id > last_pk,
+                    Session.is_active == False,
+                    Session.last_interaction < cutoff,
+                    Session.messages.any()
+                ).order_by(Session.id).limit(self.policy.batch_size).all()
+                if not candidates:
+                    break
+
+                for session_pk, session_id in candidates:
+                    rows = db.query(*columns).filter(Message.session_id == session_pk).order_by(Message.id).all()
+                    messages = [
+                        {
+                            field: value.isoformat() if isinstance(value, datetime.datetime) else value
+                            for field, value in zip(ARCHIVED_MESSAGE_FIELDS, row)
+                        }
+                        for row in rows
+                    ]
+                    archive = db.query(ArchivedSession).filter(ArchivedSession.session_id == session_id).first()
+                    if archive:
+                        # Sessions archived before keep earlier messages ahead of the new ones
+                        messages = json.loads(zlib.decompress(archive.payload)) + messages
+                    else:
+                        archive = ArchivedSession(session_id=session_id)
+                        db.add(archive)
+                    archive.payload = zlib.compress(json.dumps(messages).encode("utf-8"))
+                    archive.message_count = len(messages)
+                    archive.archived_at = datetime.datetime.utcnow()
+
+                    db.query(Message).filter(Message.session_id == session_pk).delete(synchronize_session=False)
+                    # Stage timings are only useful while a session is live; they are not archived
+                    db.query(TraceSpan).filter(TraceSpan.session_id == session_pk).delete(synchronize_session=False)
+                    db.commit()
+
+                    if self.history_cache is not None:
+                        self.history_cache.invalidate(session_id)
+                    stats["sessions"] += 1
+                    stats["messages"] += len(rows)
+                    last_pk = session_pk
+            except Exception:
+                db.rollback()
+                raise
+            finally:
+                db.close()
+            time.sleep(self.policy.batch_pause)
+
+        return stats
+
+    def restore_session(self, session_id: str) -> int:
+        """Move an archived session's messages back into the messages table."""
+        db = get_db_session(self.engine)
+        try:
+            restored = restore_archived_session(db, session_id, self.audio_dir)
+        finally:
+            db.close()
+        if restored and self.history_cache is not None:
+            self.history_cache.invalidate(session_id)
+        return restored
+
+    # ---- Database compaction ----
+
+    def compact_database(self) -> Dict[str, int]:
+        """Release free pages incrementally and refresh planner statistics."""
+        stats = {"pages_freed": 0, "bytes_reclaimed": 0}
+        with self.engine.connect() as conn:
+            if self.engine.dialect.name != "sqlite":
+                conn.execute(text("ANALYZE"))
+                conn.commit()
+                return stats
+
+            page_size = conn.execute(text("PRAGMA page_size")).scalar()
+            auto_vacuum = conn.execute(text("PRAGMA auto_vacuum")).scalar()
+            if auto_vacuum != 2:
+                # Incremental vacuum only works once auto_vacuum=INCREMENTAL is in effect,
+                # which needs one full VACUUM to convert an existing database.
+                logger.warning("SQLite auto_vacuum is not INCREMENTAL; run a one-off "
+                               "'PRAGMA auto_vacuum=INCREMENTAL; VACUUM;' to enable compaction")
+            else:
+                while True:
+                    free_pages = conn.execute(text("PRAGMA freelist_count")).scalar()
+                    if not free_pages:
+                        break
+                    step = min(free_pages, self.policy.vacuum_pages)
+                    conn.execute(text(f"PRAGMA incremental_vacuum({step})")).fetchall()
+                    conn.commit()
+                    stats["pages_freed"] += step
+                    time.sleep(self.policy.batch_pause)
+                stats["bytes_reclaimed"] = stats["pages_freed"] * page_size
+
+            # PRAGMA optimize only re-analyzes tables whose statistics are stale
+            conn.execute(text("PRAGMA optimize")).fetchall()
+            conn.commit()
+        return stats
+
+    # ---- Orchestration ----
+
+    @contextmanager
+    def _exclusive(self):
+        """Yield whether this process holds the maintenance lock; never waits for it."""
+        if fcntl is None:
+            yield True
+            return
+        os.makedirs(self.audio_dir, exist_ok=True)
+        with open(os.path.join(self.audio_dir, MAINTENANCE_LOCK_FILE), "a") as lock_file:
+            try:
+                fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except BlockingIOError:
+                yield False
+                return
+            try:
+                yield True
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def run_once(self) -> Optional[Dict]:
+        """Run every maintenance job once and return a report of what was reclaimed.
+
+        Returns None without running anything when another process, e.g. another
+        server worker, is already running maintenance.
+        """
+        with self._exclusive() as acquired:
+            if not acquired:
+                logger.info("Maintenance is already running in another process; skipping this run")
+                return None
+            return self._run_jobs()
+
+    def _run_jobs(self) -> Dict:
+        started = time.time()
+        report = {
+            "started_at": datetime.datetime.utcnow().isoformat(),
+            "archive": self.archive_cold_sessions(),
+            "audio_compress": self.compress_audio(),
+            "audio_delete": self.delete_expired_audio(),
+            "database": self.compact_database(),
+        }
+        report["bytes_reclaimed"] = (
+            report["audio_compress"]["bytes_reclaimed"]
+            + report["audio_delete"]["bytes_reclaimed"]
+            + report["database"]["bytes_reclaimed"]
+        )
+        report["duration"] = round(time.time() - started, 3)
+        self.last_report = report
+        logger.info(f"Maintenance finished in {report['duration']}s, reclaimed {report['bytes_reclaimed']} bytes: {report}")
+        return report
+
+    async def run_once_async(self) -> Optional[Dict]:
+        """Run every maintenance job once (async version)."""
+        if self.executor is not None:
+            return await self.executor.run(self.run_once)
+        return await asyncio.to_thread(self.run_once)
+
+    async def run_forever(self, interval: Optional[float] = None):
+        """Run maintenance periodically until cancelled."""
+        interval = interval or float(os.getenv("MAINTENANCE_INTERVAL_SECONDS", "3600"))
+        while True:
+            try:
+                await self.run_once_async()
+            except Exception as e:
+                logger.error(f"Maintenance run failed: {e}", exc_info=True)
+            await asyncio.sleep(interval)
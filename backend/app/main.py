@@ -3,13 +3,22 @@ import os
 from typing import List, Dict, Any
 from dotenv import load_dotenv
 import logging
-import json
-import re
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
 from fastapi import FastAPI, HTTPException
+from fastapi.responses import PlainTextResponse
 from fastapi.middleware.cors import CORSMiddleware
 from pydantic import BaseModel
 # Revert back to relative import
-from .api.websocket import get_websocket_router
+from .api.websocket import get_websocket_router, db_manager, audio_dir, manager
+from .api.metrics import GaugeFunc, executor_stats, render_metrics
+from .api.diagnostics import LOOP_DIAGNOSTICS, blocking_detector, loop_monitor
+from .api.admin import get_admin_router
+from .api.executors import maintenance_executor, network_executor
+from .api.resilience import provider_deadline, provider_guard
+from .api.prompts import HEALTH_CHECK_PROMPT, parse_health_assessment
+from .api.tokens import record_llm_usage, usage_of
+from .database import MaintenanceManager
 
 # Import langchain components for Groq
 from langchain_groq import ChatGroq
@@ -42,6 +51,56 @@ app.add_middleware(
 
 websocket_router = get_websocket_router() # Get the router
 
+# Background retention/archival/compaction jobs, opt-in via MAINTENANCE_ENABLED
+maintenance_manager = MaintenanceManager(audio_dir, engine=db_manager.engine, history_cache=db_manager.history_cache,
+                                         executor=maintenance_executor)
+maintenance_task = None
+
+# Default executor behind asyncio.to_thread, created explicitly so its backlog can be observed.
+# Known blocking work runs on the dedicated executors in api/executors.py; this catches the rest.
+THREAD_POOL_WORKERS = int(os.getenv("THREAD_POOL_WORKERS", str(min(32, (os.cpu_count() or 1) + 4))))
+thread_pool = ThreadPoolExecutor(max_workers=THREAD_POOL_WORKERS, thread_name_prefix="kisanly-worker")
+
+GaugeFunc("kisanly_thread_pool", "Workers and queued work items of the default thread pool.",
+          lambda: {(name,): value for name, value in executor_stats(thread_pool).items()},
+          ["stat"])
+
+@app.on_event("startup")
+async def start_thread_pool():
+    asyncio.get_running_loop().set_default_executor(thread_pool)
+
+@app.on_event("startup")
+async def start_loop_monitor():
+    loop_monitor.start()
+    if LOOP_DIAGNOSTICS:
+        blocking_detector.start()
+
+@app.on_event("shutdown")
+async def stop_loop_monitor():
+    loop_monitor.stop()
+    blocking_detector.stop()
+
+@app.on_event("startup")
+async def start_connection_manager():
+    # Join the backplane so messages for this worker's clients can be routed here
+    await manager.start()
+
+@app.on_event("shutdown")
+async def stop_connection_manager():
+    await manager.stop()
+
+@app.on_event("startup")
+async def start_maintenance():
+    global maintenance_task
+    if os.getenv("MAINTENANCE_ENABLED", "false").lower() == "true":
+        maintenance_task = asyncio.create_task(maintenance_manager.run_forever())
+        logger.info("Background maintenance enabled")
+
+@app.on_event("shutdown")
+async def stop_maintenance():
+    if maintenance_task:
+        maintenance_task.cancel()
+
 # Define the request model for health check
 class HealthCheckRequest(BaseModel):
     diseases: List[str]
@@ -62,7 +121,8 @@ async def health_check(request: HealthCheckRequest):
         if not api_key:
             raise HTTPException(status_code=500, detail="GROQ_API_KEY environment variable not set")
         
-        llm = ChatGroq(api_key=api_key, model_name="qwen-qwq-32b")
+        llm = ChatGroq(api_key=api_key, model_name="qwen-qwq-32b", max_retries=0,
+                       timeout=provider_deadline("groq", "health_check"))
         
         results = []
         
@@ -70,75 +130,25 @@ async def health_check(request: HealthCheckRequest):
         for product in request.products:
             # Create a prompt for the LLM
             product_name = product.get('name', 'Unknown product')
-            prompt = f"""Evaluate if the product '{product_name}' is safe and beneficial for a person with the following health conditions: {', '.join(request.diseases)}.
-
-            Respond with:
-            1. A determination of 'pass' if the product is generally safe and potentially beneficial, or 'fail' if it could be detrimental.
-            2. A brief explanation of why the product is beneficial or potentially harmful given these health conditions.
-            
-            Format your response as a JSON object with two fields: 'flag' (either 'pass' or 'fail') and 'comments' (explanation).
-            
-            Be sensitive, even if moderation is required give the flag as fail and mention the reason in comments.
-
-            Example response format:
-            {{
-                "flag": "pass",
-                "comments": "This product is safe and may be beneficial because..."
-            }}
-            
-            Only provide the JSON object, no other text not even the <think> tags.
-            """
+            prompt = HEALTH_CHECK_PROMPT.render(product_name=product_name, diseases=', '.join(request.diseases))
             
             # Call the LLM
-            response = llm.invoke([HumanMessage(content=prompt)])
+            messages = [HumanMessage(content=prompt)]
+            response = await provider_guard("groq", "health_check").call(
+                lambda: network_executor.run(llm.invoke, messages))
+            record_llm_usage("health_check", usage_of(response), messages, str(response.content),
+                             endpoint="health_check")
             
-            # Parse the response - we expect a JSON string
+            # Parse the response - we expect a JSON object, possibly after <think> tags
             try:
-                response_content = response.content
-                
-                # Check if the response contains a valid JSON object
-                if not (response_content.strip().startswith('{') and response_content.strip().endswith('}')):
-                    
-                    # First, remove any thinking tags if present
-                    cleaned_response = re.sub(r'<think>.*?</think>', '', response_content, flags=re.DOTALL)
-                    
-                    # Find JSON object in the cleaned response
-                    json_match = re.search(r'({.*})', cleaned_response, re.DOTALL)
-                    if json_match:
-                        json_str = json_match.group(1)
-                        assessment = json.loads(json_str)
-                    else:
-                        assessment = {
-                            "flag": "fail",
-                            "comments": f"Could not properly analyze {product_name}. Please consult with your healthcare provider."
-                        }
-                    logger.info(f"No JSON object found in the response for {cleaned_response}")
-                else:                    
-                    # First, remove any thinking tags if present
-                    cleaned_response = re.sub(r'<think>.*?</think>', '', response_content, flags=re.DOTALL)
-                    
-                    # Find JSON object in the cleaned response
-                    json_match = re.search(r'({.*})', cleaned_response, re.DOTALL)
-                    if json_match:
-                        json_str = json_match.group(1)
-                        assessment = json.loads(json_str)
-                    else:
-                        assessment = {
-                            "flag": "fail",
-                            "comments": f"Could not properly analyze {product_name}. Please consult with your healthcare provider."
-                        }
-                
-                # Ensure we have the correct keys
-                if "flag" not in assessment or "comments" not in assessment:
+                assessment = parse_health_assessment(response.content)
+                if assessment is None:
+                    logger.info(f"No complete assessment found in the response for {product_name}: {response.content}")
                     assessment = {
                         "flag": "fail",
-                        "comments": f"Analysis incomplete for {product_name}. Please consult with your healthcare provider."
+                        "comments": f"Could not properly analyze {product_name}. Please consult with your healthcare provider."
                     }
                 
-                # Ensure flag is either 'pass' or 'fail'
-                if assessment["flag"].lower() not in ["pass", "fail"]:
-                    assessment["flag"] = "pass"
-                
             except Exception as e:
                 print(f"Error processing LLM response: {e}")
                 assessment = {
@@ -159,11 +169,17 @@ async def health_check(request: HealthCheckRequest):
         print(f"Error in health check: {e}")
         raise HTTPException(status_code=500, detail=f"Error performing health check: {str(e)}")
 
+@app.get("/metrics", response_class=PlainTextResponse)
+async def metrics():
+    """Prometheus scrape endpoint for this worker."""
+    return PlainTextResponse(render_metrics(), media_type="text/plain; version=0.0.4")
+
 @app.get("/")
 async def read_root():
     return {"message": "AI Agent Backend is running"}
 
 # Include WebSocket router
 app.include_router(websocket_router) # Use the instance here
+app.include_router(get_admin_router())
 
 print("AI Agent Backend with WebSocket endpoint and health check endpoint is configured.") 
\ No newline at end of file
@@ -0,0 +1,107 @@
+#!/usr/bin/env python3
+"""
+Import-time budget check for Kisanly backend.
+Imports the app in a fresh interpreter with `-X importtime` and exits non-zero when boot
+is slower or larger than the budget, or when a heavy ML framework is imported eagerly.
+Run it in CI so a stray top-level import cannot quietly bring back slow, fat workers.
+
+Usage:
+    python app/scripts/check_import_budget.py [--budget-ms 2000] [--budget-rss-mb 250]
+"""
+
+import os
+import sys
+import json
+import time
+import logging
+import argparse
+import subprocess
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# Modules that must only be imported when a local-model mode is enabled
+FORBIDDEN_MODULES = ["torch", "torchaudio", "transformers", "librosa", "soundfile", "whisper", "scipy"]
+
+def parse_importtime(stderr: str):
+    """Return (total self time in ms, {package: cumulative ms}, imported module names)."""
+    total_us = 0
+    packages = {}
+    modules = set()
+    for line in stderr.splitlines():
+        if not line.startswith("import time:") or "|" not in line:
+            continue
+        self_us, cumulative_us, name = line[len("import time:"):].split("|", 2)
+        if not self_us.strip().isdigit():
+            continue  # Header line
+        total_us += int(self_us)
+        module = name.strip()
+        modules.add(module)
+        # A package's outermost import has the largest cumulative time, covering its submodules
+        package = module.split(".")[0]
+        if package != "app":
+            packages[package] = max(packages.get(package, 0), int(cumulative_us) / 1000)
+    return total_us / 1000, packages, modules
+
+def check(module: str, budget_ms: float, budget_rss_mb: float, top: int) -> dict:
+    started = time.perf_counter()
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        cwd=BACKEND_DIR, capture_output=True, text=True
+    )
+    wall_ms = (time.perf_counter() - started) * 1000
+    if result.returncode != 0:
+        tail = "\n".join(result.stderr.splitlines()[-20:])
+        raise RuntimeError(f"Importing {module} failed:\n{tail}")
+
+    import_ms, packages, modules = parse_importtime(result.stderr)
+    try:
+        import resource
+        # ru_maxrss is in kilobytes on Linux
+        rss_mb = resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss / 1024
+    except ImportError:
+        rss_mb = None
+
+    forbidden = sorted(
+        name for name in FORBIDDEN_MODULES
+        if any(m == name or m.startswith(name + ".") for m in modules)
+    )
+    violations = []
+    if import_ms > budget_ms:
+        violations.append(f"import time {import_ms:.0f} ms exceeds budget of {budget_ms:.0f} ms")
+    if rss_mb is not None and rss_mb > budget_rss_mb:
+        violations.append(f"peak RSS {rss_mb:.0f} MiB exceeds budget of {budget_rss_mb:.0f} MiB")
+    if forbidden:
+        violations.append(f"heavy modules imported at startup: {', '.join(forbidden)}")
+
+    return {
+        "module": module,
+        "import_ms": round(import_ms, 1),
+        "wall_ms": round(wall_ms, 1),
+        "peak_rss_mb": round(rss_mb, 1) if rss_mb is not None else None,
+        "modules_imported": len(modules),
+        "slowest_packages": dict(sorted(packages.items(), key=lambda item: -item[1])[:top]),
+        "violations": violations,
+    }
+
+def main():
+    """Check the app's import time, memory and imported modules against the budget."""
+    parser = argparse.ArgumentParser(description="Import-time budget check for the Kisanly backend")
+    parser.add_argument("--module", default="app.main", help="Module to import (default: app.main)")
+    parser.add_argument("--budget-ms", type=float, default=float(os.getenv("IMPORT_TIME_BUDGET_MS", "2000")))
+    parser.add_argument("--budget-rss-mb", type=float, default=float(os.getenv("IMPORT_RSS_BUDGET_MB", "250")))
+    parser.add_argument("--top", type=int, default=10, help="Number of slowest packages to report")
+    args = parser.parse_args()
+
+    report = check(args.module, args.budget_ms, args.budget_rss_mb, args.top)
+    print(json.dumps(report, indent=2))
+    if report["violations"]:
+        for violation in report["violations"]:
+            logger.error(violation)
+        sys.exit(1)
+    logger.info("Import budget OK")
+
+if __name__ == "__main__":
+    main()
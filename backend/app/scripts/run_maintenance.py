@@ -0,0 +1,43 @@
+#!/usr/bin/env python3
+"""
+Maintenance script for Kisanly backend.
+Runs the retention, archival and compaction jobs once and prints what was reclaimed.
+"""
+
+import os
+import sys
+import json
+import logging
+import argparse
+
+# Add the parent directory to the path to allow importing from app
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
+
+from app.database import MaintenanceManager, RetentionPolicy, get_audio_dir
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+def main():
+    """Run maintenance jobs once."""
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--audio-dir", default=get_audio_dir(),
+                        help="Directory holding recorded audio files (default: AUDIO_DIR, as the server uses)")
+    parser.add_argument("--restore", metavar="SESSION_ID", help="Restore an archived session instead of running maintenance")
+    args = parser.parse_args()
+
+    manager = MaintenanceManager(args.audio_dir, RetentionPolicy())
+    if args.restore:
+        restored = manager.restore_session(args.restore)
+        logger.info(f"Restored {restored} messages for session {args.restore}")
+        return
+
+    logger.info("Running maintenance...")
+    report = manager.run_once()
+    if report is None:
+        logger.info("Maintenance is already running in another process")
+        return
+    print(json.dumps(report, indent=2))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,279 @@
+#!/usr/bin/env python3
+"""
+Bulk export/import script for Kisanly chat data.
+Streams users, sessions, messages and archived sessions to JSONL or Parquet files in
+constant memory and loads them back with batched executemany inserts, bypassing the ORM.
+
+Rows reference each other by their external ids (user_id, session_id), so a dump can be
+restored into a database whose primary keys differ. Rows that already exist are skipped
+(messages are matched by session, timestamp and role), so an import that failed partway
+can simply be run again.
+
+Usage:
+    python app/scripts/transfer_sessions.py export <dir> [--format jsonl|parquet] [--gzip]
+    python app/scripts/transfer_sessions.py import <dir> [--format jsonl|parquet]
+"""
+
+import os
+import sys
+import json
+import gzip
+import time
+import logging
+import base64
+import argparse
+import importlib.util
+import datetime
+
+# Add the parent directory to the path to allow importing from app
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
+
+from sqlalchemy import select, bindparam
+
+from app.database import User, Session, Message, ArchivedSession, init_db, insert_ignore
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+DEFAULT_BATCH_SIZE = 5000
+
+# Exported columns per table; foreign keys are replaced by the external id they point to
+TABLE_COLUMNS = {
+    "users": [
+        ("user_id", User.user_id),
+        ("created_at", User.created_at),
+    ],
+    "sessions": [
+        ("session_id", Session.session_id),
+        ("user_id", User.user_id),
+        ("created_at", Session.created_at),
+        ("last_interaction", Session.last_interaction),
+        ("is_active", Session.is_active),
+        ("language_code", Session.language_code),
+        ("language_turns", Session.language_turns),
+        ("prompt_tokens", Session.prompt_tokens),
+        ("completion_tokens", Session.completion_tokens),
+    ],
+    "messages": [
+        ("session_id", Session.session_id),
+        ("timestamp", Message.timestamp),
+        ("role", Message.role),
+        ("content", Message.content),
+        ("audio_file", Message.audio_file),
+        ("transcription", Message.transcription),
+        ("received_at", Message.received_at),
+        ("stt_completed_at", Message.stt_completed_at),
+        ("llm_completed_at", Message.llm_completed_at),
+        ("tts_completed_at", Message.tts_completed_at),
+    ],
+    "archived_sessions": [
+        ("session_id", ArchivedSession.session_id),
+        ("archived_at", ArchivedSession.archived_at),
+        ("message_count", ArchivedSession.message_count),
+        ("payload", ArchivedSession.payload),
+    ],
+}
+
+DATETIME_FIELDS = {"created_at", "last_interaction", "timestamp", "archived_at"}
+INTEGER_FIELDS = {"language_turns", "prompt_tokens", "completion_tokens", "message_count"}
+BINARY_FIELDS = {"payload"}  # Base64 in JSONL
+
+
+def export_query(table: str):
+    """Build the streaming SELECT for one exported table, ordered by primary key."""
+    columns = [column.label(name) for name, column in TABLE_COLUMNS[table]]
+    if table == "users":
+        return select(*columns).order_by(User.id)
+    if table == "sessions":
+        return select(*columns).join(User, Session.user_id == User.id).order_by(Session.id)
+    if table == "archived_sessions":
+        return select(*columns).order_by(ArchivedSession.id)
+    return select(*columns).join(Session, Message.session_id == Session.id).order_by(Message.id)
+
+
+def import_statement(table: str, engine):
+    """Build the INSERT for one table, resolving external ids with scalar subqueries.
+
+    Resolving ids inside the statement keeps the import in constant memory: no mapping
+    of external ids to primary keys is ever built on the client. Messages have no
+    unique key, so a message is only inserted when its session has no message with
+    the same timestamp and role yet.
+    """
+    if table == "users":
+        return insert_ignore(engine, User.__table__)
+    if table == "sessions":
+        user_pk = select(User.id).where(User.user_id == bindparam("user_key")).scalar_subquery()
+        return insert_ignore(engine, Session.__table__).values(user_id=user_pk)
+    if table == "archived_sessions":
+        return insert_ignore(engine, ArchivedSession.__table__)
+    messages = Message.__table__
+    fields = [name for name, _ in TABLE_COLUMNS["messages"] if name != "session_id"]
+    values = {name: bindparam(name, type_=messages.c[name].type) for name in fields}
+    session_pk = select(Session.id).where(Session.session_id == bindparam("session_key")).scalar_subquery()
+    duplicate = select(messages.c.id).where(
+        messages.c.session_id == session_pk,
+        messages.c.timestamp.is_not_distinct_from(values["timestamp"]),
+        messages.c.role == values["role"],
+    ).exists()
+    rows = select(session_pk, *values.values()).where(~duplicate)
+    return messages.insert().from_select(["session_id"] + fields, rows)
+
+
+# ---- File formats ----
+
+class JsonlWriter:
+    def __init__(self, path: str, table: str):
+        opener = gzip.open if path.endswith(".gz") else open
+        self.file = opener(path, "wt", encoding="utf-8")
+
+    def write_batch(self, rows):
+        lines = []
+        for row in rows:
+            record = dict(row)
+            for field in DATETIME_FIELDS.intersection(record):
+                if record[field] is not None:
+                    record[field] = record[field].isoformat()
+            for field in BINARY_FIELDS.intersection(record):
+                if record[field] is not None:
+                    record[field] = base64.b64encode(record[field]).decode("ascii")
+            lines.append(json.dumps(record, ensure_ascii=False))
+        self.file.write("\n".join(lines) + "\n")
+
+    def close(self):
+        self.file.close()
+
+
+def read_jsonl(path: str, batch_size: int):
+    opener = gzip.open if path.endswith(".gz") else open
+    batch = []
+    with opener(path, "rt", encoding="utf-8") as f:
+        for line in f:
+            if not line.strip():
+                continue
+            record = json.loads(line)
+            for field in DATETIME_FIELDS.intersection(record):
+                if record[field] is not None:
+                    record[field] = datetime.datetime.fromisoformat(record[field])
+            for field in BINARY_FIELDS.intersection(record):
+                if record[field] is not None:
+                    record[field] = base64.b64decode(record[field])
+            batch.append(record)
+            if len(batch) >= batch_size:
+                yield batch
+                batch = []
+    if batch:
+        yield batch
+
+
+class ParquetWriter:
+    def __init__(self, path: str, table: str):
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+
+        self.pa = pa
+        self.schema = pa.schema([
+            (name, pa.timestamp("us") if name in DATETIME_FIELDS else
+                   pa.bool_() if name == "is_active" else
+                   pa.int64() if name in INTEGER_FIELDS else
+                   pa.binary() if name in BINARY_FIELDS else
+                   pa.float64() if name.endswith("_at") else pa.string())
+            for name, _ in TABLE_COLUMNS[table]
+        ])
+        self.writer = pq.ParquetWriter(path, self.schema, compression="zstd")
+
+    def write_batch(self, rows):
+        # Each batch becomes one row group, so memory stays bounded by the batch size
+        self.writer.write_table(self.pa.Table.from_pylist([dict(row) for row in rows], schema=self.schema))
+
+    def close(self):
+        self.writer.close()
+
+
+def read_parquet(path: str, batch_size: int):
+    import pyarrow.parquet as pq
+
+    for record_batch in pq.ParquetFile(path).iter_batches(batch_size=batch_size):
+        yield record_batch.to_pylist()
+
+
+FORMATS = {
+    "jsonl": ("jsonl", JsonlWriter, read_jsonl),
+    "parquet": ("parquet", ParquetWriter, read_parquet),
+}
+
+
+# ---- Export / import ----
+
+def export_data(engine, out_dir: str, fmt: str, batch_size: int = DEFAULT_BATCH_SIZE, compress: bool = False):
+    """Stream every table to `out_dir` using server-side cursors."""
+    extension, writer_cls, _ = FORMATS[fmt]
+    if compress and fmt == "jsonl":
+        extension += ".gz"
+    os.makedirs(out_dir, exist_ok=True)
+
+    with engine.connect() as conn:
+        conn = conn.execution_options(stream_results=True, yield_per=batch_size)
+        for table in TABLE_COLUMNS:
+            started = time.time()
+            path = os.path.join(out_dir, f"{table}.{extension}")
+            writer = writer_cls(path, table)
+            count = 0
+            try:
+                result = conn.execute(export_query(table))
+                for rows in result.mappings().partitions(batch_size):
+                    writer.write_batch(rows)
+                    count += len(rows)
+            finally:
+                writer.close()
+            logger.info(f"Exported {count} {table} to {path} in {time.time() - started:.1f}s")
+
+
+def import_data(engine, in_dir: str, fmt: str, batch_size: int = DEFAULT_BATCH_SIZE):
+    """Bulk-load a dump produced by `export_data`, one transaction per batch."""
+    extension, _, reader = FORMATS[fmt]
+
+    for table in TABLE_COLUMNS:
+        path = os.path.join(in_dir, f"{table}.{extension}")
+        if not os.path.exists(path) and os.path.exists(path + ".gz"):
+            path += ".gz"
+        if not os.path.exists(path):
+            logger.warning(f"No {table} file found at {path}, skipping")
+            continue
+
+        started = time.time()
+        statement = import_statement(table, engine)
+        count = 0
+        for batch in reader(path, batch_size):
+            if table == "sessions":
+                for record in batch:
+                    record["user_key"] = record.pop("user_id")
+            elif table == "messages":
+                for record in batch:
+                    record["session_key"] = record.pop("session_id")
+            with engine.begin() as conn:
+                # A list of parameter sets makes SQLAlchemy use a single executemany
+                conn.execute(statement, batch)
+            count += len(batch)
+        logger.info(f"Imported {count} {table} from {path} in {time.time() - started:.1f}s")
+
+
+def main():
+    """Export or import chat data."""
+    parser = argparse.ArgumentParser(description="Bulk export/import of Kisanly chat data")
+    parser.add_argument("command", choices=["export", "import"])
+    parser.add_argument("directory", help="Directory holding users, sessions, messages and archived_sessions files")
+    parser.add_argument("--format", choices=sorted(FORMATS), default="jsonl")
+    parser.add_argument("--batch-size", type=int, default=DEFAULT_BATCH_SIZE)
+    parser.add_argument("--gzip", action="store_true", help="Gzip JSONL output (Parquet is always zstd-compressed)")
+    args = parser.parse_args()
+    if args.format == "parquet" and importlib.util.find_spec("pyarrow") is None:
+        parser.error("--format parquet needs pyarrow: pip install -r requirements-parquet.txt")
+
+    engine = init_db()
+    if args.command == "export":
+        export_data(engine, args.directory, args.format, args.batch_size, args.gzip)
+    else:
+        import_data(engine, args.directory, args.format, args.batch_size)
+
+if __name__ == "__main__":
+    main()
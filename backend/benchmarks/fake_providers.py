@@ -0,0 +1,267 @@
+#!/usr/bin/env python3
+"""
+Local stand-ins for the Sarvam and Groq APIs used by the load tests.
+Serves Sarvam speech-to-text-translate, speech-to-text, text-to-speech and translate, and Groq's
+OpenAI-compatible chat completions (including streaming), with configurable latency
+and error rates, and counts every call so provider traffic can be reported.
+
+Point the backend at it with SARVAM_API_BASE_URL=http://127.0.0.1:<port> and
+GROQ_API_BASE=http://127.0.0.1:<port>.
+
+Usage:
+    python -m benchmarks.fake_providers [--port 9100] [--stt-latency-ms 300] [--error-rate 0.01]
+"""
+
+import io
+import json
+import math
+import re
+import time
+import wave
+import uuid
+import zlib
+import base64
+import random
+import asyncio
+import logging
+import argparse
+from collections import Counter
+
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, StreamingResponse
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# Fields the fake extraction model "finds" in every message
+PRODUCT_ENTITIES = {
+    "name": "Wheat",
+    "category": "Grains",
+    "description": "Freshly harvested sharbati wheat",
+    "price": "32",
+    "quantity": "500",
+    "unit": "kg",
+}
+SUMMARY = ("You are listing 500 kg of freshly harvested sharbati wheat in the grains category. "
+           "The price is 32 rupees per kg. Everything is ready for submission.")
+HEALTH_ASSESSMENT = '<think>Checking the product.</think>{"flag": "pass", "comments": "Safe in moderation."}'
+
+TTS_SAMPLE_RATE = 8000
+TTS_CHARS_PER_SECOND = 15  # Roughly the speaking rate of the hosted voices
+
+
+class LatencyProfile:
+    """Log-normal latency around a median, plus an error rate, for one fake endpoint."""
+
+    def __init__(self, median_ms: float, sigma: float, error_rate: float):
+        self.median = median_ms / 1000
+        self.sigma = sigma
+        self.error_rate = error_rate
+
+    def delay(self) -> float:
+        if self.median <= 0:
+            return 0.0
+        return random.lognormvariate(math.log(self.median), self.sigma)
+
+    def fails(self) -> bool:
+        return random.random() < self.error_rate
+
+
+def silent_wav_base64(seconds: float) -> str:
+    """Base64 16-bit mono WAV of silence, sized like the hosted TTS output."""
+    buffer = io.BytesIO()
+    with wave.open(buffer, "wb") as wav:
+        wav.setnchannels(1)
+        wav.setsampwidth(2)
+        wav.setframerate(TTS_SAMPLE_RATE)
+        wav.writeframes(b"\0\0" * int(seconds * TTS_SAMPLE_RATE))
+    return base64.b64encode(buffer.getvalue()).decode("ascii")
+
+
+def chat_reply(messages: list, complete_ratio: float) -> str:
+    """Pick a plausible reply for the prompts the backend sends."""
+    prompt = " ".join(str(message.get("content", "")) for message in messages)
+    if "intent classifier" in prompt:
+        return "product"
+    if "entity extraction" in prompt:
+        # Complete extractions finish the form (and stream a summary), partial ones ask a question
+        if random.random() < complete_ratio:
+            return json.dumps(PRODUCT_ENTITIES)
+        return json.dumps({"name": PRODUCT_ENTITIES["name"]})
+    if "Summarize" in prompt:
+        return SUMMARY
+    if "Evaluate if the product" in prompt:
+        return HEALTH_ASSESSMENT
+    return "OK"
+
+
+def create_app(args) -> FastAPI:
+    app = FastAPI(title="Fake Sarvam and Groq APIs")
+    profiles = {
+        "stt": LatencyProfile(args.stt_latency_ms, args.latency_sigma, args.error_rate),
+        "tts": LatencyProfile(args.tts_latency_ms, args.latency_sigma, args.error_rate),
+        "translate": LatencyProfile(args.translate_latency_ms, args.latency_sigma, args.error_rate),
+        "llm": LatencyProfile(args.llm_latency_ms, args.latency_sigma, args.error_rate),
+    }
+    calls = Counter()
+    errors = Counter()
+    audio_cache = {}
+
+    async def simulate(endpoint: str):
+        """Wait like the real API would; return an error response if this call should fail."""
+        calls[endpoint] += 1
+        profile = profiles[endpoint]
+        await asyncio.sleep(profile.delay())
+        if profile.fails():
+            errors[endpoint] += 1
+            return JSONResponse({"error": {"message": "Injected failure"}}, status_code=500)
+        return None
+
+    @app.post("/speech-to-text-translate")
+    async def speech_to_text(request: Request):
+        body = await request.body()  # Read the upload like the real API; the audio is not inspected
+        failure = await simulate("stt")
+        if failure:
+            return failure
+        # Each client keeps speaking one language; the backend names uploads <client_id>_<session_id>_...
+        client = re.search(rb'filename="([^"_]+)_', body)
+        language = args.languages[zlib.crc32(client.group(1)) % len(args.languages)] if client \
+            else random.choice(args.languages)
+        return {
+            "request_id": uuid.uuid4().hex,
+            "transcript": "I want to add my wheat harvest as a new product",
+            "language_code": language,
+        }
+
+    @app.post("/speech-to-text")
+    async def speech_to_text_known_language(request: Request):
+        # Used for sessions whose language is already known; the multipart body is scanned
+        # for the language field rather than parsed, which would need python-multipart
+        body = await request.body()
+        language = re.search(rb'name="language_code"\r\n\r\n([\w-]+)', body)
+        failure = await simulate("stt")
+        if failure:
+            return failure
+        calls["stt_known_language"] += 1
+        return {
+            "request_id": uuid.uuid4().hex,
+            "transcript": "I want to add my wheat harvest as a new product",
+            "language_code": language.group(1).decode() if language else "en-IN",
+        }
+
+    @app.post("/text-to-speech")
+    async def text_to_speech(request: Request):
+        payload = await request.json()
+        failure = await simulate("tts")
+        if failure:
+            return failure
+        calls["tts_inputs"] += len(payload["inputs"])
+        audios = []
+        for text in payload["inputs"]:
+            seconds = max(1, round(len(text) / TTS_CHARS_PER_SECOND))
+            if seconds not in audio_cache:
+                audio_cache[seconds] = silent_wav_base64(seconds)
+            audios.append(audio_cache[seconds])
+        return {"request_id": uuid.uuid4().hex, "audios": audios}
+
+    @app.post("/translate")
+    async def translate(request: Request):
+        payload = await request.json()
+        failure = await simulate("translate")
+        if failure:
+            return failure
+        return {
+            "request_id": uuid.uuid4().hex,
+            "translated_text": f"[{payload['target_language_code']}] {payload['input']}",
+            "source_language_code": payload["source_language_code"],
+        }
+
+    @app.post("/openai/v1/chat/completions")
+    async def chat_completions(request: Request):
+        payload = await request.json()
+        failure = await simulate("llm")
+        if failure:
+            return failure
+        reply = chat_reply(payload.get("messages", []), args.complete_ratio)
+        completion_id = f"chatcmpl-{uuid.uuid4().hex}"
+        created = int(time.time())
+        model = payload.get("model", "fake")
+        usage = {
+            "prompt_tokens": sum(len(str(m.get("content", "")).split()) for m in payload.get("messages", [])),
+            "completion_tokens": len(reply.split()),
+        }
+        usage["total_tokens"] = usage["prompt_tokens"] + usage["completion_tokens"]
+
+        if not payload.get("stream"):
+            return {
+                "id": completion_id,
+                "object": "chat.completion",
+                "created": created,
+                "model": model,
+                "choices": [{"index": 0, "message": {"role": "assistant", "content": reply}, "finish_reason": "stop"}],
+                "usage": usage,
+            }
+
+        calls["llm_streams"] += 1
+
+        async def events():
+            tokens = [word + " " for word in reply.split(" ")]
+            tokens[-1] = tokens[-1].rstrip()
+            for token in tokens:
+                chunk = {
+                    "id": completion_id,
+                    "object": "chat.completion.chunk",
+                    "created": created,
+                    "model": model,
+                    "choices": [{"index": 0, "delta": {"role": "assistant", "content": token}, "finish_reason": None}],
+                }
+                yield f"data: {json.dumps(chunk)}\n\n"
+                await asyncio.sleep(args.llm_token_ms / 1000)
+            done = {
+                "id": completion_id,
+                "object": "chat.completion.chunk",
+                "created": created,
+                "model": model,
+                "choices": [{"index": 0, "delta": {}, "finish_reason": "stop"}],
+                "x_groq": {"usage": usage},
+            }
+            yield f"data: {json.dumps(done)}\n\n"
+            yield "data: [DONE]\n\n"
+
+        return StreamingResponse(events(), media_type="text/event-stream")
+
+    @app.get("/stats")
+    async def stats():
+        return {"calls": dict(calls), "errors": dict(errors)}
+
+    return app
+
+
+def build_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(description="Fake Sarvam and Groq APIs for load tests")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=9100)
+    parser.add_argument("--stt-latency-ms", type=float, default=400, help="Median STT latency")
+    parser.add_argument("--tts-latency-ms", type=float, default=300, help="Median TTS latency")
+    parser.add_argument("--translate-latency-ms", type=float, default=150, help="Median translation latency")
+    parser.add_argument("--llm-latency-ms", type=float, default=250, help="Median time to first LLM token")
+    parser.add_argument("--llm-token-ms", type=float, default=10, help="Delay between streamed LLM tokens")
+    parser.add_argument("--latency-sigma", type=float, default=0.35, help="Log-normal spread of latencies")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="Share of calls that fail with HTTP 500")
+    parser.add_argument("--complete-ratio", type=float, default=0.5,
+                        help="Share of extractions that complete the form and trigger a summary")
+    parser.add_argument("--languages", nargs="+", default=["hi-IN", "kn-IN", "en-IN"],
+                        help="Languages reported by the fake speech-to-text, one per client")
+    return parser
+
+
+def main():
+    """Serve the fake APIs until interrupted."""
+    import uvicorn
+
+    args = build_parser().parse_args()
+    logger.info(f"Fake providers listening on http://{args.host}:{args.port}")
+    uvicorn.run(create_app(args), host=args.host, port=args.port, log_level="warning")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,465 @@
+#!/usr/bin/env python3
+"""
+End-to-end load test for the Kisanly backend.
+Starts the fake Sarvam/Groq providers and the FastAPI app (uvicorn) as subprocesses,
+drives many concurrent simulated WebSocket clients sending text and WebM audio turns
+while hitting /health-check, and saves a JSON report with throughput, per-stage
+p50/p95/p99 latencies, event-loop lag, memory and provider call counts.
+
+Reports are written to benchmarks/results/ named after the time and git commit; pass
+--compare with an earlier report to flag regressions (exit code 1).
+
+Usage:
+    python -m benchmarks.load_test [--clients 1000] [--turns 3] [--audio-ratio 0.5] \
+        [--ramp-seconds 10] [--health-check-rps 2] [--compare benchmarks/results/<baseline>.json]
+"""
+
+import io
+import os
+import re
+import sys
+import json
+import math
+import time
+import wave
+import random
+import socket
+import asyncio
+import logging
+import argparse
+import tempfile
+import subprocess
+from datetime import datetime, timezone
+
+import requests
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+RESULTS_DIR = os.path.join(BACKEND_DIR, "benchmarks", "results")
+
+TEXT_TURNS = [
+    "I want to add a new product",
+    "I want to list 500 kg of wheat at 32 rupees per kg",
+    "Help me create a post for my listed mangoes",
+]
+HEALTH_CHECK_PAYLOAD = {
+    "diseases": ["diabetes"],
+    "products": [{"id": "p1", "name": "Brown rice"}, {"id": "p2", "name": "Jaggery"}],
+}
+# Latencies checked by --compare
+COMPARED_LATENCIES = ["end_to_end", "first_message", "stt", "llm", "translation", "tts"]
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def raise_file_limit():
+    """Thousands of sockets need more descriptors than the usual default of 1024."""
+    try:
+        import resource
+        soft, hard = resource.getrlimit(resource.RLIMIT_NOFILE)
+        if soft < hard:
+            resource.setrlimit(resource.RLIMIT_NOFILE, (hard, hard))
+    except (ImportError, ValueError, OSError) as e:
+        logger.warning(f"Could not raise the open file limit: {e}")
+
+
+def git_revision() -> dict:
+    def git(*args):
+        result = subprocess.run(["git", *args], cwd=BACKEND_DIR, capture_output=True, text=True)
+        return result.stdout.strip() if result.returncode == 0 else None
+    return {"commit": git("rev-parse", "HEAD"), "dirty": bool(git("status", "--porcelain", "--", "."))}
+
+
+def percentiles(values) -> dict:
+    """p50/p95/p99 (nearest rank), mean and max of a list of seconds."""
+    if not values:
+        return {"count": 0}
+    ordered = sorted(values)
+
+    def rank(q):
+        return ordered[min(len(ordered) - 1, max(0, math.ceil(q * len(ordered)) - 1))]
+
+    return {
+        "count": len(ordered),
+        "p50": round(rank(0.50), 4),
+        "p95": round(rank(0.95), 4),
+        "p99": round(rank(0.99), 4),
+        "mean": round(sum(ordered) / len(ordered), 4),
+        "max": round(ordered[-1], 4),
+    }
+
+
+def histogram_percentiles(metrics_text: str, name: str) -> dict:
+    """Estimate p50/p95/p99 of a Prometheus histogram by interpolating within buckets."""
+    buckets = []
+    total = count = 0.0
+    for line in metrics_text.splitlines():
+        if line.startswith(f"{name}_bucket"):
+            le = re.search(r'le="([^"]+)"', line).group(1)
+            buckets.append((math.inf if le == "+Inf" else float(le), float(line.rsplit(" ", 1)[1])))
+        elif line.startswith(f"{name}_sum"):
+            total = float(line.rsplit(" ", 1)[1])
+        elif line.startswith(f"{name}_count"):
+            count = float(line.rsplit(" ", 1)[1])
+    if not count:
+        return {"count": 0}
+
+    def quantile(q):
+        target = q * count
+        lower_bound, lower_count = 0.0, 0.0
+        for bound, cumulative in buckets:
+            if cumulative >= target:
+                if bound == math.inf:
+                    return lower_bound
+                share = (target - lower_count) / (cumulative - lower_count) if cumulative > lower_count else 1.0
+                return lower_bound + (bound - lower_bound) * share
+            lower_bound, lower_count = bound, cumulative
+        return lower_bound
+
+    return {
+        "count": int(count),
+        "p50": round(quantile(0.50), 4),
+        "p95": round(quantile(0.95), 4),
+        "p99": round(quantile(0.99), 4),
+        "mean": round(total / count, 4),
+    }
+
+
+def gauge_value(metrics_text: str, name: str, labels: str = "") -> float | None:
+    match = re.search(rf"^{re.escape(name + labels)} (\S+)$", metrics_text, re.MULTILINE)
+    return float(match.group(1)) if match else None
+
+
+def process_memory_mb(pid: int) -> dict:
+    """Current and peak resident memory of a process, from /proc (Linux only)."""
+    memory = {}
+    try:
+        with open(f"/proc/{pid}/status") as f:
+            for line in f:
+                if line.startswith(("VmRSS:", "VmHWM:")):
+                    key = "rss" if line.startswith("VmRSS") else "peak_rss"
+                    memory[key] = int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    return memory
+
+
+def sample_audio(path: str | None) -> tuple:
+    """Return (audio bytes, format) for audio turns: the given file, WebM if ffmpeg is available, else WAV."""
+    if path:
+        with open(path, "rb") as f:
+            return f.read(), os.path.splitext(path)[1].lstrip(".") or "file"
+    buffer = io.BytesIO()
+    with wave.open(buffer, "wb") as wav:
+        wav.setnchannels(1)
+        wav.setsampwidth(2)
+        wav.setframerate(16000)
+        wav.writeframes(b"\0\0" * 16000 * 3)  # Three seconds, like a short spoken answer
+    try:
+        from pydub import AudioSegment
+        webm = io.BytesIO()
+        AudioSegment.from_wav(io.BytesIO(buffer.getvalue())).export(webm, format="webm")
+        return webm.getvalue(), "webm"
+    except Exception as e:
+        logger.warning(f"Could not encode WebM audio ({e}); audio turns will send WAV")
+        return buffer.getvalue(), "wav"
+
+
+class Server:
+    """A subprocess that serves HTTP on a local port."""
+
+    def __init__(self, name: str, command: list, port: int, env: dict, log_dir: str):
+        self.name = name
+        self.port = port
+        self.log = open(os.path.join(log_dir, f"{name}.log"), "w")
+        self.process = subprocess.Popen(command, cwd=BACKEND_DIR, env=env, stdout=self.log, stderr=subprocess.STDOUT)
+
+    @property
+    def url(self) -> str:
+        return f"http://127.0.0.1:{self.port}"
+
+    def wait_ready(self, path: str, timeout: float = 60):
+        deadline = time.monotonic() + timeout
+        while time.monotonic() < deadline:
+            if self.process.poll() is not None:
+                raise RuntimeError(f"{self.name} exited with code {self.process.returncode}, see {self.log.name}")
+            try:
+                requests.get(self.url + path, timeout=1)
+                return
+            except requests.RequestException:
+                time.sleep(0.2)
+        raise RuntimeError(f"{self.name} did not start within {timeout} s, see {self.log.name}")
+
+    def stop(self):
+        self.process.terminate()
+        try:
+            self.process.wait(timeout=10)
+        except subprocess.TimeoutExpired:
+            self.process.kill()
+        self.log.close()
+
+
+class LoadTest:
+    """Simulated clients plus the samplers that watch the server while they run."""
+
+    def __init__(self, args, backend: Server, audio: bytes):
+        self.args = args
+        self.backend = backend
+        self.audio = audio
+        self.ws_url = f"ws://127.0.0.1:{backend.port}/ws"
+        self.turns = []  # One dict per turn with its outcome and timings
+        self.connect_failures = 0
+        self.connect_seconds = []
+        self.health_checks = []  # (seconds, ok)
+        self.memory_samples = []
+        self.harness_lag = []
+        self._stop = asyncio.Event()
+
+    async def run_client(self, index: int):
+        import websockets
+
+        await asyncio.sleep(self.args.ramp_seconds * index / max(1, self.args.clients))
+        client_id = f"bench-{index}-{random.getrandbits(32):08x}"
+        started = time.perf_counter()
+        try:
+            async with websockets.connect(f"{self.ws_url}/{client_id}", max_size=None, open_timeout=30) as ws:
+                self.connect_seconds.append(time.perf_counter() - started)
+                for turn in range(self.args.turns):
+                    is_audio = random.random() < self.args.audio_ratio
+                    await self.run_turn(ws, is_audio, turn)
+                    await asyncio.sleep(random.uniform(0, 2 * self.args.think_ms / 1000))
+        except Exception as e:
+            self.connect_failures += 1
+            logger.debug(f"Client {client_id} failed: {e}")
+
+    async def run_turn(self, ws, is_audio: bool, turn: int):
+        result = {"kind": "audio" if is_audio else "text", "outcome": "timeout"}
+        sent = time.perf_counter()
+        await ws.send(self.audio if is_audio else TEXT_TURNS[turn % len(TEXT_TURNS)])
+        deadline = sent + self.args.turn_timeout
+        try:
+            while True:
+                raw = await asyncio.wait_for(ws.recv(), timeout=max(0.001, deadline - time.perf_counter()))
+                now = time.perf_counter() - sent
+                message = json.loads(raw)
+                result.setdefault("first_message", now)
+                status = message.get("status")
+                if status == "partial_text":
+                    result.setdefault("first_partial_text", now)
+                elif status == "partial_audio":
+                    result.setdefault("first_partial_audio", now)
+                elif status in ("response_ready", "error", "busy"):
+                    result["outcome"] = "ok" if status == "response_ready" else status
+                    result["end_to_end"] = now
+                    result["performance"] = message.get("performance") or {}
+                    break
+        except asyncio.TimeoutError:
+            pass
+        self.turns.append(result)
+
+    async def hit_health_check(self):
+        if self.args.health_check_rps <= 0:
+            return
+        interval = 1 / self.args.health_check_rps
+        pending = set()
+        while not self._stop.is_set():
+            pending.add(asyncio.create_task(self._health_check_once()))
+            pending = {task for task in pending if not task.done()}
+            await asyncio.sleep(interval)
+        await asyncio.gather(*pending, return_exceptions=True)
+
+    async def _health_check_once(self):
+        started = time.perf_counter()
+        try:
+            response = await asyncio.to_thread(
+                requests.post, self.backend.url + "/health-check", json=HEALTH_CHECK_PAYLOAD, timeout=60)
+            ok = response.status_code == 200
+        except requests.RequestException:
+            ok = False
+        self.health_checks.append((time.perf_counter() - started, ok))
+
+    async def sample(self):
+        """Sample server memory and this harness's own loop lag, to tell when the harness is the bottleneck."""
+        interval = 0.5
+        while not self._stop.is_set():
+            self.memory_samples.append(process_memory_mb(self.backend.process.pid))
+            started = time.perf_counter()
+            await asyncio.sleep(interval)
+            self.harness_lag.append(max(0.0, time.perf_counter() - started - interval))
+
+    async def run(self) -> float:
+        samplers = [asyncio.create_task(self.sample()), asyncio.create_task(self.hit_health_check())]
+        started = time.perf_counter()
+        await asyncio.gather(*(self.run_client(i) for i in range(self.args.clients)))
+        duration = time.perf_counter() - started
+        self._stop.set()
+        await asyncio.gather(*samplers)
+        return duration
+
+    def report(self, duration: float, metrics_text: str, provider_stats: dict) -> dict:
+        completed = [turn for turn in self.turns if turn["outcome"] == "ok"]
+
+        def stage(key):
+            return percentiles([turn["performance"][key] for turn in completed if key in turn["performance"]])
+
+        outcomes = {}
+        for turn in self.turns:
+            outcomes[turn["outcome"]] = outcomes.get(turn["outcome"], 0) + 1
+        health_latencies = [seconds for seconds, ok in self.health_checks if ok]
+        rss = [sample["rss"] for sample in self.memory_samples if "rss" in sample]
+        peaks = [sample["peak_rss"] for sample in self.memory_samples if "peak_rss" in sample]
+
+        return {
+            "duration_seconds": round(duration, 3),
+            "clients": {
+                "requested": self.args.clients,
+                "connected": len(self.connect_seconds),
+                "failed": self.connect_failures,
+                "connect_seconds": percentiles(self.connect_seconds),
+            },
+            "turns": {
+                "sent": len(self.turns),
+                "outcomes": outcomes,
+                "throughput_per_second": round(len(completed) / duration, 3) if duration else 0.0,
+                "error_rate": round(1 - len(completed) / len(self.turns), 4) if self.turns else 0.0,
+            },
+            "latency_seconds": {
+                "end_to_end": percentiles([turn["end_to_end"] for turn in completed]),
+                "end_to_end_text": percentiles([t["end_to_end"] for t in completed if t["kind"] == "text"]),
+                "end_to_end_audio": percentiles([t["end_to_end"] for t in completed if t["kind"] == "audio"]),
+                "first_message": percentiles([turn["first_message"] for turn in completed]),
+                "first_partial_text": percentiles([t["first_partial_text"] for t in completed if "first_partial_text" in t]),
+                "first_partial_audio": percentiles([t["first_partial_audio"] for t in completed if "first_partial_audio" in t]),
+                "stt": stage("stt_duration"),
+                "llm": stage("llm_duration"),
+                "translation": stage("translation_duration"),
+                "tts": stage("tts_duration"),
+                "server_total": stage("total_duration"),
+            },
+            "health_check": {
+                "requests": len(self.health_checks),
+                "errors": sum(1 for _, ok in self.health_checks if not ok),
+                "latency_seconds": percentiles(health_latencies),
+            },
+            "event_loop_lag_seconds": {
+                "server": {
+                    **histogram_percentiles(metrics_text, "kisanly_event_loop_lag_seconds"),
+                    "max": gauge_value(metrics_text, "kisanly_event_loop_lag_seconds_recent", '{stat="max"}'),
+                },
+                "harness": percentiles(self.harness_lag),
+            },
+            "memory_mb": {
+                "server_rss_start": round(rss[0], 1) if rss else None,
+                "server_rss_end": round(rss[-1], 1) if rss else None,
+                "server_rss_peak": round(max(peaks), 1) if peaks else None,
+            },
+            "provider_calls": provider_stats,
+        }
+
+
+def compare_reports(baseline: dict, current: dict, tolerance: float) -> list:
+    """Return descriptions of metrics that got worse than the baseline by more than `tolerance`."""
+    regressions = []
+    for name in COMPARED_LATENCIES:
+        before = baseline.get("latency_seconds", {}).get(name, {})
+        after = current.get("latency_seconds", {}).get(name, {})
+        for q in ("p50", "p95", "p99"):
+            if before.get(q) and after.get(q) is not None and after[q] > before[q] * (1 + tolerance):
+                regressions.append(f"{name} {q}: {before[q]:.3f}s -> {after[q]:.3f}s")
+    before = baseline.get("turns", {}).get("throughput_per_second")
+    after = current.get("turns", {}).get("throughput_per_second")
+    if before and after is not None and after < before * (1 - tolerance):
+        regressions.append(f"throughput: {before:.2f}/s -> {after:.2f}/s")
+    before = baseline.get("turns", {}).get("error_rate", 0.0)
+    after = current.get("turns", {}).get("error_rate", 0.0)
+    if after > before + tolerance / 10:
+        regressions.append(f"error rate: {before:.2%} -> {after:.2%}")
+    return regressions
+
+
+def main():
+    """Run the load test and save its report."""
+    parser = argparse.ArgumentParser(description="End-to-end load test for the Kisanly backend")
+    parser.add_argument("--clients", type=int, default=1000, help="Concurrent WebSocket clients")
+    parser.add_argument("--turns", type=int, default=3, help="Turns sent by each client")
+    parser.add_argument("--audio-ratio", type=float, default=0.5, help="Share of turns sent as audio")
+    parser.add_argument("--audio-file", help="Audio sent by audio turns (default: generated WebM)")
+    parser.add_argument("--ramp-seconds", type=float, default=10, help="Time over which clients connect")
+    parser.add_argument("--think-ms", type=float, default=500, help="Mean pause between a client's turns")
+    parser.add_argument("--turn-timeout", type=float, default=120, help="Seconds before a turn counts as timed out")
+    parser.add_argument("--health-check-rps", type=float, default=2, help="/health-check requests per second")
+    parser.add_argument("--workers", type=int, default=1, help="Uvicorn workers for the backend")
+    parser.add_argument("--output", help="Report path (default: benchmarks/results/<time>-<commit>.json)")
+    parser.add_argument("--compare", help="Earlier report to check for regressions")
+    parser.add_argument("--tolerance", type=float, default=0.10, help="Allowed relative regression for --compare")
+    args, provider_args = parser.parse_known_args()  # Latency and error options go to the fake providers
+
+    raise_file_limit()
+    audio, audio_format = sample_audio(args.audio_file)
+    work_dir = tempfile.mkdtemp(prefix="kisanly-bench-")
+    providers_port, backend_port = free_port(), free_port()
+
+    providers = Server("providers", [sys.executable, "-m", "benchmarks.fake_providers",
+                                     "--port", str(providers_port), *provider_args],
+                       providers_port, dict(os.environ), work_dir)
+    backend_env = {
+        **os.environ,
+        "SARVAM_API_BASE_URL": providers.url,
+        "SARVAM_API_KEY": "bench",
+        "GROQ_API_BASE": providers.url,
+        "GROQ_API_KEY": "bench",
+        "DATABASE_URL": f"sqlite:///{os.path.join(work_dir, 'bench.db')}",
+        "AUDIO_DIR": os.path.join(work_dir, "audio_files"),
+        "WEB_CONCURRENCY": str(args.workers),
+    }
+    backend = Server("backend", [sys.executable, "-m", "uvicorn", "app.main:app", "--port", str(backend_port),
+                                 "--workers", str(args.workers), "--log-level", "warning"],
+                     backend_port, backend_env, work_dir)
+    try:
+        providers.wait_ready("/stats")
+        backend.wait_ready("/")
+        logger.info(f"Running {args.clients} clients x {args.turns} turns (logs in {work_dir})")
+
+        test = LoadTest(args, backend, audio)
+        duration = asyncio.run(test.run())
+        metrics_text = requests.get(backend.url + "/metrics", timeout=30).text
+        provider_stats = requests.get(providers.url + "/stats", timeout=30).json()
+        report = {
+            "benchmark": "websocket_load",
+            "started_at": datetime.now(timezone.utc).isoformat(),
+            "git": git_revision(),
+            "python": sys.version.split()[0],
+            "config": {**vars(args), "provider_args": provider_args, "audio_format": audio_format},
+            **test.report(duration, metrics_text, provider_stats),
+        }
+    finally:
+        backend.stop()
+        providers.stop()
+
+    output = args.output
+    if not output:
+        os.makedirs(RESULTS_DIR, exist_ok=True)
+        stamp = datetime.now().strftime("%Y%m%d-%H%M%S")
+        output = os.path.join(RESULTS_DIR, f"{stamp}-{(report['git']['commit'] or 'nogit')[:8]}.json")
+    with open(output, "w") as f:
+        json.dump(report, f, indent=2)
+    logger.info(f"Throughput {report['turns']['throughput_per_second']} turns/s, "
+                f"end-to-end p95 {report['latency_seconds']['end_to_end'].get('p95')} s; report saved to {output}")
+
+    if args.compare:
+        with open(args.compare) as f:
+            regressions = compare_reports(json.load(f), report, args.tolerance)
+        for regression in regressions:
+            logger.error(f"Regression: {regression}")
+        if regressions:
+            sys.exit(1)
+        logger.info(f"No regressions beyond {args.tolerance:.0%} against {args.compare}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,88 @@
+#!/usr/bin/env python3
+"""
+Microbenchmarks for building agent prompts and parsing LLM responses.
+Compares the precompiled templates and the single-pass JSON extractor in
+app/api/prompts.py with the f-strings and greedy regex they replaced, on response
+shapes the models actually return (plain JSON, <think> blocks, code fences, prose
+after the object), and reports the time per call and how many responses parse.
+
+Usage:
+    python -m benchmarks.prompt_bench [--number 20000] [--repeat 5]
+"""
+
+import re
+import json
+import timeit
+import argparse
+
+from app.api.prompts import AWAITED_FIELD_PROMPT, EXTRACTION_PROMPT, EntitySchema, extract_json_object, quoted_fields
+
+PRODUCT_FIELDS = [("name", ""), ("category", ""), ("description", ""), ("price", ""), ("quantity", ""), ("unit", "")]
+USER_INPUT = "It is sharbati wheat, 500 kg at 32 rupees a kilo"
+ENTITIES = '{"name": "Sharbati wheat", "quantity": "500", "unit": "kg", "price": "32"}'
+
+RESPONSES = {
+    "plain": ENTITIES,
+    "think": "<think>The user mentions {quantity} and a price, so I fill those in.</think>\n" + ENTITIES,
+    "fenced": "Here are the fields I found:\n```json\n" + ENTITIES + "\n```",
+    "trailing_prose": ENTITIES + "\nNote: {description} was not mentioned.",
+    "long_think": "<think>" + "Weighing every field of the form { carefully }. " * 200 + "</think>" + ENTITIES,
+}
+
+
+def legacy_prompt(intent: str, key_to_save: str, user_input: str) -> str:
+    return f"""
+You are an entity extraction model for an agricultural marketplace app.
+The user is providing information for a {intent}.
+
+We specifically need a value for "{key_to_save}", but also check for any of these fields that might be in the message:
+{', '.join([f'"{field[0]}"' for field in PRODUCT_FIELDS])}
+
+Format your response as a JSON object with these field names as keys and the extracted values.
+Only include fields that you are confident are mentioned in the message.
+If a field is not mentioned, do not include it in the JSON.
+Be especially careful to extract "{key_to_save}" if present.
+
+User message: {user_input}
+"""
+
+
+def legacy_parse(text: str):
+    cleaned = re.sub(r'<think>.*?</think>', '', text, flags=re.DOTALL)
+    match = re.search(r'(\{.*\})', cleaned, re.DOTALL)
+    if not match:
+        return None
+    try:
+        return json.loads(match.group(1))
+    except json.JSONDecodeError:
+        return None
+
+
+def best_microseconds(statement, number: int, repeat: int) -> float:
+    return min(timeit.repeat(statement, number=number, repeat=repeat)) / number * 1e6
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Prompt building and response parsing microbenchmarks")
+    parser.add_argument("--number", type=int, default=20000, help="Calls per timing run")
+    parser.add_argument("--repeat", type=int, default=5, help="Timing runs; the fastest is reported")
+    args = parser.parse_args()
+
+    # The extraction prompt is static per form; only the awaited-field hint is rendered per turn
+    extraction_prompt = EXTRACTION_PROMPT.render(intent="product", fields=quoted_fields(PRODUCT_FIELDS))
+    schema = EntitySchema(PRODUCT_FIELDS)
+
+    print(f"{'case':<24}{'legacy us':>12}{'new us':>10}{'legacy ok':>11}{'new ok':>8}")
+    legacy = best_microseconds(lambda: legacy_prompt("product", "price", USER_INPUT), args.number, args.repeat)
+    new = best_microseconds(lambda: (extraction_prompt, AWAITED_FIELD_PROMPT.render(awaited="price")),
+                            args.number, args.repeat)
+    print(f"{'prompt':<24}{legacy:>12.2f}{new:>10.2f}")
+    for name, response in RESPONSES.items():
+        legacy = best_microseconds(lambda: legacy_parse(response), args.number, args.repeat)
+        new = best_microseconds(lambda: schema.parse(response), args.number, args.repeat)
+        legacy_ok = legacy_parse(response) is not None
+        new_ok = extract_json_object(response) is not None
+        print(f"{'parse ' + name:<24}{legacy:>12.2f}{new:>10.2f}{str(legacy_ok):>11}{str(new_ok):>8}")
+
+if __name__ == "__main__":
+    main()
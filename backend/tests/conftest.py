@@ -0,0 +1,5 @@
+import os
+import tempfile
+
+# The app opens its database at import time; keep tests away from the real app.db
+os.environ.setdefault("DATABASE_URL", f"sqlite:///{os.path.join(tempfile.mkdtemp(), 'test.db')}")
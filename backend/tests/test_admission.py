@@ -0,0 +1,27 @@
+import asyncio
+
+import pytest
+
+from app.api import admission
+from app.api.admission import LLM_CALLS_PER_TURN, TokenBucket
+
+
+def test_worker_share_keeps_a_turns_llm_charge(monkeypatch):
+    monkeypatch.setattr(admission, "ADMISSION_WORKERS", 4)
+    assert admission._worker_share(10, 20) == (2.5, 5)
+    rate, burst = admission._worker_share(0.5, 10, LLM_CALLS_PER_TURN)
+    assert rate == 0.125
+    assert burst == LLM_CALLS_PER_TURN
+
+
+def test_split_bucket_admits_an_llm_turn(monkeypatch):
+    monkeypatch.setattr(admission, "ADMISSION_WORKERS", 4)
+    bucket = TokenBucket(*admission._worker_share(0.5, 10, LLM_CALLS_PER_TURN))
+    asyncio.run(asyncio.wait_for(bucket.acquire(LLM_CALLS_PER_TURN), timeout=1))
+    assert bucket.tokens < 1
+
+
+def test_cost_above_burst_raises():
+    bucket = TokenBucket(rate=0.125, burst=2)
+    with pytest.raises(ValueError):
+        asyncio.run(asyncio.wait_for(bucket.acquire(3), timeout=1))
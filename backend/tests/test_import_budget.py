@@ -0,0 +1,14 @@
+import os
+
+import pytest
+
+for module in ("fastapi", "langchain_groq", "magic", "pydub"):
+    pytest.importorskip(module)
+
+from app.scripts.check_import_budget import check  # noqa: E402
+
+
+def test_app_imports_within_budget():
+    report = check("app.main", float(os.getenv("IMPORT_TIME_BUDGET_MS", "2000")),
+                   float(os.getenv("IMPORT_RSS_BUDGET_MB", "250")), top=10)
+    assert report["violations"] == [], report
@@ -0,0 +1,53 @@
+import datetime
+
+from app.database import ArchivedSession, DBManager, MaintenanceManager, RetentionPolicy, Session
+
+
+def archive_session(manager: DBManager, tmp_path, session_id: str):
+    session = manager.db.query(Session).filter(Session.session_id == session_id).one()
+    session.is_active = False
+    session.last_interaction = datetime.datetime.utcnow() - datetime.timedelta(days=60)
+    manager.db.commit()
+    maintenance = MaintenanceManager(str(tmp_path), RetentionPolicy(session_archive_after_days=30),
+                                     engine=manager.engine, history_cache=manager.history_cache)
+    maintenance.archive_cold_sessions()
+    assert manager.db.query(ArchivedSession).filter(ArchivedSession.session_id == session_id).count() == 1
+
+
+def test_switching_to_an_archived_session_restores_it(tmp_path):
+    manager = DBManager(audio_dir=str(tmp_path))
+    old_session, _ = manager.create_session("farmer-1")
+    manager.add_user_message(old_session, "I want to sell wheat")
+    manager.create_session("farmer-1")
+    archive_session(manager, tmp_path, old_session)
+    assert manager.db.query(Session).filter(Session.session_id == old_session).one().messages == []
+
+    assert manager.switch_session("farmer-1", old_session)
+    history = manager.get_session_history_for_llm(old_session)
+    assert history[-1] == {"role": "user", "content": "I want to sell wheat"}
+
+
+def test_history_of_an_archived_session_is_restored(tmp_path):
+    manager = DBManager(audio_dir=str(tmp_path))
+    session_id, _ = manager.create_session("farmer-2")
+    manager.add_user_message(session_id, "Price is 20")
+    archive_session(manager, tmp_path, session_id)
+
+    messages = manager.get_session_messages(session_id, limit=10)
+    assert [message["content"] for message in messages][-1] == "Price is 20"
+    assert manager.get_session_messages(session_id, limit=10) == messages
+
+
+def test_restored_messages_point_at_current_recordings(tmp_path):
+    manager = DBManager(audio_dir=str(tmp_path))
+    session_id, _ = manager.create_session("farmer-3")
+    for name in ("kept.wav", "compressed.wav", "deleted.wav"):
+        manager.add_user_message(session_id, name, audio_file=name)
+    archive_session(manager, tmp_path, session_id)
+    # Audio jobs ran while the session was archived
+    (tmp_path / "kept.wav").write_bytes(b"")
+    (tmp_path / "compressed.opus").write_bytes(b"")
+
+    messages = manager.get_session_messages(session_id, fields=["content", "audio_file"])
+    recordings = {message["content"]: message["audio_file"] for message in messages if message["content"].endswith(".wav")}
+    assert recordings == {"kept.wav": "kept.wav", "compressed.wav": "compressed.opus", "deleted.wav": None}
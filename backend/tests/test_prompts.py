@@ -0,0 +1,62 @@
+from app.api.prompts import EntitySchema, extract_json_object, parse_health_assessment
+
+
+def test_reads_object_surrounded_by_text():
+    text = 'Sure, here it is:\n```json\n{"name": "Asha", "age": 34}\n```\nAnything else?'
+    assert extract_json_object(text) == {"name": "Asha", "age": 34}
+
+
+def test_skips_think_blocks():
+    text = '<think>The user said {"name": "wrong"}; check it.</think>{"name": "Asha"}'
+    assert extract_json_object(text) == {"name": "Asha"}
+
+
+def test_unclosed_think_block_is_left_as_text():
+    assert extract_json_object('<think>reasoning cut off {"name": "Asha"}') == {"name": "Asha"}
+
+
+def test_braces_inside_strings():
+    text = 'Result: {"note": "use {curly} and \\"quoted\\" braces }", "crop": "wheat"}'
+    assert extract_json_object(text) == {"note": 'use {curly} and "quoted" braces }', "crop": "wheat"}
+
+
+def test_skips_invalid_leading_candidates():
+    text = "Fields {name: Asha} and {'crop': 'rice'}, then {\"name\": \"Asha\"}"
+    assert extract_json_object(text) == {"name": "Asha"}
+
+
+def test_skips_json_that_is_not_an_object():
+    assert extract_json_object('[1, 2] then {"a": 1}') == {"a": 1}
+
+
+def test_truncated_object():
+    assert extract_json_object('{"name": "Asha", "village": "Ram') is None
+    assert extract_json_object('{"name": "Asha"} and {"village": "Ram') == {"name": "Asha"}
+
+
+def test_no_object():
+    assert extract_json_object(None) is None
+    assert extract_json_object("") is None
+    assert extract_json_object("No JSON here") is None
+
+
+def test_entity_schema_keeps_only_form_scalars():
+    schema = EntitySchema([("name", "Full name"), ("age", "Age"), ("village", "Village"), ("crop", "Crop")])
+    text = ('{"name": " Asha ", "age": 34, "village": "", "crop": {"kind": "wheat"}, '
+            '"phone": "98765", "owner": true}')
+    assert schema.parse(text) == {"name": "Asha", "age": 34}
+
+
+def test_entity_schema_without_object():
+    schema = EntitySchema([("name", "Full name")])
+    assert schema.parse("I could not find any details") is None
+    assert schema.parse("{}") == {}
+
+
+def test_health_assessment():
+    assert parse_health_assessment('{"flag": " FAIL ", "comments": "High sugar"}') == {
+        "flag": "fail", "comments": "High sugar"}
+    assert parse_health_assessment('{"flag": "maybe", "comments": "Unclear"}') == {
+        "flag": "pass", "comments": "Unclear"}
+    assert parse_health_assessment('{"flag": "pass"}') is None
+    assert parse_health_assessment("not json") is None
@@ -0,0 +1,27 @@
+import asyncio
+import threading
+
+import pytest
+
+from app.api.executors import BoundedExecutor, ExecutorSaturated
+from app.api.resilience import ProviderGuard
+
+
+def test_full_executor_is_not_a_provider_failure():
+    executor = BoundedExecutor("test_saturated", 1, 1)
+    release = threading.Event()
+    executor.submit(release.wait)
+    executor.submit(release.wait)  # One running and one queued: the queue is full
+    guard = ProviderGuard("test", "saturated", deadline=2)
+
+    async def scenario():
+        for _ in range(guard.breaker.failure_threshold + 1):
+            with pytest.raises(ExecutorSaturated):
+                await guard.call(lambda: executor.run(lambda: "ok"))
+
+    try:
+        asyncio.run(scenario())
+        assert guard.breaker.state == guard.breaker.CLOSED
+        assert guard.breaker.failures == 0
+    finally:
+        release.set()
@@ -0,0 +1,49 @@
+import asyncio
+import json
+from types import SimpleNamespace
+
+import pytest
+
+for module in ("langchain_groq", "magic", "pydub"):
+    pytest.importorskip(module)
+
+from app.api import websocket  # noqa: E402
+from app.api.speculation import SpeculativeSlots  # noqa: E402
+
+
+def fake_llm(extractions):
+    """Answers intent calls with "product" and extraction calls with the next of `extractions`."""
+    def invoke(messages, operation):
+        if operation == "intent":
+            return SimpleNamespace(content="product")
+        return SimpleNamespace(content=json.dumps(extractions.pop(0)))
+    return invoke
+
+
+def test_speculated_question_is_asked_next_turn(monkeypatch):
+    monkeypatch.setattr(websocket, "invoke_llm", fake_llm([{"name": "wheat", "price": 20}, {"category": "grain"}]))
+    monkeypatch.setattr(websocket, "agent_states", type(websocket.agent_states)())
+    monkeypatch.setattr(websocket, "speculative_slots", SpeculativeSlots())
+    rendered = []
+
+    async def render_question(prompt, detected_language_code, tts_language_code):
+        rendered.append(prompt)
+        return prompt, "audio"
+
+    monkeypatch.setattr(websocket, "render_question", render_question)
+
+    async def scenario():
+        _, _, asked = await websocket.call_english_agent_api("I want to sell wheat at 20", [], session_id="s1")
+        assert asked == ("product", "category")
+        websocket.speculate_next_question("s1", asked, None, "en-IN")
+
+        _, _, asked = await websocket.call_english_agent_api("grain", [], session_id="s1")
+        # Price was given in the first turn, so the form skips it
+        assert asked == ("product", "description")
+        intent, key = asked
+        return await websocket.speculative_slots.take("s1", (intent, key, None, "en-IN"))
+
+    result = asyncio.run(scenario())
+    prompt = websocket.question_prompt(dict(websocket.product_fields)["description"])
+    assert result == (prompt, "audio")
+    assert rendered == [prompt]
@@ -0,0 +1,53 @@
+import asyncio
+import json
+
+from app.api.turns import TurnScheduler
+
+
+class Recorder:
+    def __init__(self):
+        self.messages = []
+
+    async def __call__(self, message, client_id, **kwargs):
+        self.messages.append(json.loads(message))
+
+
+async def wait_forever(turn):
+    await asyncio.Event().wait()
+
+
+def test_superseded_turns_do_not_count_as_in_flight():
+    async def scenario():
+        sent = Recorder()
+        scheduler = TurnScheduler("client", sent, policy="supersede", max_in_flight=2)
+        # Three quick messages: each cancels the previous turn before it has unwound
+        turns = [await scheduler.submit(wait_forever) for _ in range(3)]
+        assert [turn.turn_id if turn else None for turn in turns] == [1, 2, 3]
+        assert scheduler.in_flight == 1
+        assert not any(message["status"] == "busy" for message in sent.messages)
+        await scheduler.close()
+
+    asyncio.run(scenario())
+
+
+def test_queue_policy_still_rejects_beyond_max_in_flight():
+    async def scenario():
+        sent = Recorder()
+        scheduler = TurnScheduler("client", sent, policy="queue", max_in_flight=2)
+        turns = [await scheduler.submit(wait_forever) for _ in range(3)]
+        assert [turn.turn_id if turn else None for turn in turns] == [1, 2, None]
+        assert sent.messages[-1]["status"] == "busy"
+        await scheduler.close()
+
+    asyncio.run(scenario())
+
+
+def test_cancel_reports_each_turn_once():
+    async def scenario():
+        scheduler = TurnScheduler("client", Recorder(), policy="queue", max_in_flight=2)
+        await scheduler.submit(wait_forever)
+        assert scheduler.cancel_current() == 1
+        assert scheduler.cancel_current() is None
+        await scheduler.close()
+
+    asyncio.run(scenario())
@@ -30,6 +30,9 @@ export const ChatInterface: React.FC<ChatInterfaceProps> = ({ onClose }) => {
     isLoadingSessions,
     createNewSession,
     switchSession,
+    hasMoreHistory,
+    isLoadingHistory,
+    loadOlderMessages,
   } = useAiChat();
 
   const messagesEndRef = useRef<HTMLDivElement>(null);
@@ -98,6 +101,17 @@ export const ChatInterface: React.FC<ChatInterfaceProps> = ({ onClose }) => {
 
       {/* Chat messages */}
       <div className="flex-1 overflow-y-auto p-4 space-y-4 bg-slate-950">
+        {hasMoreHistory && (
+          <div className="flex justify-center">
+            <button
+              onClick={loadOlderMessages}
+              disabled={isLoadingHistory}
+              className="px-3 py-1 text-sm text-slate-300 hover:text-white disabled:opacity-50 focus:outline-none"
+            >
+              {isLoadingHistory ? 'Loading...' : 'Load earlier messages'}
+            </button>
+          </div>
+        )}
         {messages.map((message) => (
           <ChatMessageComponent 
             key={message.id} 
@@ -158,7 +172,7 @@ export const ChatInterface: React.FC<ChatInterfaceProps> = ({ onClose }) => {
 // Chat message component with audio replay capability
 interface ChatMessageProps {
   message: ChatMessage;
-  onReplayAudio?: (audioBase64: string) => void;
+  onReplayAudio?: (audio: string | string[]) => void;
 }
 
 const ChatMessageComponent: React.FC<ChatMessageProps> = ({ message, onReplayAudio }) => {
@@ -185,9 +199,9 @@ const ChatMessageComponent: React.FC<ChatMessageProps> = ({ message, onReplayAud
           </div>
           
           {/* Replay button for AI messages with audio */}
-          {message.sender === 'ai' && message.audioBase64 && onReplayAudio && (
+          {message.sender === 'ai' && !!(message.audioClips?.length || message.audioBase64) && onReplayAudio && (
             <button
-              onClick={() => onReplayAudio(message.audioBase64!)}
+              onClick={() => onReplayAudio(message.audioClips?.length ? message.audioClips : message.audioBase64!)}
               className="p-1 ml-2 text-blue-300 hover:text-blue-100 focus:outline-none"
               title="Replay audio"
             >
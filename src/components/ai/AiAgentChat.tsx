@@ -11,7 +11,7 @@ interface AiAgentChatProps {
   isConnected: boolean;
   onRecordStart: () => Promise<void>; // Can potentially throw errors
   onRecordStop: () => void;
-  onPlayAudio: (audioBase64: string) => Promise<void>; // Add prop for playing audio
+  onPlayAudio: (audio: string | string[]) => Promise<void>; // Add prop for playing audio
 }
 
 const AiAgentChat: React.FC<AiAgentChatProps> = ({
@@ -46,14 +46,14 @@ const AiAgentChat: React.FC<AiAgentChatProps> = ({
   };
 
   const renderMessageContent = (msg: ChatMessage) => {
-    const isAiResponseWithAudio = msg.sender === 'ai' && msg.type === 'text' && !!msg.audioBase64;
+    const isAiResponseWithAudio = msg.sender === 'ai' && msg.type === 'text' && !!(msg.audioClips?.length || msg.audioBase64);
 
     return (
       <div className="flex flex-col">
         <p className={isAiResponseWithAudio ? "mr-10" : ""}>{msg.content}</p> {/* Add margin if play button is present */}
         {isAiResponseWithAudio && (
           <button
-            onClick={() => msg.audioBase64 && onPlayAudio(msg.audioBase64)}
+            onClick={() => onPlayAudio(msg.audioClips?.length ? msg.audioClips : msg.audioBase64!)}
             className="absolute bottom-1 right-1 p-1 text-purple-600 hover:text-purple-800 focus:outline-none focus:ring-1 focus:ring-purple-500 rounded-full"
             aria-label="Play AI response"
           >
@@ -26,6 +26,7 @@ export interface ChatMessage {
   type: 'text' | 'audio' | 'error' | 'status' | 'processing'; // Added 'processing' type
   content: string; // For text/status/error/processing message
   audioBase64?: string; // Renamed from audioUrl and changed type
+  audioClips?: string[]; // Sentence clips of a streamed reply, in playback order
   timestamp: number;
   text?: string; // Optional text content (e.g., for transcribed or error with text)
   navigationUrl?: string; // Added for messages that contain a navigation request
@@ -33,22 +34,35 @@ export interface ChatMessage {
 
 export interface BackendStatus {
   // Updated status values
-  status: 'idle' | 'connecting' | 'connected' | 'processing_audio' | 'transcribed' | 'processing_llm' | 'processing_tts' | 'response_ready' | 'error';
+  status: 'idle' | 'connecting' | 'connected' | 'processing_audio' | 'transcribed' | 'processing_llm' | 'partial_text' | 'processing_tts' | 'response_ready' | 'error';
   message?: string; // Optional message (e.g., for errors or status updates)
   text?: string; // Optional text content (e.g., for transcribed or error with text)
 }
 
+// One translated and synthesized sentence of a streamed reply
+interface PartialAudioMessage {
+    status: 'partial_audio';
+    index: number;
+    text: string;
+    audio_base64: string | null; // null when the sentence could not be synthesized
+    turn_id?: number;
+}
+
 // Specific type for the final successful response
 interface ReadyResponseMessage {
     status: 'response_ready';
     text: string;
-    audio_base64: string;
+    audio_base64?: string; // Omitted for streamed replies, whose audio came as partial_audio
+    streamed?: boolean;
     navigation_url?: string; // Added navigation URL field
     performance?: {
       stt_duration: number;
       llm_duration: number;
+      translation_duration?: number;
       tts_duration: number;
       total_duration: number;
+      trace_id?: string;
+      spans?: { name: string; start_ms: number; duration_ms: number; error: boolean }[];
     };
 }
 
@@ -83,13 +97,19 @@ export const SUPPORTED_LANGUAGES: LanguageOption[] = [
 
 // Type guard to check if a message is ReadyResponseMessage
 function isReadyResponseMessage(msg: any): msg is ReadyResponseMessage {
-    return msg && msg.status === 'response_ready' && typeof msg.text === 'string' && typeof msg.audio_base64 === 'string';
+    return msg && msg.status === 'response_ready' && typeof msg.text === 'string'
+        && (typeof msg.audio_base64 === 'string' || msg.streamed === true);
+}
+
+function isPartialAudioMessage(msg: any): msg is PartialAudioMessage {
+    return msg && msg.status === 'partial_audio' && typeof msg.index === 'number';
 }
 
 // Use import.meta.env for Vite environment variables
 // Ensure VITE_WEBSOCKET_URL is defined in your .env file
 const WEBSOCKET_URL = import.meta.env.VITE_WEBSOCKET_URL;
 const API_BASE_URL = import.meta.env.VITE_API_BASE_URL;
+const HISTORY_PAGE_SIZE = 50;
 const CLIENT_ID = `web-${Date.now()}-${Math.random().toString(16).substring(2, 8)}`;
 
 export function useAiChat() {
@@ -128,10 +148,23 @@ export function useAiChat() {
   const [currentSession, setCurrentSession] = useState<ChatSession | null>(null);
   const [isLoadingSessions, setIsLoadingSessions] = useState(false);
   
+  // Session history paging - id of the oldest loaded message, used as the next `before` cursor
+  const historyCursor = useRef<number | null>(null);
+  // Session the loaded history belongs to; pages that arrive after a switch are dropped
+  const historySessionId = useRef<string | null>(null);
+  const [hasMoreHistory, setHasMoreHistory] = useState(false);
+  const [isLoadingHistory, setIsLoadingHistory] = useState(false);
+  
   const ws = useRef<WebSocket | null>(null);
   const mediaRecorder = useRef<MediaRecorder | null>(null);
   const audioChunks = useRef<Blob[]>([]);
   const audioContext = useRef<AudioContext | null>(null);
+  // Clips are decoded in arrival order and scheduled back to back, so streamed sentences play without gaps
+  const playbackChain = useRef<Promise<void>>(Promise.resolve());
+  const nextPlaybackTime = useRef(0);
+  // partial_audio clips of the reply being streamed, kept for replaying it
+  const streamedClips = useRef<string[]>([]);
+  const streamedTurnId = useRef<number | null>(null);
   // Ref to keep track of the last message ID for potential status updates
   const lastStatusMessageId = useRef<string | null>(null);
 
@@ -171,6 +204,13 @@ export function useAiChat() {
     }
   }, [CLIENT_ID]);
 
+  // Forget the paging state of the previous session's history
+  const resetHistory = (sessionId: string) => {
+    historySessionId.current = sessionId;
+    historyCursor.current = null;
+    setHasMoreHistory(false);
+  };
+
   const createNewSession = useCallback(async () => {
     try {
       const response = await fetch(`${API_BASE_URL}/sessions/new?user_id=${CLIENT_ID}`, {
@@ -181,6 +221,7 @@ export function useAiChat() {
       }
       const data = await response.json();
       if (data.status === 'success' && data.session_id) {
+        resetHistory(data.session_id);
         // Refresh sessions list to include new session
         await fetchSessions();
         return data.session_id;
@@ -195,6 +236,7 @@ export function useAiChat() {
   }, [CLIENT_ID, fetchSessions]);
 
   const switchSession = useCallback(async (sessionId: string) => {
+    resetHistory(sessionId);
     try {
       const response = await fetch(`${API_BASE_URL}/sessions/switch?user_id=${CLIENT_ID}&session_id=${sessionId}`, {
         method: 'POST',
@@ -219,25 +261,42 @@ export function useAiChat() {
     }
   }, [CLIENT_ID, fetchSessions]);
 
+  // Convert backend history messages to ChatMessage format
+  const toChatMessages = (backendMessages: any[]): ChatMessage[] =>
+    backendMessages.map((msg: any) => ({
+      id: `history-${msg.id}`,
+      sender: msg.role === 'user' ? 'user' : msg.role === 'assistant' ? 'ai' : 'status',
+      type: 'text',
+      content: msg.content,
+      timestamp: new Date(msg.timestamp).getTime(),
+      // Add audio if available for assistant messages
+      ...(msg.role === 'assistant' && msg.audio_file ? { audioBase64: msg.audio_file } : {}),
+    }));
+
+  const fetchHistoryPage = async (sessionId: string, before?: number) => {
+    const params = new URLSearchParams({ limit: String(HISTORY_PAGE_SIZE) });
+    if (before !== undefined) {
+      params.set('before', String(before));
+    }
+    const response = await fetch(`${API_BASE_URL}/sessions/${sessionId}/history?${params.toString()}`);
+    if (!response.ok) {
+      throw new Error(`HTTP error! status: ${response.status}`);
+    }
+    return response.json();
+  };
+
   const fetchSessionMessages = useCallback(async (sessionId: string) => {
     try {
-      const response = await fetch(`${API_BASE_URL}/sessions/${sessionId}/history`);
-      if (!response.ok) {
-        throw new Error(`HTTP error! status: ${response.status}`);
+      // Only the most recent page is loaded; older pages are fetched on demand
+      historySessionId.current = sessionId;
+      const data = await fetchHistoryPage(sessionId);
+      if (historySessionId.current !== sessionId) {
+        return false; // Another session was opened meanwhile
       }
-      const data = await response.json();
       if (data.status === 'success' && Array.isArray(data.messages)) {
-        // Convert backend messages to ChatMessage format
-        const chatMessages: ChatMessage[] = data.messages.map((msg: any) => ({
-          id: `${msg.timestamp}-${msg.role}`,
-          sender: msg.role === 'user' ? 'user' : msg.role === 'assistant' ? 'ai' : 'status',
-          type: 'text',
-          content: msg.content,
-          timestamp: new Date(msg.timestamp).getTime(),
-          // Add audio if available for assistant messages
-          ...(msg.role === 'assistant' && msg.audio_file ? { audioBase64: msg.audio_file } : {}),
-        }));
-        setMessages(chatMessages);
+        setMessages(toChatMessages(data.messages));
+        historyCursor.current = data.next_before;
+        setHasMoreHistory(Boolean(data.has_more));
         return true;
       } else {
         console.error('Invalid session messages data:', data);
@@ -249,6 +308,34 @@ export function useAiChat() {
     }
   }, []);
 
+  const loadOlderMessages = useCallback(async () => {
+    const sessionId = historySessionId.current;
+    if (!sessionId || historyCursor.current === null || isLoadingHistory) {
+      return false;
+    }
+    setIsLoadingHistory(true);
+    try {
+      const data = await fetchHistoryPage(sessionId, historyCursor.current);
+      if (historySessionId.current !== sessionId) {
+        return false; // The user switched sessions while the page was loading
+      }
+      if (data.status === 'success' && Array.isArray(data.messages)) {
+        setMessages(prev => [...toChatMessages(data.messages), ...prev]);
+        historyCursor.current = data.next_before;
+        setHasMoreHistory(Boolean(data.has_more));
+        return true;
+      } else {
+        console.error('Invalid session messages data:', data);
+        return false;
+      }
+    } catch (error) {
+      console.error('Error fetching older session messages:', error);
+      return false;
+    } finally {
+      setIsLoadingHistory(false);
+    }
+  }, [isLoadingHistory]);
+
   // --- WebSocket Management ---
   const connectWebSocket = useCallback(() => {
     if (ws.current && ws.current.readyState === WebSocket.OPEN) {
@@ -319,7 +406,18 @@ export function useAiChat() {
                     const isReady = isReadyResponseMessage(parsedData);
                     console.log("[WebSocket] isReadyResponseMessage check:", isReady);
 
-                    if (isReady) {
+                    if (isPartialAudioMessage(parsedData)) {
+                        // Sentences arrive in order; each one plays as soon as it arrives
+                        const turnId = parsedData.turn_id ?? null;
+                        if (turnId !== streamedTurnId.current) {
+                            streamedTurnId.current = turnId;
+                            streamedClips.current = [];
+                        }
+                        if (parsedData.audio_base64) {
+                            streamedClips.current.push(parsedData.audio_base64);
+                            enqueueAudio(parsedData.audio_base64);
+                        }
+                    } else if (isReady) {
                         console.log("[WebSocket] Handling response_ready message...");
                         const backendMsg = parsedData;
                         setBackendStatus({ status: 'connected', message: 'Ready.' });
@@ -335,12 +433,20 @@ export function useAiChat() {
                             type: 'text',
                             content: backendMsg.text, 
                             audioBase64: backendMsg.audio_base64, 
+                            audioClips: backendMsg.streamed ? streamedClips.current : undefined,
                             timestamp,
                             navigationUrl: navigationUrl || undefined,
                         };
                         
-                        setMessages(prev => [...prev, newMessage]);
-                        playAudio(backendMsg.audio_base64);
+                        // The final message replaces the status bubble, which may hold the streamed text
+                        const statusMessageId = lastStatusMessageId.current;
+                        setMessages(prev => [...prev.filter(msg => msg.id !== statusMessageId), newMessage]);
+                        // A streamed reply was already played sentence by sentence
+                        if (!backendMsg.streamed && backendMsg.audio_base64) {
+                            playAudio(backendMsg.audio_base64);
+                        }
+                        streamedClips.current = [];
+                        streamedTurnId.current = null;
                         lastStatusMessageId.current = null;
                         
                         // Handle navigation if URL was found
@@ -380,6 +486,21 @@ export function useAiChat() {
                              }
                              break;
 
+                           case 'partial_text':
+                             // Show the reply as it is being written, in place of the status bubble
+                             if (backendMsg.text) {
+                               if (lastStatusMessageId.current) {
+                                   setMessages(prev => prev.map(msg =>
+                                       msg.id === lastStatusMessageId.current ? { ...msg, content: backendMsg.text!, type: 'processing' } : msg
+                                   ));
+                               } else {
+                                   const newId = timestamp.toString();
+                                   newMessage = { id: newId, sender: 'status', type: 'processing', content: backendMsg.text, timestamp };
+                                   lastStatusMessageId.current = newId;
+                               }
+                             }
+                             break;
+
                            case 'transcribed':
                              // Always add the transcribed text as a new user message
                              if (backendMsg.text) {
@@ -629,13 +750,14 @@ export function useAiChat() {
   }, [isConnected, selectedLanguage.code]);
 
   // --- Audio Playback (Now expects Base64) ---
-  const playAudio = useCallback(async (audioBase64: string) => {
-    try {
-      console.log("Attempting to play audio from base64...");
+  // Queues a clip to start when the previously queued one ends
+  const enqueueAudio = useCallback((audioBase64: string): Promise<void> => {
+    playbackChain.current = playbackChain.current.then(async () => {
       const audioBytes = _base64ToArrayBuffer(audioBase64);
 
       if (!audioContext.current) {
         audioContext.current = new (window.AudioContext || (window as any).webkitAudioContext)();
+        nextPlaybackTime.current = 0; // A new context's clock starts at zero
       }
       // Ensure context is running (required after user interaction)
       if (audioContext.current.state === 'suspended') {
@@ -646,17 +768,27 @@ export function useAiChat() {
       const source = audioContext.current.createBufferSource();
       source.buffer = audioBuffer;
       source.connect(audioContext.current.destination);
-      source.start();
-      console.log("Audio playback started.");
-    } catch (error) {
+      const startAt = Math.max(audioContext.current.currentTime, nextPlaybackTime.current);
+      source.start(startAt);
+      nextPlaybackTime.current = startAt + audioBuffer.duration;
+      console.log("Audio playback scheduled.");
+    }).catch(error => {
       console.error('Error playing audio:', error);
       // Add specific error message to chat
       setMessages(prev => [...prev, { id: Date.now().toString(), sender: 'status', type: 'error', content: 'Failed to play audio response.', timestamp: Date.now() }]);
       // Update backend status to reflect playback error?
       setBackendStatus(prev => ({ ...prev, message: 'Failed to play audio.' }));
-    }
+    });
+    return playbackChain.current;
   }, []); // Add dependencies if audioContext could change, but useRef should be stable
 
+  // Plays one clip, or the sentence clips of a streamed reply in order
+  const playAudio = useCallback(async (audio: string | string[]) => {
+    console.log("Attempting to play audio from base64...");
+    const clips = Array.isArray(audio) ? audio : [audio];
+    await Promise.all(clips.map(clip => enqueueAudio(clip)));
+  }, [enqueueAudio]);
+
   // --- Effects ---
   // Connect WebSocket when chat becomes visible
   useEffect(() => {
@@ -723,6 +855,9 @@ export function useAiChat() {
     createNewSession,
     switchSession,
     fetchSessionMessages,
+    hasMoreHistory,
+    isLoadingHistory,
+    loadOlderMessages,
     
     // Navigation
     navigationUrl,